@@ -73,6 +73,7 @@ try:  # pragma: no cover - simple import guard
         transform,
         suffix,
         regex,
+        merge,
         mkdir,
     )
 except ModuleNotFoundError:  # pragma: no cover - executed only if Ruffus absent
@@ -84,19 +85,22 @@ except ModuleNotFoundError:  # pragma: no cover - executed only if Ruffus absent
         return wrapper
 
     def follows(*args, **kwargs):  # noqa: D401 - mimic Ruffus decorator
-        return _stub_decorator
+        return _stub_decorator()
 
     def originate(*args, **kwargs):  # noqa: D401 - mimic Ruffus decorator
-        return _stub_decorator
+        return _stub_decorator()
 
     def transform(*args, **kwargs):  # noqa: D401 - mimic Ruffus decorator
-        return _stub_decorator
+        return _stub_decorator()
 
     def suffix(*args, **kwargs):  # noqa: D401 - mimic Ruffus decorator
-        return _stub_decorator
+        return _stub_decorator()
 
     def regex(*args, **kwargs):  # noqa: D401 - mimic Ruffus decorator
-        return _stub_decorator
+        return _stub_decorator()
+
+    def merge(*args, **kwargs):  # noqa: D401 - mimic Ruffus decorator
+        return _stub_decorator()
 
     def mkdir(directory):  # noqa: D401 - mimic Ruffus mkdir helper
         os.makedirs(directory, exist_ok=True)
@@ -139,6 +143,14 @@ except ModuleNotFoundError:  # pragma: no cover
 # Import additional packages:
 # Set path if necessary:
 # os.system('''export PATH="~/xxxx/xxxx:$PATH"''')
+
+# Python helpers shipped in ./scripts:
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), "scripts"))
+import build_cache  # noqa: E402
+import coverage_engine  # noqa: E402
+import flow_matrix  # noqa: E402
+import shm_snapshot  # noqa: E402
+import snapshot_cdc  # noqa: E402
 ################
 
 
@@ -326,8 +338,16 @@ def get_initial_files():
     Use this function to get names from .accdb files and store it
     in a python list. The list is used as a ruffus input for the
     convert_to_csv method of the pipeline.
+
+    If the ``OFERTA_ACCDB_FILES`` environment variable is set (e.g. by the
+    ``ingest_watch.py`` daemon) only the files it lists, separated by
+    ``os.pathsep``, are used so that only their tasks are run.
     """
-    initial_files = glob.glob("../../data/*.accdb")
+    selected = os.environ.get("OFERTA_ACCDB_FILES")
+    if selected:
+        initial_files = [f for f in selected.split(os.pathsep) if os.path.exists(f)]
+    else:
+        initial_files = glob.glob("../../data/*.accdb")
     #TODO: handle unsupported file names, eg: names with spaces
     if not initial_files:
         raise FileNotFoundError("No .accdb files are in the data directory!")
@@ -341,60 +361,960 @@ def get_initial_files():
 
 # Tools called need the full path or be directly callable
 
-
-# TO DO: continue here
-
 # ----------------------------------------------------------------------
-# Example tasks for converting Access databases and running R scripts.
-# These are minimal placeholders so the pipeline can be imported and its
-# task graph examined during testing.
+# Conversion of the Access databases and checks.
 
 results_dir = PARAMS.get("paths", {}).get("results_dir", "results")
+project_root = os.environ.get("PROJECT_ROOT", "../..")
+# CSV tables exported by convert_to_csv, one per quincena table:
+csv_dir = os.path.join(project_root, "results")
+# 2_clean_dups_col_types.R saves the cleaned snapshots in the data directory:
+rdata_dir = os.path.join(project_root, "data")
+r_scripts_dir = get_dir("../scripts")
+# Other files the R scripts read, hashed into the cache keys of their tasks:
+col_types_file = os.path.join(results_dir, "manual_col_types", "df_col_types2_utf8.csv")
+r_helpers = [os.path.join(r_scripts_dir, "funcs_epi_source.R")]
+dir_locations = os.path.join(
+    rdata_dir, "data_UP", "processed", "dir_locations.rdata.gzip"
+)
+
+
+def pop_option(argv: List[str], name: str) -> str | None:
+    """Remove ``name VALUE`` or ``name=VALUE`` from ``argv`` and return VALUE.
+
+    Used for the pipeline's own options, which cgatcore's parser does not
+    know about. Returns ``None`` if the option is absent.
+    """
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            value = argv[i + 1]
+            del argv[i : i + 2]
+            return value
+        if arg.startswith(f"{name}="):
+            del argv[i]
+            return arg.split("=", 1)[1]
+    return None
+
+
+def get_quincenas(argv: List[str] | None = None) -> List[str]:
+    """Return the quincenas (snapshot names, e.g. ``Qna_07_Plantilla_2025``)
+    to process in batch mode.
+
+    ``--quincenas=Qna_07_Plantilla_2025,Qna_15_Plantilla_2025`` on the command
+    line takes precedence and is removed from ``argv`` so that cgatcore does
+    not see it. Otherwise ``batch:quincenas`` from pipeline.yml is used. An
+    empty list means every snapshot found in the CSV directory.
+    """
+    if argv is None:
+        argv = sys.argv
+    value = pop_option(argv, "--quincenas")
+    if value is None:
+        value = PARAMS.get("batch", {}).get("quincenas") or []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [q.strip().rsplit(".csv", 1)[0] for q in value if q.strip()]
+
+
+quincenas = get_quincenas()
+
+
+def get_sample_fraction(argv: List[str] | None = None) -> float | None:
+    """Return the fraction for the stratified sample dev mode, or ``None``.
+
+    Set with ``--sample=0.02`` on the command line (removed from ``argv``) or
+    ``sample:fraction`` in pipeline.yml.
+    """
+    if argv is None:
+        argv = sys.argv
+    value = pop_option(argv, "--sample")
+    if value is None:
+        value = PARAMS.get("sample", {}).get("fraction")
+    if value in (None, ""):
+        return None
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        raise ValueError(f"--sample must be a fraction in (0, 1], got {value}")
+    return fraction
+
+
+sample_fraction = get_sample_fraction()
+
+
+def snapshot_csvs(pattern: str = "Qna_*_Plantilla_*.csv") -> List[str] | str:
+    """Input snapshot CSVs: the batch mode quincenas if given, else a glob
+    pattern that Ruffus expands once the CSVs have been exported."""
+    if quincenas:
+        return [os.path.join(csv_dir, f"{q}.csv") for q in quincenas]
+    return os.path.join(csv_dir, pattern)
+
+
+# Content-addressed build cache, see scripts/build_cache.py. Tasks are keyed
+# by the contents of their inputs, their pipeline.yml parameters and the
+# source of the scripts they run, not by timestamps, so copied or restored
+# data is not recomputed. Leave cache:dir empty to disable.
+cache_dir = PARAMS.get("cache", {}).get("dir")
+
+
+def cached_run(
+    statement: str,
+    infiles: List[str],
+    scripts: List[str],
+    outroot: str,
+    params: dict | None = None,
+    outputs: List[str] | None = None,
+) -> str:
+    """Run ``statement`` unless its outputs can be restored from the cache.
+
+    Outputs are the files in ``outputs`` (those the statement did not write
+    are skipped) or, if ``None``, every file below ``outroot`` other than
+    ``.done`` markers. In that case ``outroot`` must be private to the task:
+    files left there by an earlier run are removed before the statement
+    runs, so no file timestamps are needed to tell its outputs apart. They
+    are stored relative to ``outroot``. Returns the task key.
+    """
+    key = build_cache.task_key(infiles, params, scripts)
+    cache = build_cache.BuildCache(cache_dir) if cache_dir else None
+    if cache is not None and cache.restore(key, outroot):
+        E.info(f"Restored outputs for {key[:12]} from {cache_dir}")
+        return key
+    if outputs is None:
+        for path in build_cache.list_files(outroot):
+            if not path.endswith(".done"):
+                os.remove(path)
+    P.run(statement)
+    if cache is not None:
+        if outputs is None:
+            outputs = [
+                f for f in build_cache.list_files(outroot) if not f.endswith(".done")
+            ]
+        cache.store(key, [f for f in outputs if os.path.exists(f)], outroot)
+    return key
+
+
+accdb_files = get_initial_files()
+# Databases by the name of their convert_to_csv marker:
+accdb_by_name = {os.path.basename(f).rsplit(".", 1)[0]: f for f in accdb_files}
+
+
+def accdb_csvs(infile: str) -> List[str]:
+    """CSV files exported from the tables of ``infile`` by
+    accdb_to_csv_encodings_copy.sh (spaces and slashes become ``_``)."""
+    tables = subprocess.run(
+        ["mdb-tables", "-1", infile], capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    return [
+        os.path.join(csv_dir, f"{re.sub(r'[ /]', '_', t)}.csv")
+        for t in tables
+        if t.strip()
+    ]
 
 
 @follows(mkdir(results_dir))
-@transform(get_initial_files(), regex(".*/([^/]+)\.accdb$"), r"../../results/\1.done")
+@transform(accdb_files, regex(".*/([^/]+)\.accdb$"), r"../../results/\1.done")
 def convert_to_csv(infile, outfile):
-    """Dummy step that would convert .accdb tables to CSV files."""
-    project_root = os.environ.get('PROJECT_ROOT', '../..')
+    """Convert each table of an .accdb database to a UTF-8 CSV file."""
+    script = get_dir("scripts/accdb_to_csv_encodings_copy.sh")
     statement1 = (
-    f"bash scripts/accdb_to_csv_encodings_copy.sh {infile} "
-    f"{project_root}/results"
+    f"bash {script} {infile} "
+    f"{csv_dir}"
     )
-    P.run(statement1)
-    statement2 = "touch %(outfile)s"
-    P.run(statement2)
+    # csv_dir is shared by all databases, so list this one's tables:
+    outputs = accdb_csvs(infile)
+    key = cached_run(statement1, [infile], [script], csv_dir, outputs=outputs)
+    build_cache.write_marker(outfile, key)
+
 
+tables_check_dir = os.path.join(results_dir, "tables_check")
 
-@transform(convert_to_csv, suffix(".csv"), "_tables_check.rdata.gzip")
+
+@follows(mkdir(tables_check_dir))
+@transform(
+    convert_to_csv,
+    regex(r".*/([^/]+)\.done$"),
+    os.path.join(tables_check_dir, r"\1.done"),
+)
 def run_tables_check(infile, outfile):
-    """Dummy step that would run the 1b_accdb_tables_check.R script."""
-    statement = "touch %(outfile)s"
-    P.run(statement)
+    """Compare the Bienestar and Plantilla tables of each quincena in the
+    database (1b_accdb_tables_check.R) before any snapshot is cleaned."""
+    script = os.path.join(r_scripts_dir, "descriptive", "1b_accdb_tables_check.R")
+    accdb = accdb_by_name[os.path.basename(infile)[: -len(".done")]]
+    csvs = accdb_csvs(accdb)
+    keys = []
+    for plantilla in (c for c in csvs if "_Plantilla_" in os.path.basename(c)):
+        bienestar = plantilla.replace("_Plantilla_", "_Bienestar_")
+        if bienestar not in csvs:
+            continue
+        outdir = os.path.join(
+            tables_check_dir, os.path.basename(plantilla)[: -len(".csv")]
+        )
+        statement = (
+            f"Rscript {script} {os.path.abspath(bienestar)}"
+            f" {os.path.abspath(plantilla)} {os.path.abspath(outdir)}"
+        )
+        keys.append(cached_run(statement, [bienestar, plantilla], [script], outdir))
+    build_cache.write_marker(outfile, "\n".join(keys))
 
 
 # Backwards compatibility for older tests
 run_1b_accdb_tables_check = run_tables_check
 
 
-@transform(run_tables_check, suffix(".rdata.gzip"), "_summary.rdata.gzip")
-def countWords(infile, outfile):
-    """Dummy processing of the checked tables output."""
-    statement = "touch %(outfile)s"
+# Stratified sample dev mode (--sample), see scripts/stratified_sample.py.
+# Each snapshot is replaced by a reproducible stratified sample carrying a
+# PESO_MUESTRA weight column before cleaning, so the whole DAG runs on it.
+sample_dir = os.path.join(results_dir, "sample")
+
+
+@follows(run_tables_check, mkdir(sample_dir))
+@transform(
+    snapshot_csvs(),
+    regex(r".*/(Qna_[^/]+)\.csv$"),
+    os.path.join(sample_dir, r"\1_muestra.csv"),
+)
+def sample_snapshot(infile, outfile):
+    """Write a stratified sample of the snapshot (cached by content)."""
+    params = dict(PARAMS.get("sample", {}), fraction=sample_fraction)
+    script = get_dir("scripts/stratified_sample.py")
+    statement = (
+        f"python {script} --in {infile} --out {outfile}"
+        f" --fraction {sample_fraction}"
+        f" --strata {params.get('strata', 'DELEGACION,DESCRIP_CLASCATEG,PLZOCU')}"
+        f" --seed {params.get('seed', 42)}"
+    )
+    cached_run(statement, [infile], [script], sample_dir, params, [outfile])
+
+
+# Change-data-capture between consecutive quincenas:
+cdc_dir = os.path.join(results_dir, "cdc")
+
+
+@follows(mkdir(cdc_dir))
+@merge(
+    sample_snapshot if sample_fraction else convert_to_csv,
+    os.path.join(cdc_dir, "cdc_complete.done"),
+)
+def diff_consecutive_snapshots(infiles, outfile):
+    """Write a change log (altas, bajas, moves, PLZOCU/PLZSOB flips) for
+    each pair of consecutive quincena snapshots.
+
+    Logs are named ``cdc_<old>__<new>.tsv.gz`` and are cached by content,
+    so adding a quincena only diffs it against the previous one.
+    """
+    cdc_params = PARAMS.get("cdc", {})
+    pattern = cdc_params.get("snapshot_glob", "Qna_*_Plantilla_*.csv")
+    key = cdc_params.get("key", "CURP")
+    snapshots = infiles if sample_fraction else snapshot_csvs(pattern)
+    if isinstance(snapshots, str):
+        snapshots = glob.glob(snapshots)
+    keys = []
+    for old, new in snapshot_cdc.consecutive_pairs(snapshots):
+        old_prefix = os.path.basename(old).split(".")[0]
+        new_prefix = os.path.basename(new).split(".")[0]
+        log = os.path.join(cdc_dir, f"cdc_{old_prefix}__{new_prefix}.tsv.gz")
+        script = get_dir("scripts/snapshot_cdc.py")
+        statement = (
+            f"python {script}"
+            f" --old {old} --new {new} --key {key} --out {log}"
+        )
+        keys.append(
+            cached_run(statement, [old, new], [script], cdc_dir, cdc_params, [log])
+        )
+    build_cache.write_marker(outfile, "\n".join(keys))
+
+
+# Origin -> destination flow matrices between consecutive quincenas:
+flows_dir = os.path.join(results_dir, "flows")
+trayectoria_params = PARAMS.get("trayectoria", {})
+
+
+@follows(mkdir(flows_dir))
+@merge(
+    sample_snapshot if sample_fraction else convert_to_csv,
+    os.path.join(flows_dir, "flows_complete.done"),
+)
+def flow_matrices(infiles, outfile):
+    """Write sparse flow counts (unit, OOAD, state, specialty, and their
+    rollups) for each pair of consecutive quincena snapshots.
+
+    The sankey/alluvial scripts in specific_Qs/trayectoria read these small
+    tables instead of joining the person level snapshots.
+    """
+    flows_params = PARAMS.get("flows", {})
+    pattern = PARAMS.get("cdc", {}).get("snapshot_glob", "Qna_*_Plantilla_*.csv")
+    snapshots = infiles if sample_fraction else snapshot_csvs(pattern)
+    if isinstance(snapshots, str):
+        snapshots = glob.glob(snapshots)
+    script = get_dir("scripts/flow_matrix.py")
+    options = f" --key {flows_params.get('key', 'CURP')}"
+    if flows_params.get("levels"):
+        options += f" --levels {flows_params['levels']}"
+    for option in ("filter_ant", "filter_act"):
+        for spec in flows_params.get(option) or []:
+            options += f" --{option.replace('_', '-')} '{spec}'"
+    cohort = [flows_params["cohort"]] if flows_params.get("cohort") else []
+    if cohort:
+        options += f" --cohort {cohort[0]}"
+    pairs = snapshot_cdc.consecutive_pairs(snapshots)
+    # Also the pair plotted by trayectoria_sankey, if not consecutive:
+    by_name = {os.path.basename(f).split(".")[0]: f for f in snapshots}
+    plotted = tuple(by_name.get(trayectoria_params.get(k)) for k in ("old", "new"))
+    if all(plotted) and plotted not in pairs:
+        pairs.append(plotted)
+    levels = (flows_params.get("levels") or ",".join(flow_matrix.LEVELS)).split(",")
+    keys = []
+    for old, new in pairs:
+        statement = (
+            f"python {script} --old {old} --new {new} --outdir {flows_dir}{options}"
+        )
+        # flows_dir is shared by all pairs, so list this pair's tables:
+        pair = "__".join(os.path.basename(p).split(".")[0] for p in (old, new))
+        outputs = flow_matrix.output_paths(flows_dir, pair, levels, bool(cohort))
+        keys.append(
+            cached_run(
+                statement,
+                [old, new, *cohort],
+                [script],
+                flows_dir,
+                flows_params,
+                outputs,
+            )
+        )
+    build_cache.write_marker(outfile, "\n".join(keys))
+
+
+# CES cohort trajectories, run as one R session (each script uses the
+# objects of the previous one):
+trayectoria_scripts = [
+    "CES_UP_trayectoria.R",
+    "CES_UP_trayectoria_assoc_nac_sede_laboral.R",
+    "3_CES_UP_trayectoria_sankey_html.R",
+    "4_CES_UP_trayectoria_sankey_tables_alluvial.R",
+]
+
+
+@merge(flow_matrices, os.path.join(flows_dir, "trayectoria_sankey.done"))
+def trayectoria_sankey(infiles, outfile):
+    """Sankey/alluvial plots of the CES cohort (specific_Qs/trayectoria),
+    with the Residencia -> Trabajo links read from the OOAD flows of the
+    trayectoria:old -> new pair, passed as FLOWS_OOAD with their cohort
+    manifest as FLOWS_COHORT.
+
+    Skipped with a warning without flows: cohort or the CES data.
+    """
+    pair = f"{trayectoria_params.get('old')}__{trayectoria_params.get('new')}"
+    flows = os.path.abspath(os.path.join(flows_dir, f"flows_ooad_{pair}.tsv"))
+    manifest = os.path.abspath(os.path.join(flows_dir, f"flows_cohort_{pair}.json"))
+    ces_dir = os.path.join(project_root, "data", "data_CES", "datos")
+    missing = [p for p in (flows, manifest, ces_dir) if not os.path.exists(p)]
+    if missing:
+        E.warn(f"trayectoria_sankey: {', '.join(missing)} not found, skipped")
+        build_cache.write_marker(outfile, "skipped: missing inputs")
+        return
+    scripts = ", ".join(
+        f"'{os.path.join(r_scripts_dir, 'specific_Qs/trayectoria', name)}'"
+        for name in trayectoria_scripts
+    )
+    statement = (
+        f"FLOWS_OOAD={flows} FLOWS_COHORT={manifest}"
+        f' Rscript -e "for (f in c({scripts})) source(f)"'
+    )
+    P.run(statement)
+    build_cache.write_marker(outfile, pair)
+
+
+# ----------------------------------------------------------------------
+# Per quincena analysis
+# Each snapshot is cleaned once; every stage below depends only on the
+# cleaned snapshot, so with e.g. ``make full -p 8`` they run concurrently
+# for all quincenas and the runtime is that of the slowest chain.
+# In batch mode (--quincenas or batch:quincenas) this per quincena graph is
+# instantiated for each listed quincena, while cross-quincena stages such as
+# diff_consecutive_snapshots are shared.
+# Stage outputs are written under results/stages/<snapshot>/<stage>/ and a
+# <stage>.done file holding the stage's cache key marks it as complete.
+
+stages_dir = os.path.join(results_dir, "stages")
+clean_pattern = r".*/2_clean_dups_col_types_(.+)\.rdata\.gzip$"
+clean_regex = regex(clean_pattern)
+
+
+# Figures queued by the R stages with fig_defer() (figure_layer.R):
+figure_queue_dir = os.path.join(results_dir, "figure_queue")
+figure_jobs = PARAMS.get("figures", {}).get("jobs") or os.cpu_count() or 1
+
+# Cleaned quincenas shared in memory by the stages using them (shm_snapshot.py):
+shm_params = PARAMS.get("shm", {})
+shared_snapshots = (
+    shm_snapshot.SharedSnapshots(shm_params.get("root") or shm_snapshot.DEFAULT_ROOT)
+    if shm_params.get("enabled", True)
+    else None
+)
+
+
+def run_r_stage(
+    script: str,
+    infile: str,
+    outfile: str,
+    extra_inputs: dict | None = None,
+    env: dict | None = None,
+    extra_files: List[str] | None = None,
+) -> None:
+    """Run the R ``script`` (relative to the project scripts directory) on
+    ``infile``, writing its results to a directory named as the ``outfile``
+    marker (``stages/<snapshot>/<stage>/``), not shared with other stages.
+
+    Scripts receive ``<infile> <results_dir>`` as command line arguments,
+    and the files in ``extra_inputs`` as environment variables (they are
+    part of the cache key too), as well as the variables in ``env``. These
+    are not hashed, as they may hold machine specific absolute paths: pass
+    the files they point to as ``extra_files``.
+    ``extra_files`` are other files the script reads (sourced scripts,
+    manifests, catalogs), hashed into the key with the shared helpers
+    (funcs_epi_source.R, ...) if they exist. Paths are absolute as the scripts
+    ``setwd(here::here())`` before using them.
+    If the cleaned snapshot has an Arrow copy, it is shared in memory with
+    the other stages running on it and passed as ``SNAPSHOT_ARROW``
+    (snapshot_load.R). Figures they queue are then rendered in parallel by
+    figure_cache.py, skipping those whose data slice and plot spec are
+    unchanged.
+    """
+    stage_results = outfile[: -len(".done")]
+    os.makedirs(stage_results, exist_ok=True)
+    script_path = os.path.join(r_scripts_dir, script)
+    # One queue per stage (figure_queue/<snapshot>/<stage>), absolute as
+    # fig_defer() writes to it after setwd():
+    queue = os.path.abspath(
+        os.path.join(figure_queue_dir, os.path.relpath(stage_results, stages_dir))
+    )
+    figures = get_dir("scripts/figure_cache.py")
+    arrow_file = re.sub(r"\.rdata\.gzip$", ".arrow", infile)
+    shared = shared_snapshots is not None and os.path.exists(arrow_file)
+    holder = f"{os.path.relpath(stage_results, stages_dir)}:{script}"
+    variables = f"FIGURE_QUEUE={queue}"
+    for name, path in (extra_inputs or {}).items():
+        variables += f" {name}={os.path.abspath(path)}"
+    for name, value in (env or {}).items():
+        variables += f" {name}={value}"
+    run = (
+        f"Rscript {script_path} {os.path.abspath(infile)}"
+        f" {os.path.abspath(stage_results)}"
+    )
+    if shared:
+        # The copy is only made if the stage runs (not on a cache hit), and
+        # is held by the shell running Rscript ($$) for R's whole lifetime,
+        # so a crashed or killed stage is not counted as a live holder:
+        shm = get_dir("scripts/shm_snapshot.py")
+        shm_args = (
+            f"--root {shared_snapshots.root} --in {os.path.abspath(arrow_file)}"
+            f" --holder '{holder}'"
+        )
+        run = (
+            f"status=0; buffer=$(python {shm} acquire {shm_args} --pid $$)"
+            f" && {variables} SNAPSHOT_ARROW=$buffer {run} || status=$?;"
+            f" python {shm} release {shm_args}; test $status -eq 0"
+        )
+    else:
+        run = f"{variables} {run}"
+    statement = (
+        f"{run} && python {figures} render --queue {queue} --jobs {figure_jobs}"
+    )
+    if cache_dir:
+        statement += f" --cache-dir {cache_dir}"
+    scripts = [
+        script_path,
+        os.path.join(r_scripts_dir, "figure_layer.R"),
+        os.path.join(r_scripts_dir, "render_figure.R"),
+        os.path.join(r_scripts_dir, "snapshot_load.R"),
+        *r_helpers,
+        *(extra_files or []),
+    ]
+    # Files not there (yet) are left out; the key changes when they appear:
+    scripts = [f for f in scripts if os.path.exists(f)]
+    inputs = [infile, *(extra_inputs or {}).values()]
+    key = cached_run(statement, inputs, scripts, stage_results)
+    build_cache.write_marker(outfile, key)
+
+
+# Canonical categorical labels (canonical_labels.py):
+canonical_dir = os.path.join(results_dir, "canonical")
+label_params = PARAMS.get("labels", {})
+label_map = label_params.get("map") or os.path.join(canonical_dir, "label_map.tsv")
+label_aliases = label_params.get("aliases") or get_dir(
+    "configuration/label_aliases.yml"
+)
+
+
+@follows(run_tables_check, mkdir(canonical_dir))
+@merge(sample_snapshot if sample_fraction else snapshot_csvs(), label_map)
+def learn_labels(infiles, outfile):
+    """Record the labels of every quincena, oldest first, in label_map.tsv.
+
+    Done in one serial step so the canonical spelling of a label does not
+    depend on which parallel canonicalize_snapshot job sees it first.
+    """
+    infiles = sorted(infiles, key=snapshot_cdc.snapshot_order)
+    script = get_dir("scripts/canonical_labels.py")
+    statement = (
+        f"python {script} --map {outfile} --aliases {label_aliases}"
+        f" --in {' '.join(infiles)}"
+    )
+    if label_params.get("columns"):
+        statement += f" --columns {label_params['columns']}"
+    P.run(statement)
+    # Touch the map even if no label was new, so Ruffus sees it up to date:
+    with open(outfile, "a"):
+        os.utime(outfile)
+
+
+@follows(learn_labels)
+@transform(
+    sample_snapshot if sample_fraction else snapshot_csvs(),
+    regex(r".*/(Qna_[^/]+)\.csv$"),
+    os.path.join(canonical_dir, r"\1.csv"),
+)
+def canonicalize_snapshot(infile, outfile):
+    """Rewrite the snapshot with canonical categorical labels (padding,
+    accents, aliases in configuration/label_aliases.yml).
+
+    Only the distinct labels are normalized, with the shared label_map.tsv
+    of learn_labels, so each label keeps its canonical form across
+    quincenas. The map is part of the cache key.
+    """
+    script = get_dir("scripts/canonical_labels.py")
+    statement = (
+        f"python {script} --in {infile} --out {outfile}"
+        f" --map {label_map} --aliases {label_aliases}"
+    )
+    if label_params.get("columns"):
+        statement += f" --columns {label_params['columns']}"
+    cached_run(
+        statement,
+        [infile, label_aliases, label_map],
+        [script],
+        canonical_dir,
+        label_params,
+        [outfile],
+    )
+
+
+@transform(
+    canonicalize_snapshot,
+    regex(r".*/(Qna_[^/]+)\.csv$"),
+    os.path.join(rdata_dir, r"2_clean_dups_col_types_\1.rdata.gzip"),
+)
+def clean_snapshot(infile, outfile):
+    """Remove duplicates and set column types (2_clean_dups_col_types.R)."""
+    script = os.path.join(r_scripts_dir, "descriptive", "2_clean_dups_col_types.R")
+    statement = (
+        f"Rscript {script} {os.path.abspath(infile)} {os.path.abspath(results_dir)}"
+    )
+    # Also keeps the Arrow copy of data_f and its _meta.rdata.gzip, if written:
+    outputs = [outfile, re.sub(r"\.rdata\.gzip$", ".arrow", outfile)]
+    outputs.append(re.sub(r"\.rdata\.gzip$", "_meta.rdata.gzip", outfile))
+    inputs = [infile] + [f for f in [col_types_file] if os.path.exists(f)]
+    cached_run(statement, inputs, [script], rdata_dir, outputs=outputs)
+
+
+# Per OOAD sums of the DIR/PDA files (group_sum.py), in the project results
+# directory where merge_DIR_deleg_sum.R and DIR_PDA_num_derechohabientes.R
+# look for them:
+dir_sums_dir = os.path.join(csv_dir, "dir_sums")
+dir_sums_params = PARAMS.get("dir_sums", {})
+pda_files = [os.path.abspath(f) for f in dir_sums_params.get("files") or []]
+
+
+@follows(mkdir(dir_sums_dir))
+@transform(
+    [f for f in pda_files if os.path.exists(f)],
+    regex(r".*/([^/]+)\.[^./]+$"),
+    os.path.join(dir_sums_dir, r"\1_sum_OOAD.tsv"),
+)
+def dir_sums(infile, outfile):
+    """Sum derechohabientes per OOAD, in total and adscritos a consultorio,
+    in one streaming pass over a PDA file (group_sum.py)."""
+    script = get_dir("scripts/group_sum.py")
+    statement = (
+        f"python {script} --by ID_DELEG_RP"
+        " --agg total_derechohabientes=sum:TOT_CASOS"
+        " --agg adscritos_consultorio=sum:TOT_CASOS:ST_CONSULTORIO==1"
+        f" --out {outfile} {infile}"
+    )
+    cached_run(statement, [infile], [script], dir_sums_dir, outputs=[outfile])
+
+
+# Physicians per 1,000 derechohabientes (coverage_engine.py):
+coverage_dir = os.path.join(results_dir, "coverage")
+coverage_params = PARAMS.get("coverage", {})
+coverage_denominators = [
+    dict(table, path=os.path.abspath(table["path"]))
+    for table in coverage_params.get("denominators") or []
+]
+
+
+@follows(mkdir(coverage_dir))
+@merge(
+    # DIR tables are inputs too, so rates are updated when one changes:
+    [canonicalize_snapshot]
+    + [t["path"] for t in coverage_denominators if os.path.exists(t["path"])],
+    os.path.join(coverage_dir, "rates.tsv"),
+)
+def coverage_rates(infiles, outfile):
+    """Rates per specialty, OOAD/state/national level and quincena against
+    the DIR derechohabientes tables in coverage:denominators.
+
+    Quincenas and DIR tables already counted are skipped and only the rates
+    of new quincenas are recomputed, unless a DIR table changed. Missing DIR
+    tables are skipped with a warning. The meds_por_dh scripts and maps read
+    rates.tsv.
+    """
+    script = get_dir("scripts/coverage_engine.py")
+    common = f" --store {coverage_dir} --map {label_map} --aliases {label_aliases}"
+    tables = {t["path"] for t in coverage_denominators}
+    statements = []
+    for table in coverage_denominators:
+        if not os.path.exists(table["path"]):
+            E.warn(f"coverage_rates: DIR table {table['path']} not found, skipped")
+            continue
+        statement = f"python {script} add-denominators{common} --in {table['path']}"
+        for option in ("date", "geo_column", "columns"):
+            if table.get(option):
+                statement += f" --{option.replace('_', '-')} '{table[option]}'"
+        statements.append(statement)
+    options = "".join(
+        f" --filter '{spec}'" for spec in coverage_params.get("filters") or []
+    )
+    for option in ("geo_column", "specialty_column"):
+        if coverage_params.get(option):
+            options += f" --{option.replace('_', '-')} {coverage_params[option]}"
+    snapshots = [f for f in infiles if f not in tables]
+    statements.append(
+        f"python {script} add-snapshots{common}{options} {' '.join(snapshots)}"
+    )
+    statements.append(f"python {script} rates{common} --out {outfile}")
+    P.run(" && ".join(statements))
+
+
+# Row deduplicated archive of every quincena (snapshot_archive.py):
+archive_dir = PARAMS.get("archive", {}).get("dir") or os.path.join(
+    project_root, "archive"
+)
+
+
+@merge(convert_to_csv, os.path.join(results_dir, "archive_complete.done"))
+def archive_snapshots(infiles, outfile):
+    """Add new quincena snapshots to the deduplicated archive.
+
+    Only rows not seen in earlier quincenas are stored; already archived
+    snapshots are skipped. Any quincena can be rebuilt with
+    ``snapshot_archive.py restore``.
+    """
+    snapshots = snapshot_csvs()
+    if isinstance(snapshots, str):
+        snapshots = glob.glob(snapshots)
+    snapshots = sorted(snapshots, key=snapshot_cdc.snapshot_order)
+    script = get_dir("scripts/snapshot_archive.py")
+    statement = f"python {script} add --archive {archive_dir} {' '.join(snapshots)}"
+    P.run(statement)
+    build_cache.write_marker(outfile, "\n".join(snapshots))
+
+
+# Mergeable per quincena sketches (quincena_sketches.py):
+sketches_dir = os.path.join(results_dir, "sketches")
+
+
+@follows(run_tables_check, mkdir(sketches_dir))
+@transform(
+    sample_snapshot if sample_fraction else snapshot_csvs(),
+    regex(r".*/(Qna_[^/]+)\.csv$"),
+    os.path.join(sketches_dir, r"\1.json.gz"),
+)
+def sketch_snapshot(infile, outfile):
+    """Quantile (KLL), distinct count (HyperLogLog) and heavy hitter
+    (Misra-Gries) sketches per column and group of the snapshot, merged
+    across quincenas by ``quincena_sketches.py query``."""
+    sketch_params = PARAMS.get("sketches", {})
+    script = get_dir("scripts/quincena_sketches.py")
+    options = "".join(
+        f" --{option.replace('_', '-')} {sketch_params[option]}"
+        for option in (
+            "quantile_columns",
+            "distinct_columns",
+            "heavy_columns",
+            "group_columns",
+        )
+        if sketch_params.get(option)
+    )
+    statement = f"python {script} build --in {infile} --out {outfile}{options}"
+    cached_run(
+        statement, [infile], [script], sketches_dir, sketch_params, [outfile]
+    )
+
+
+# Point lookups over the quincena history (history_lookup.py):
+history_index_dir = os.path.join(results_dir, "history_index")
+
+
+@follows(run_tables_check, mkdir(history_index_dir))
+@transform(
+    sample_snapshot if sample_fraction else snapshot_csvs(),
+    regex(r".*/(Qna_[^/]+)\.csv$"),
+    os.path.join(history_index_dir, r"\1", "manifest.json"),
+)
+def index_snapshot(infile, outfile):
+    """Index the snapshot sorted by CURP in row groups with min/max statistics
+    and bloom filters on CURP, MATRICULA and NSS, for point lookups with
+    ``history_lookup.py get`` / ``batch``."""
+    lookup_params = PARAMS.get("lookup", {})
+    script = get_dir("scripts/history_lookup.py")
+    statement = (
+        f"python {script} build --in {infile} --index-dir {history_index_dir}"
+        f" --row-group-size {lookup_params.get('row_group_size', 5000)}"
+        f" --fpp {lookup_params.get('fpp', 0.01)}"
+    )
+    cached_run(
+        statement,
+        [infile],
+        [script],
+        os.path.dirname(outfile),
+        lookup_params,
+    )
+
+
+@follows(run_tables_check)
+@transform(
+    sample_snapshot if sample_fraction else snapshot_csvs(),
+    regex(r".*/(Qna_[^/]+)\.csv$"),
+    os.path.join(stages_dir, r"\1", "quality_summary.tsv"),
+)
+def quality_check(infile, outfile):
+    """Evaluate the data quality rules (configuration/quality_rules.yml) on
+    the snapshot in one vectorized pass. Writes a per rule summary and the
+    violating rows (quality_violations.tsv.gz) next to it."""
+    quality_params = PARAMS.get("quality", {})
+    rules = quality_params.get("rules") or get_dir("configuration/quality_rules.yml")
+    violations = os.path.join(os.path.dirname(outfile), "quality_violations.tsv.gz")
+    script = get_dir("scripts/quality_rules.py")
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    statement = (
+        f"python {script} --in {infile} --rules {rules}"
+        f" --summary {outfile} --violations {violations}"
+    )
+    cached_run(
+        statement,
+        [infile, rules],
+        [script],
+        os.path.dirname(outfile),
+        quality_params,
+        [outfile, violations],
+    )
+
+
+@transform(clean_snapshot, clean_regex, os.path.join(stages_dir, r"\1", "subset.done"))
+def subset_snapshot(infile, outfile):
+    """Subset the cleaned snapshot (2b_clean_subset.R)."""
+    run_r_stage("descriptive/2b_clean_subset.R", infile, outfile)
+
+
+@transform(clean_snapshot, clean_regex, os.path.join(stages_dir, r"\1", "explore.done"))
+def explore_snapshot(infile, outfile):
+    """Univariate plots and summaries (3_explore.R)."""
+    run_r_stage("descriptive/3_explore.R", infile, outfile)
+
+
+@transform(clean_snapshot, clean_regex, os.path.join(stages_dir, r"\1", "bivar.done"))
+def bivar_snapshot(infile, outfile):
+    """Bivariate plots and tables (4_bivar.R)."""
+    run_r_stage("descriptive/4_bivar.R", infile, outfile)
+
+
+@transform(
+    clean_snapshot, clean_regex, os.path.join(stages_dir, r"\1", "geo_plzocu.done")
+)
+def geo_plzocu_table(infile, outfile):
+    """PLZOCU by location table (geo/tabla_PLZOCU_por_ubicacion.R)."""
+    run_r_stage("geo/tabla_PLZOCU_por_ubicacion.R", infile, outfile)
+
+
+# CUUMS unit coordinates (merge_coords_unidades_medicas_CUUMS.R):
+cuums_catalog = PARAMS.get("geo", {}).get("cuums_catalog") or os.path.join(
+    rdata_dir, "external", "CUUMS_Dic_2024_mod_for_R.tsv"
+)
+
+
+@transform(
+    clean_snapshot, clean_regex, os.path.join(stages_dir, r"\1", "geo_coords.done")
+)
+def geo_coords_units(infile, outfile):
+    """Merge unit coordinates (geo/merge_coords_unidades_medicas_CUUMS.R)
+    from the CUUMS catalog, passed as CUUMS_CATALOG."""
+    catalog = {"CUUMS_CATALOG": cuums_catalog} if os.path.exists(cuums_catalog) else {}
+    run_r_stage("geo/merge_coords_unidades_medicas_CUUMS.R", infile, outfile, catalog)
+
+
+# Simplified OOAD/state boundaries for the maps (geometry_cache.py):
+geo_params = PARAMS.get("geo", {})
+# Absolute, as the map scripts look for it from the project root by default:
+geo_cache_dir = os.path.abspath(
+    geo_params.get("cache_dir") or os.path.join(project_root, "results", "geo_cache")
+)
+
+
+@follows(mkdir(geo_cache_dir))
+@transform(
+    geo_params.get("shapefiles") or [],
+    regex(r".*/([^/]+)\.shp$"),
+    os.path.join(geo_cache_dir, r"\1", "current.json"),
+)
+def cache_geometries(infile, outfile):
+    """Store each boundary shapefile as GeoParquet at several topology
+    preserving simplification tolerances, keyed by the source hash.
+
+    Map scripts read the resolution they need from GEO_CACHE_DIR instead of
+    parsing the shapefile (see 3_meds_cada_esp_DH_OOADs_maps.R).
+    """
+    script = get_dir("scripts/geometry_cache.py")
+    resolutions = ",".join(
+        f"{name}={tolerance}"
+        for name, tolerance in (geo_params.get("resolutions") or {}).items()
+    )
+    statement = (
+        f"python {script} build --in {infile} --cache-dir {geo_cache_dir} --prune"
+    )
+    if resolutions:
+        statement += f" --resolutions {resolutions}"
     P.run(statement)
 
 
-@transform(countWords, suffix("_summary.rdata.gzip"), "_counts.load")
-def loadWordCounts(infile, outfile):
-    """Load results of word counting into database."""
-    P.load(infile, outfile, "--add-index=word")
+@follows(coverage_rates, cache_geometries)
+@transform(
+    clean_snapshot, clean_regex, os.path.join(stages_dir, r"\1", "meds_por_dh.done")
+)
+def meds_por_dh(infile, outfile):
+    """Physicians per specialty and derechohabientes by OOAD
+    (specific_Qs/meds_por_dh/1_meds_cada_esp_DH_OOADs.R), from the rates
+    of coverage_rates, and their maps (3_meds_cada_esp_DH_OOADs_maps.R)
+    if the OOAD boundaries are in the geometry cache.
+
+    Quincenas without DIR denominators in rates.tsv are skipped with a
+    warning.
+    """
+    rates = os.path.join(coverage_dir, "rates.tsv")
+    quincena = re.match(clean_pattern, infile).group(1)
+    if not coverage_engine.has_rates(rates, quincena):
+        E.warn(
+            f"meds_por_dh: no coverage rates for {quincena}, skipped"
+            " (see coverage: denominators in pipeline.yml)"
+        )
+        build_cache.write_marker(outfile, "skipped: no coverage rates")
+        return
+    maps = os.path.join(r_scripts_dir, "specific_Qs/meds_por_dh")
+    run_r_stage(
+        "specific_Qs/meds_por_dh/1_meds_cada_esp_DH_OOADs.R",
+        infile,
+        outfile,
+        {"COVERAGE_RATES": rates},
+        env={"GEO_CACHE_DIR": geo_cache_dir},
+        extra_files=[
+            os.path.join(maps, "3_meds_cada_esp_DH_OOADs_maps.R"),
+            # The geometries used, not where the cache is (machine specific):
+            *sorted(glob.glob(os.path.join(geo_cache_dir, "*", "current.json"))),
+        ],
+    )
+
+
+@transform(
+    clean_snapshot, clean_regex, os.path.join(stages_dir, r"\1", "tabla_vacs.done")
+)
+def table_loc_vacs(infile, outfile):
+    """Interactive table of vacancies by location (5_tabla_loc_vacs_nombreAR.R)."""
+    run_r_stage(
+        "descriptive/5_tabla_loc_vacs_nombreAR.R",
+        infile,
+        outfile,
+        extra_files=[dir_locations],
+    )
+
+
+# Paged interactive tables (table_shards.py), read by the viewer on demand:
+default_tables = {
+    "tabla_loc_vacs_nombreAR_interactiva.txt": "-vacantes",
+    "tabla_NOMBREAR_DELEGACION.txt": "-n",
+}
+
+
+@follows(meds_por_dh)
+@transform(
+    table_loc_vacs,
+    regex(r".*/([^/]+)/tabla_vacs\.done$"),
+    os.path.join(stages_dir, r"\1", "tables", "tables.done"),
+)
+def shard_tables(infile, outfile):
+    """Write the lookup tables of the quincena (5_tabla_loc_vacs_nombreAR.R,
+    meds_por_dh) as sorted, gzip compressed shards with an index and a
+    static viewer (tables/<table>/index.html) that loads only the shards
+    needed for the visible page."""
+    tables_params = PARAMS.get("tables", {})
+    tables = tables_params.get("files") or default_tables
+    stage = os.path.dirname(infile)
+    tables_dir = os.path.dirname(outfile)
+    script = get_dir("scripts/table_shards.py")
+    viewer = get_dir("scripts/table_viewer.html")
+    sortable = tables_params.get("sortable") or {}
+    keys = []
+    for name, sort in tables.items():
+        # R stages write to dated subdirectories of their own, use the latest:
+        found = glob.glob(os.path.join(stage, "*", "*", name))
+        if not found:
+            continue
+        table = max(found, key=os.path.getmtime)
+        outdir = os.path.join(tables_dir, name.split(".")[0])
+        statement = (
+            f"python {script} --in {table} --outdir {outdir}"
+            f" --sort={sort or ''}"
+            # Each sortable column is another copy of the table, only the
+            # columns of --sort unless listed:
+            + (f" --sortable={sortable[name] or ''}" if name in sortable else "")
+            + f" --shard-rows {tables_params.get('shard_rows', 1000)}"
+            f" --page-size {tables_params.get('page_size', 25)}"
+        )
+        keys.append(
+            cached_run(statement, [table], [script, viewer], outdir, tables_params)
+        )
+    build_cache.write_marker(outfile, "\n".join(keys))
+
+
+@follows(
+    quality_check,
+    subset_snapshot,
+    explore_snapshot,
+    bivar_snapshot,
+    geo_plzocu_table,
+    geo_coords_units,
+    meds_por_dh,
+    table_loc_vacs,
+    shard_tables,
+    cache_geometries,
+    diff_consecutive_snapshots,
+    flow_matrices,
+    trayectoria_sankey,
+    index_snapshot,
+    archive_snapshots,
+    sketch_snapshot,
+    coverage_rates,
+    dir_sums,
+)
+def analysis():
+    """Target for all per quincena analysis stages."""
+    # Drop shared snapshots left behind by stages that were killed:
+    if shared_snapshots is not None:
+        shared_snapshots.cleanup()
 
 
 # Build the report:
 report_dir = "pipeline_report"
 
 
-@follows(mkdir(report_dir), convert_to_csv)
+@follows(mkdir(report_dir), analysis)
 def make_report():
     """Run a report generator script (e.g. with quarto render options)
     generate_report.R will create an html quarto document.
@@ -481,8 +1401,17 @@ def full(outfile):
 def main(argv=None):
     if argv is None:
         argv = sys.argv
-    P.main(argv)
+    # Batch mode: run all quincenas under one scheduler with batch:jobs
+    # processes unless -p/--multiprocess is given.
+    jobs = PARAMS.get("batch", {}).get("jobs")
+    has_jobs = any(
+        a in ("-p", "--multiprocess") or a.startswith("--multiprocess=")
+        for a in argv
+    )
+    if jobs and not has_jobs:
+        argv = list(argv) + ["-p", str(jobs)]
+    return P.main(argv)
 
 
 if __name__ == "__main__":
-    sys.exit(P.main(sys.argv))
+    sys.exit(main())
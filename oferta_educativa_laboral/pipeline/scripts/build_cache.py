@@ -0,0 +1,195 @@
+"""
+build_cache
+===========
+
+Cache de resultados direccionado por contenido para las tareas del pipeline.
+
+La llave de cada tarea es un hash (SHA-256) del contenido de sus archivos de
+entrada, de los parametros de ``pipeline.yml`` que usa y del codigo fuente de
+los scripts que ejecuta. Las rutas y fechas de modificacion no forman parte
+de la llave, asi que copiar los datos, restaurarlos de un respaldo o clonar el
+repositorio en otro nodo no obliga a recalcular: si la llave ya existe en el
+cache los resultados se restauran en lugar de ejecutar la tarea.
+
+Estructura del directorio de cache (se puede compartir entre maquinas):
+
+    <cache_dir>/objects/<ab>/<sha256>   contenido de cada archivo, sin duplicados
+    <cache_dir>/entries/<llave>.json    archivos producidos por una tarea
+
+Uso:
+
+    python build_cache.py key --inputs a.csv b.csv --script 3_explore.R
+    python build_cache.py run --cache-dir ../../cache --inputs a.csv \\
+        --outputs out.tsv --script snapshot_cdc.py -- python snapshot_cdc.py ...
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+_CHUNK = 1 << 20
+
+# In-process memo of file hashes keyed by (path, size, mtime_ns), so the same
+# input is only read once per pipeline process.
+_HASH_MEMO: Dict[tuple, str] = {}
+
+
+def hash_file(path: str) -> str:
+    """Return the SHA-256 hex digest of the contents of ``path``."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key in _HASH_MEMO:
+        return _HASH_MEMO[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_CHUNK), b""):
+            digest.update(chunk)
+    _HASH_MEMO[memo_key] = digest.hexdigest()
+    return _HASH_MEMO[memo_key]
+
+
+def task_key(
+    inputs: Sequence[str],
+    params: Optional[dict] = None,
+    scripts: Sequence[str] = (),
+) -> str:
+    """Compute the cache key of a task.
+
+    Parameters
+    ----------
+    inputs:
+        Input files. Only their base names and contents are used, so the key
+        is the same wherever the project is checked out.
+    params:
+        JSON serialisable options (e.g. a section of ``PARAMS``).
+    scripts:
+        Source files of the scripts run by the task.
+    """
+    digest = hashlib.sha256()
+    for label, files in (("input", inputs), ("script", scripts)):
+        for path in files:
+            digest.update(f"{label}:{os.path.basename(path)}:".encode())
+            digest.update(hash_file(path).encode())
+    digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def list_files(root: str) -> List[str]:
+    """Return all files below ``root`` (recursively), sorted."""
+    found = []
+    for dirpath, _dirnames, filenames in os.walk(root):
+        found.extend(os.path.join(dirpath, f) for f in filenames)
+    return sorted(found)
+
+
+def _atomic_copy(src: str, dest: str) -> None:
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest) or ".", prefix=".tmp_")
+    os.close(fd)
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+class BuildCache:
+    """Content-addressed store of task outputs rooted at ``cache_dir``."""
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.entries_dir = os.path.join(cache_dir, "entries")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.entries_dir, f"{key}.json")
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self._entry_path(key))
+
+    def store(self, key: str, files: Iterable[str], root: str) -> dict:
+        """Save ``files`` (paths below ``root``) as the outputs of ``key``."""
+        outputs = {}
+        for path in files:
+            digest = hash_file(path)
+            obj = self._object_path(digest)
+            if not os.path.exists(obj):
+                _atomic_copy(path, obj)
+            outputs[os.path.relpath(path, root)] = digest
+        entry = {"key": key, "created": time.time(), "outputs": outputs}
+        tmp = f"{self._entry_path(key)}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(entry, fh, indent=2, sort_keys=True)
+        os.replace(tmp, self._entry_path(key))
+        return entry
+
+    def restore(self, key: str, root: str) -> bool:
+        """Restore the outputs of ``key`` below ``root``.
+
+        Returns ``False`` (and restores nothing) on a cache miss or if any
+        stored object is missing. Files already up to date are touched, so
+        timestamp based schedulers (Ruffus) see every output as fresh.
+        """
+        if not self.has(key):
+            return False
+        with open(self._entry_path(key)) as fh:
+            outputs = json.load(fh)["outputs"]
+        if not all(os.path.exists(self._object_path(d)) for d in outputs.values()):
+            return False
+        for relpath, digest in outputs.items():
+            dest = os.path.join(root, relpath)
+            if os.path.exists(dest) and hash_file(dest) == digest:
+                os.utime(dest)
+                continue
+            _atomic_copy(self._object_path(digest), dest)
+        return True
+
+
+def write_marker(outfile: str, key: str) -> None:
+    """Write the task key to ``outfile`` in place of an empty touch file."""
+    os.makedirs(os.path.dirname(outfile) or ".", exist_ok=True)
+    with open(outfile, "w") as fh:
+        fh.write(f"{key}\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("key", "run"):
+        p = sub.add_parser(name)
+        p.add_argument("--inputs", nargs="*", default=[])
+        p.add_argument("--script", nargs="*", default=[])
+        p.add_argument("--params", default="{}", help="JSON encoded parameters")
+    p_run = sub.choices["run"]
+    p_run.add_argument("--cache-dir", required=True)
+    p_run.add_argument("--outputs", nargs="+", required=True)
+    p_run.add_argument("--root", default=".", help="Outputs are stored relative to")
+    p_run.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    key = task_key(args.inputs, json.loads(args.params), args.script)
+    if args.cmd == "key":
+        print(key)
+        return 0
+    cache = BuildCache(args.cache_dir)
+    if cache.restore(key, args.root):
+        print(f"Restored {key} from {args.cache_dir}", file=sys.stderr)
+        return 0
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    returncode = subprocess.call(command)
+    if returncode == 0:
+        cache.store(key, args.outputs, args.root)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+canonical_labels
+================
+
+Canonicalizacion de etiquetas categoricas del SIAP (``CATEGORIA``,
+``DESCRIP_CLASCATEG``, ``DEPENDENCIA``, ...): espacios de relleno como en
+``"MEDICO NO FAMILIAR     80"``, variantes con y sin acento de
+``"1.MÉDICOS"``, nombres de unidades distintos entre el SIAP y los catalogos
+de coordenadas y los grupos ``Otro_*``.
+
+Solo se normalizan los valores distintos de cada columna: cada valor se
+reduce a una llave (mayusculas, sin acentos, espacios colapsados) que se
+busca en las tablas de alias (``configuration/label_aliases.yml``). Las
+etiquetas sin alias toman la variante mas frecuente de su llave, con los
+espacios colapsados y los acentos conservados. Los resultados se guardan en
+una tabla persistente (``label_map.tsv``) y se aplican a las filas por codigo
+(``pandas.factorize``), asi que el costo crece con el numero de etiquetas
+distintas y no con el de filas. Una etiqueta ya registrada conserva su forma
+canonica en corridas posteriores.
+
+Sin ``--out`` solo se registran en la tabla las etiquetas de los archivos de
+``--in``, en el orden dado; el pipeline lo hace para todas las quincenas en
+un solo paso antes de reescribirlas en paralelo, asi la forma canonica no
+depende del orden en que terminan los trabajos.
+
+Uso:
+
+    python canonical_labels.py --map label_map.tsv \\
+        --aliases ../configuration/label_aliases.yml \\
+        --in Qna_17_Plantilla_2024.csv Qna_07_Plantilla_2025.csv
+    python canonical_labels.py --in Qna_07_Plantilla_2025.csv \\
+        --out canonical/Qna_07_Plantilla_2025.csv --map label_map.tsv \\
+        --aliases ../configuration/label_aliases.yml
+"""
+
+import argparse
+import fcntl
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import yaml
+
+CATEGORICAL_COLUMNS: List[str] = [
+    "ADSCRIPCION",
+    "CATEGORIA",
+    "CLASIF_UNIDAD",
+    "DELEGACION",
+    "DEPENDENCIA",
+    "DESCRIPCION_SERVICIO",
+    "DESCRIP_CLASCATEG",
+    "DESCRIP_HORARIO",
+    "DESCRIP_LOCALIDAD",
+    "DESCRIP_TIPO_DE_PLAZA",
+    "DESCRIP_TURNO",
+    "DescripcionTC",
+    "NOMBREAR",
+]
+
+# Alias entries under this name apply to every column.
+ALL_COLUMNS = "*"
+MAP_COLUMNS = ["column", "raw", "key", "canonical"]
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def canonical_key(values: pd.Series) -> pd.Series:
+    """Matching key of each label: upper case, no accents, single spaces."""
+    key = values.astype(str).str.normalize("NFKD")
+    key = key.str.replace("[\u0300-\u036f]", "", regex=True).str.upper()
+    return key.str.replace(_SPACES_RE, " ", regex=True).str.strip()
+
+
+def load_aliases(path: Optional[str]) -> Dict[str, dict]:
+    """Read the alias tables, with alias keys normalized like the labels.
+
+    Returns ``{column: {"aliases": {key: label}, "patterns": [(regex,
+    label)]}}``.
+    """
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        config = yaml.safe_load(fh) or {}
+    tables = {}
+    for column, entry in config.items():
+        entry = entry or {}
+        aliases = entry.get("aliases") or {}
+        keys = canonical_key(pd.Series(list(aliases), dtype=object))
+        tables[column] = {
+            "aliases": dict(zip(keys, aliases.values())),
+            "patterns": [
+                (re.compile(p["pattern"]), p["label"])
+                for p in entry.get("patterns") or []
+            ],
+        }
+    return tables
+
+
+class LabelMap:
+    """Persistent raw label -> canonical label table.
+
+    Parameters
+    ----------
+    path:
+        Tab separated mapping table (``column``, ``raw``, ``key``,
+        ``canonical``); created on :meth:`save` if missing.
+    aliases:
+        Alias tables as returned by :func:`load_aliases`. They are applied
+        to memoized labels too, so editing them takes effect on the next run.
+    """
+
+    def __init__(self, path: Optional[str] = None, aliases: Optional[dict] = None):
+        self.path = path
+        self.aliases = aliases or {}
+        self.raw: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self._new: List[Tuple[str, str, str, str]] = []
+        if path and os.path.exists(path) and os.path.getsize(path):
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        table = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+        # The first canonical label recorded for a key wins.
+        first = table.drop_duplicates(["column", "key"]).set_index(["column", "key"])
+        table["canonical"] = (
+            first["canonical"]
+            .reindex(pd.MultiIndex.from_frame(table[["column", "key"]]))
+            .to_numpy()
+        )
+        for column, rows in table.groupby("column", sort=False):
+            self.raw.setdefault(column, {}).update(
+                zip(rows["raw"], zip(rows["key"], rows["canonical"]))
+            )
+
+    def _aliased(self, column: str, key: str) -> Optional[str]:
+        for name in (column, ALL_COLUMNS):
+            table = self.aliases.get(name)
+            if table is None:
+                continue
+            if key in table["aliases"]:
+                return table["aliases"][key]
+            for pattern, label in table["patterns"]:
+                if pattern.search(key):
+                    return label
+        return None
+
+    def _learn(self, column: str, labels: pd.Series) -> None:
+        """Add labels not yet in the map; ``labels`` holds one row per value
+        occurrence count (index: raw label)."""
+        known = self.raw.setdefault(column, {})
+        new = labels[~labels.index.isin(list(known))]
+        if new.empty:
+            return
+        keys = canonical_key(pd.Series(new.index, index=new.index, dtype=object))
+        by_key: Dict[str, str] = {}
+        for key, canonical in known.values():
+            by_key.setdefault(key, canonical)
+        frame = pd.DataFrame({"key": keys, "n": new})
+        frame["tidy"] = (
+            frame.index.to_series().str.replace(_SPACES_RE, " ", regex=True).str.strip()
+        )
+        # New keys take their most frequent tidy spelling; ties go to the
+        # accented one, then alphabetical.
+        frame["n_tidy"] = frame.groupby(["key", "tidy"])["n"].transform("sum")
+        frame["accents"] = frame["tidy"].str.count(r"[^\x00-\x7f]")
+        frame = frame.sort_values(
+            ["n_tidy", "accents", "tidy"], ascending=[False, False, True]
+        )
+        for raw, row in frame.iterrows():
+            if row["key"] not in by_key:
+                by_key[row["key"]] = row["tidy"]
+            known[raw] = (row["key"], by_key[row["key"]])
+            self._new.append((column, raw, row["key"], by_key[row["key"]]))
+
+    def canonicalize(self, values: pd.Series, column: str) -> pd.Series:
+        """Return ``values`` with canonical labels, as a categorical series.
+
+        Missing values stay missing.
+        """
+        codes, uniques = pd.factorize(values)
+        if len(uniques) == 0:
+            return pd.Series(
+                pd.Categorical.from_codes(codes, pd.Index([], dtype=object)),
+                index=values.index,
+                name=values.name,
+            )
+        counts = pd.Series(
+            pd.Series(codes[codes >= 0]).value_counts().sort_index().to_numpy(),
+            index=uniques.astype(str),
+        )
+        self._learn(column, counts)
+        known = self.raw[column]
+        labels = []
+        for raw in uniques.astype(str):
+            key, canonical = known[raw]
+            labels.append(self._aliased(column, key) or canonical)
+        categories, label_codes = _unique_codes(labels)
+        new_codes = label_codes.take(codes, mode="clip")
+        new_codes[codes < 0] = -1
+        return pd.Series(
+            pd.Categorical.from_codes(new_codes, categories),
+            index=values.index,
+            name=values.name,
+        )
+
+    def canonicalize_frame(
+        self, df: pd.DataFrame, columns: Sequence[str] = CATEGORICAL_COLUMNS
+    ) -> pd.DataFrame:
+        out = df.copy()
+        for column in columns:
+            if column in out.columns:
+                out[column] = self.canonicalize(out[column], column)
+        return out
+
+    def save(self) -> None:
+        """Append newly learned labels to the mapping table.
+
+        The table is locked while writing so concurrent pipeline jobs
+        (one per quincena) can share it.
+        """
+        if not self.path or not self._new:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stored = LabelMap(self.path).raw
+            rows = [r for r in self._new if r[1] not in stored.get(r[0], {})]
+            if rows:
+                header = not os.path.exists(self.path) or not os.path.getsize(
+                    self.path
+                )
+                pd.DataFrame(rows, columns=MAP_COLUMNS).to_csv(
+                    self.path, sep="\t", index=False, mode="a", header=header
+                )
+        self._new = []
+
+
+def _unique_codes(labels: List[str]):
+    """Distinct labels and the code of each entry of ``labels``."""
+    codes, categories = pd.factorize(pd.Series(labels, dtype=object))
+    return pd.Index(categories), codes
+
+
+def learn_files(
+    infiles: Sequence[str],
+    label_map: LabelMap,
+    columns: Sequence[str] = CATEGORICAL_COLUMNS,
+    chunksize: int = 200_000,
+    encoding: str = "utf-8",
+) -> None:
+    """Record the labels of ``infiles``, in order, in the mapping table.
+
+    Only the categorical columns are read.
+    """
+    for infile in infiles:
+        reader = pd.read_csv(
+            infile,
+            dtype=str,
+            keep_default_na=False,
+            na_values=[""],
+            usecols=lambda c: c in columns,
+            chunksize=chunksize,
+            encoding=encoding,
+        )
+        for chunk in reader:
+            label_map.canonicalize_frame(chunk, columns)
+    label_map.save()
+
+
+def canonicalize_file(
+    infile: str,
+    outfile: str,
+    label_map: LabelMap,
+    columns: Sequence[str] = CATEGORICAL_COLUMNS,
+    chunksize: int = 200_000,
+    encoding: str = "utf-8",
+) -> None:
+    """Rewrite a snapshot CSV with canonical labels, chunk by chunk."""
+    reader = pd.read_csv(
+        infile,
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        chunksize=chunksize,
+        encoding=encoding,
+    )
+    for i, chunk in enumerate(reader):
+        chunk = label_map.canonicalize_frame(chunk, columns)
+        chunk.to_csv(outfile, index=False, mode="w" if i == 0 else "a", header=i == 0)
+    label_map.save()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--in", dest="infiles", nargs="+", required=True)
+    parser.add_argument("--out", help="Canonical CSV (default: only learn labels)")
+    parser.add_argument("--map", required=True, help="Persistent mapping table (.tsv)")
+    parser.add_argument("--aliases", help="Alias tables (YAML)")
+    parser.add_argument("--columns", default=",".join(CATEGORICAL_COLUMNS))
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args(argv)
+
+    label_map = LabelMap(args.map, load_aliases(args.aliases))
+    if args.out is None:
+        learn_files(
+            args.infiles,
+            label_map,
+            args.columns.split(","),
+            args.chunksize,
+            args.encoding,
+        )
+        return 0
+    if len(args.infiles) != 1:
+        parser.error("--out takes a single --in file")
+    canonicalize_file(
+        args.infiles[0],
+        args.out,
+        label_map,
+        args.columns.split(","),
+        args.chunksize,
+        args.encoding,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
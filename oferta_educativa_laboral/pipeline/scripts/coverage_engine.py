@@ -0,0 +1,456 @@
+"""
+coverage_engine
+===============
+
+Medicos por cada mil derechohabientes (y por 10 mil) por especialidad,
+geografia (OOAD, estado, nacional) y quincena, en un solo lugar para los
+scripts de ``specific_Qs/meds_por_dh`` y los mapas de
+``specific_Qs/mx_UAM_pins_meds_DH``.
+
+El motor guarda dos tablas en un directorio (``--store``):
+
+- ``counts.tsv``: plazas por quincena, OOAD y especialidad (``NOMBREAR``) de
+  cada quincena del SIAP, con los filtros de la tabla (p.ej.
+  ``DESCRIP_CLASCATEG=1.MÉDICOS``, ``PLZOCU=1``).
+- ``denominators.tsv``: derechohabientes del DIR por OOAD, fecha de corte y
+  medida (p.ej. ``total_derechohabientes``, ``adscritos_consultorio``).
+
+Los nombres de OOAD de ambas fuentes se llevan a su forma canonica con
+``canonical_labels.py`` (tablas ``OOAD`` y ``ESTADO`` de
+``configuration/label_aliases.yml``: ``35 - DF Norte`` -> ``Ciudad de México
+Norte``, ``México Oriente`` -> ``Estado de México Oriente``, ...) y los
+estados se derivan de las OOAD (``flow_matrix.ooad_to_state``). Las tasas de
+todas las combinaciones se calculan con un solo join por geografia y fecha
+(``pandas.merge_asof``): cada quincena usa el corte del DIR mas cercano.
+
+Las actualizaciones son incrementales: una quincena o un archivo del DIR ya
+registrados y sin cambios no se vuelven a leer, y al agregar solo quincenas
+nuevas se recalculan solo sus tasas.
+
+Uso:
+
+    python coverage_engine.py add-denominators --store results/coverage \\
+        --in pda_OOAD_032025.txt --date 2025-03-31 \\
+        --geo-column "descripcion delegación" \\
+        --columns total_derechohabientes,adscritos_consultorio
+    python coverage_engine.py add-snapshots --store results/coverage \\
+        --filter DESCRIP_CLASCATEG=1.MÉDICOS --filter PLZOCU=1 \\
+        canonical/Qna_17_Plantilla_2024.csv canonical/Qna_07_Plantilla_2025.csv
+    python coverage_engine.py rates --store results/coverage \\
+        --out results/coverage/rates.tsv
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    import build_cache
+    import canonical_labels
+    import flow_matrix
+    import snapshot_cdc
+    import stratified_sample
+except ModuleNotFoundError:  # imported as part of the package (tests)
+    from . import (
+        build_cache,
+        canonical_labels,
+        flow_matrix,
+        snapshot_cdc,
+        stratified_sample,
+    )
+
+DEFAULT_GEO_COLUMN = "DELEGACION"
+DEFAULT_SPECIALTY_COLUMN = "NOMBREAR"
+# Label tables (label_aliases.yml) for the geography names:
+OOAD = "OOAD"
+ESTADO = "ESTADO"
+# Specialty holding the sum over all specialties, and the national geography:
+TOTAL = "Total"
+NACIONAL = "Nacional"
+LEVELS = ["ooad", "estado", "nacional"]
+
+COUNT_COLUMNS = ["quincena", "fecha", "ooad", "especialidad", "n"]
+DENOMINATOR_COLUMNS = ["fecha", "ooad", "medida", "valor"]
+RATE_COLUMNS = [
+    "quincena",
+    "fecha",
+    "nivel",
+    "geografia",
+    "especialidad",
+    "n",
+    "medida",
+    "fecha_dir",
+    "denominador",
+    "por_mil",
+    "por_10mil",
+]
+
+_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+
+def quincena_date(path: str) -> datetime.date:
+    """First day of the quincena of a snapshot (``Qna_07_..._2025`` -> April 1)."""
+    year, qna = snapshot_cdc.snapshot_order(path)
+    return datetime.date(year, (qna + 1) // 2, 1 if qna % 2 else 16)
+
+
+def _read_table(path: str, columns: Sequence[str], encoding: str, chunksize: int):
+    sep = "," if path.endswith(".csv") else "\t"
+    return pd.read_csv(
+        path,
+        sep=sep,
+        dtype=str,
+        keep_default_na=False,
+        usecols=lambda c: c in columns,
+        chunksize=chunksize,
+        encoding=encoding,
+    )
+
+
+class CoverageEngine:
+    """Count and denominator tables below ``store``, with their rates.
+
+    Parameters
+    ----------
+    store:
+        Directory holding ``counts.tsv``, ``denominators.tsv`` and
+        ``sources.json`` (created if missing).
+    label_map:
+        :class:`canonical_labels.LabelMap` used for geography and specialty
+        names; pass one with a persistent ``label_map.tsv`` to keep them
+        stable across runs.
+    """
+
+    def __init__(
+        self, store: str, label_map: Optional[canonical_labels.LabelMap] = None
+    ) -> None:
+        self.store = store
+        self.labels = label_map or canonical_labels.LabelMap()
+        os.makedirs(store, exist_ok=True)
+        self.counts = self._read("counts.tsv", COUNT_COLUMNS)
+        self.denominators = self._read("denominators.tsv", DENOMINATOR_COLUMNS)
+        path = os.path.join(store, "sources.json")
+        self.sources = {"snapshots": {}, "denominators": {}, "stale": []}
+        if os.path.exists(path):
+            with open(path) as fh:
+                self.sources.update(json.load(fh))
+
+    def _read(self, name: str, columns: List[str]) -> pd.DataFrame:
+        path = os.path.join(self.store, name)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=columns)
+        table = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+        numeric = "n" if "n" in columns else "valor"
+        table[numeric] = pd.to_numeric(table[numeric])
+        return table
+
+    def _write(self, name: str, table: pd.DataFrame) -> None:
+        path = os.path.join(self.store, name)
+        table.to_csv(f"{path}.tmp", sep="\t", index=False)
+        os.replace(f"{path}.tmp", path)
+
+    def save(self) -> None:
+        self._write("counts.tsv", self.counts)
+        self._write("denominators.tsv", self.denominators)
+        with open(os.path.join(self.store, "sources.json.tmp"), "w") as fh:
+            json.dump(self.sources, fh, indent=1, sort_keys=True)
+        os.replace(
+            os.path.join(self.store, "sources.json.tmp"),
+            os.path.join(self.store, "sources.json"),
+        )
+        self.labels.save()
+
+    def _canonical(self, values: pd.Series, table: str) -> pd.Series:
+        return self.labels.canonicalize(values, table).astype(object)
+
+    def add_snapshot(
+        self,
+        path: str,
+        geo_column: str = DEFAULT_GEO_COLUMN,
+        specialty_column: str = DEFAULT_SPECIALTY_COLUMN,
+        filters: Optional[Dict[str, str]] = None,
+        encoding: str = "utf-8",
+        chunksize: int = 500_000,
+    ) -> bool:
+        """Count the rows of a snapshot per OOAD and specialty.
+
+        Only the geography, specialty and filter columns are read. Rows of a
+        ``--sample`` snapshot count as their ``PESO_MUESTRA`` weight, so its
+        counts estimate those of the full snapshot. Returns ``False`` if the
+        snapshot was already counted with the same contents and options.
+        """
+        filters = filters or {}
+        quincena = os.path.basename(path).split(".")[0]
+        key = build_cache.task_key(
+            [path], {"geo": geo_column, "specialty": specialty_column, **filters}
+        )
+        if self.sources["snapshots"].get(quincena) == key:
+            return False
+        columns = [geo_column, specialty_column, *filters]
+        weight = stratified_sample.WEIGHT_COL
+        counts = []
+        for chunk in _read_table(path, [*columns, weight], encoding, chunksize):
+            missing = set(columns) - set(chunk.columns)
+            if missing:
+                raise KeyError(f"Columns {sorted(missing)} not found in '{path}'")
+            for col, value in filters.items():
+                chunk = chunk[chunk[col] == value]
+            by = [geo_column, specialty_column]
+            if weight in chunk.columns:
+                chunk = chunk.assign(**{weight: pd.to_numeric(chunk[weight])})
+                counts.append(
+                    stratified_sample.weighted_counts(chunk, by).reset_index()
+                )
+            else:
+                counts.append(chunk.groupby(by).size().reset_index())
+        counts = pd.concat(counts, ignore_index=True)
+        counts.columns = ["ooad", "especialidad", "n"]
+        counts["ooad"] = self._canonical(counts["ooad"], OOAD)
+        counts["especialidad"] = self._canonical(
+            counts["especialidad"], specialty_column
+        )
+        # Sum over chunks and labels merged by an alias (35 and 36 - DF Norte):
+        counts = counts.groupby(["ooad", "especialidad"], as_index=False)["n"].sum()
+        counts.insert(0, "fecha", quincena_date(path).isoformat())
+        counts.insert(0, "quincena", quincena)
+        self.counts = pd.concat(
+            [self.counts[self.counts["quincena"] != quincena], counts],
+            ignore_index=True,
+        )
+        self.sources["snapshots"][quincena] = key
+        if quincena not in self.sources["stale"]:
+            self.sources["stale"].append(quincena)
+        return True
+
+    def add_denominators(
+        self,
+        path: str,
+        date: Optional[str] = None,
+        geo_column: str = "descripcion delegación",
+        columns: Optional[Dict[str, str]] = None,
+        encoding: str = "utf-8",
+    ) -> bool:
+        """Add the DIR derechohabientes per OOAD of ``path`` at ``date``.
+
+        ``columns`` maps value columns to measure names (default:
+        ``total_derechohabientes`` as is). The date defaults to the
+        ``YYYY-MM-DD`` in the file name. Returns ``False`` if the file was
+        already added with the same contents and options.
+        """
+        columns = columns or {"total_derechohabientes": "total_derechohabientes"}
+        if date is None:
+            match = _DATE_RE.search(os.path.basename(path))
+            if not match:
+                raise ValueError(f"No date in '{path}', pass one")
+            date = "-".join(match.groups())
+        date = datetime.date.fromisoformat(date).isoformat()
+        key = build_cache.task_key(
+            [path], {"date": date, "geo": geo_column, "columns": columns}
+        )
+        name = os.path.basename(path)
+        if self.sources["denominators"].get(name) == key:
+            return False
+        table = pd.concat(
+            _read_table(path, [geo_column, *columns], encoding, 500_000),
+            ignore_index=True,
+        )
+        table = table[table[geo_column] != ""]
+        table = table.melt(
+            id_vars=geo_column,
+            value_vars=list(columns),
+            var_name="medida",
+            value_name="valor",
+        )
+        table["medida"] = table["medida"].map(columns)
+        table["valor"] = pd.to_numeric(table["valor"].str.replace(",", ""))
+        table["ooad"] = self._canonical(table[geo_column], OOAD)
+        table = table.groupby(["ooad", "medida"], as_index=False)["valor"].sum()
+        table.insert(0, "fecha", date)
+        replaced = (self.denominators["fecha"] == date) & self.denominators[
+            "medida"
+        ].isin(table["medida"])
+        self.denominators = pd.concat(
+            [self.denominators[~replaced], table[DENOMINATOR_COLUMNS]],
+            ignore_index=True,
+        )
+        self.sources["denominators"][name] = key
+        # Any quincena may now be nearer to this cut of the DIR:
+        self.sources["stale"] = sorted(self.counts["quincena"].unique())
+        return True
+
+    def _by_level(self, table: pd.DataFrame, keys: List[str], value: str):
+        """Roll ``table`` up from OOAD to state and national level."""
+        frames = []
+        for level in LEVELS:
+            frame = table.copy()
+            if level == "estado":
+                states = flow_matrix.ooad_to_state(frame["ooad"].astype(str))
+                frame["ooad"] = self._canonical(states, ESTADO)
+            elif level == "nacional":
+                frame["ooad"] = NACIONAL
+            frame = frame.groupby(keys, as_index=False)[value].sum()
+            frame.insert(0, "nivel", level)
+            frames.append(frame.rename(columns={"ooad": "geografia"}))
+        return pd.concat(frames, ignore_index=True)
+
+    def rates(self, quincenas: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Rates for every specialty (plus ``Total``), geography level and
+        measure of ``quincenas`` (default: all), in one join."""
+        counts = self.counts
+        if quincenas is not None:
+            counts = counts[counts["quincena"].isin(quincenas)]
+        totals = counts.groupby(["quincena", "fecha", "ooad"], as_index=False)[
+            "n"
+        ].sum()
+        totals["especialidad"] = TOTAL
+        counts = pd.concat([counts, totals], ignore_index=True)
+        left = self._by_level(
+            counts, ["quincena", "fecha", "ooad", "especialidad"], "n"
+        )
+        right = self._by_level(self.denominators, ["fecha", "ooad", "medida"], "valor")
+        if left.empty or right.empty:
+            return pd.DataFrame(columns=RATE_COLUMNS)
+        left = left.merge(
+            pd.DataFrame({"medida": right["medida"].unique()}), how="cross"
+        )
+        # Geography names are matched on their canonical key:
+        for frame in (left, right):
+            frame["clave"] = canonical_labels.canonical_key(frame["geografia"])
+            frame["fecha"] = pd.to_datetime(frame["fecha"])
+        right = right.rename(columns={"fecha": "fecha_dir", "valor": "denominador"})
+        right["fecha"] = right["fecha_dir"]
+        joined = pd.merge_asof(
+            left.sort_values("fecha"),
+            right.drop(columns="geografia").sort_values("fecha"),
+            on="fecha",
+            by=["nivel", "clave", "medida"],
+            direction="nearest",
+        )
+        joined["por_mil"] = joined["n"] / joined["denominador"] * 1000
+        joined["por_10mil"] = joined["por_mil"] * 10
+        for col in ("fecha", "fecha_dir"):
+            joined[col] = joined[col].dt.strftime("%Y-%m-%d")
+        return joined[RATE_COLUMNS].sort_values(
+            ["quincena", "nivel", "geografia", "especialidad", "medida"],
+            ignore_index=True,
+        )
+
+    def update_rates(self, path: str) -> pd.DataFrame:
+        """Rewrite the rates table at ``path``, recomputing only the
+        quincenas counted or affected by new denominators since the last
+        call."""
+        stale = self.sources["stale"]
+        current = self.counts["quincena"].unique()
+        if os.path.exists(path):
+            kept = pd.read_csv(
+                path, sep="\t", dtype=str, keep_default_na=False, na_values=[""]
+            )
+            kept = kept[~kept["quincena"].isin(stale) & kept["quincena"].isin(current)]
+            fresh = self.rates(stale)
+            for col in ("n", "denominador", "por_mil", "por_10mil"):
+                kept[col] = pd.to_numeric(kept[col])
+            table = pd.concat([kept, fresh], ignore_index=True).sort_values(
+                ["quincena", "nivel", "geografia", "especialidad", "medida"],
+                ignore_index=True,
+            )
+        else:
+            table = self.rates()
+        table.to_csv(f"{path}.tmp", sep="\t", index=False)
+        os.replace(f"{path}.tmp", path)
+        self.sources["stale"] = []
+        self.save()
+        return table
+
+
+def has_rates(path: str, quincena: str) -> bool:
+    """Whether the rates table at ``path`` has rates with a DIR denominator
+    for ``quincena`` (what ``read_coverage()`` in coverage_load.R needs)."""
+    if not os.path.exists(path):
+        return False
+    table = pd.read_csv(
+        path,
+        sep="\t",
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        usecols=["quincena", "denominador"],
+    )
+    return bool(table.loc[table["quincena"] == quincena, "denominador"].notna().any())
+
+
+def _parse_columns(spec: str) -> Dict[str, str]:
+    """``COL[:MEDIDA],...`` -> ``{COL: MEDIDA}``."""
+    columns = {}
+    for item in spec.split(","):
+        col, _, name = item.partition(":")
+        columns[col] = name or col
+    return columns
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    dens = sub.add_parser("add-denominators", help="Add a DIR table per OOAD")
+    dens.add_argument("--in", dest="infile", required=True)
+    dens.add_argument("--date", help="Cut date (default: YYYY-MM-DD in the name)")
+    dens.add_argument("--geo-column", default="descripcion delegación")
+    dens.add_argument(
+        "--columns",
+        default="total_derechohabientes",
+        help="Comma separated value columns, as COL or COL:MEDIDA",
+    )
+    snaps = sub.add_parser("add-snapshots", help="Count SIAP quincena snapshots")
+    snaps.add_argument("snapshots", nargs="+")
+    snaps.add_argument("--geo-column", default=DEFAULT_GEO_COLUMN)
+    snaps.add_argument("--specialty-column", default=DEFAULT_SPECIALTY_COLUMN)
+    snaps.add_argument("--filter", action="append", default=[], help="COL=VALUE")
+    rates = sub.add_parser("rates", help="Write the rates table")
+    rates.add_argument("--out", required=True)
+    for command in (dens, snaps, rates):
+        command.add_argument("--store", required=True)
+        command.add_argument("--map", help="Persistent label map (.tsv)")
+        command.add_argument("--aliases", help="Alias tables (YAML)")
+    for command in (dens, snaps):
+        command.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args(argv)
+
+    label_map = canonical_labels.LabelMap(
+        args.map, canonical_labels.load_aliases(args.aliases)
+    )
+    engine = CoverageEngine(args.store, label_map)
+    if args.command == "add-denominators":
+        added = engine.add_denominators(
+            args.infile,
+            args.date,
+            args.geo_column,
+            _parse_columns(args.columns),
+            args.encoding,
+        )
+        print(f"{args.infile}: {'added' if added else 'unchanged'}", file=sys.stderr)
+        engine.save()
+    elif args.command == "add-snapshots":
+        filters = dict(spec.split("=", 1) for spec in args.filter)
+        for path in args.snapshots:
+            added = engine.add_snapshot(
+                path,
+                args.geo_column,
+                args.specialty_column,
+                filters,
+                args.encoding,
+            )
+            print(f"{path}: {'counted' if added else 'unchanged'}", file=sys.stderr)
+        engine.save()
+    else:
+        table = engine.update_rates(args.out)
+        print(f"{len(table)} rates written to {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
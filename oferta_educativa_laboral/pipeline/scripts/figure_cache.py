@@ -0,0 +1,179 @@
+"""
+figure_cache
+============
+
+Render de las figuras en cola de los scripts de R (``figure_layer.R``) en
+paralelo y con cache.
+
+Con ``FIGURE_QUEUE`` definido, ``fig_defer()`` no dibuja: escribe en la cola
+una entrada por figura con la porcion de datos que usa (``data.rds``) y su
+especificacion (``spec.json``: codigo de la funcion de graficado, parametros,
+archivo de salida, tamaño). Cada figura se identifica por un hash de sus
+datos, su especificacion y el codigo del render. Las figuras cuya llave no
+cambio se omiten (o se copian desde el cache de resultados, ``build_cache``)
+y el resto se dibuja con ``render_figure.R`` en un grupo de procesos, varias
+figuras por proceso para no pagar el arranque de R por figura. Las entradas
+procesadas se eliminan de la cola.
+
+Uso:
+
+    FIGURE_QUEUE=figure_queue Rscript 3_explore.R ...
+    python figure_cache.py render --queue figure_queue --jobs 8 \\
+        --cache-dir ../../cache
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import build_cache
+except ModuleNotFoundError:  # imported as part of the package (tests)
+    from . import build_cache
+
+SCRIPTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "scripts",
+)
+RENDERER = os.path.join(SCRIPTS_DIR, "render_figure.R")
+FIGURE_LAYER = os.path.join(SCRIPTS_DIR, "figure_layer.R")
+STATE = "rendered.json"
+
+
+def queued_entries(queue: str) -> List[str]:
+    """Queue entries (directories holding ``spec.json``), sorted."""
+    specs = glob.glob(os.path.join(queue, "*", "spec.json"))
+    return sorted(os.path.dirname(s) for s in specs)
+
+
+def read_spec(entry: str) -> dict:
+    with open(os.path.join(entry, "spec.json"), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def figure_key(entry: str, scripts: Sequence[str] = (RENDERER, FIGURE_LAYER)) -> str:
+    """Hash of the data slice, the spec and the rendering code.
+
+    Only the output file name is part of the key, not its directory, so a
+    figure moved to another (e.g. dated) results directory keeps its key.
+    """
+    spec = read_spec(entry)
+    spec["outfile"] = os.path.basename(spec["outfile"])
+    sources = [s for s in spec.get("sources") or [] if os.path.exists(s)]
+    spec["sources"] = [os.path.basename(s) for s in sources]
+    return build_cache.task_key(
+        [os.path.join(entry, "data.rds")],
+        params=spec,
+        scripts=[s for s in scripts if os.path.exists(s)] + sources,
+    )
+
+
+def _load_state(queue: str) -> Dict[str, str]:
+    path = os.path.join(queue, STATE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _save_state(queue: str, state: Dict[str, str]) -> None:
+    path = os.path.join(queue, STATE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as fh:
+        json.dump(state, fh, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _batches(items: List[str], jobs: int) -> List[List[str]]:
+    """Split ``items`` in about two batches per worker."""
+    n = max(1, min(len(items), jobs * 2))
+    return [items[i::n] for i in range(n)]
+
+
+def render_queue(
+    queue: str,
+    jobs: int = 4,
+    cache_dir: Optional[str] = None,
+    renderer: str = RENDERER,
+    rscript: str = "Rscript",
+    keep: bool = False,
+) -> Dict[str, List[str]]:
+    """Render the queued figures that changed.
+
+    Returns the output files by outcome: ``skipped`` (already up to date),
+    ``restored`` (copied from the build cache) and ``rendered``.
+    """
+    entries = queued_entries(queue)
+    state = _load_state(queue)
+    cache = build_cache.BuildCache(cache_dir) if cache_dir else None
+    result: Dict[str, List[str]] = {"skipped": [], "restored": [], "rendered": []}
+    pending = []
+    keys = {}
+    for entry in entries:
+        outfile = read_spec(entry)["outfile"]
+        key = figure_key(entry, (renderer, FIGURE_LAYER))
+        keys[entry] = (key, outfile)
+        if os.path.exists(outfile) and state.get(outfile) == key:
+            # Touched so a stage level cache still counts it as an output.
+            os.utime(outfile)
+            result["skipped"].append(outfile)
+        elif cache is not None and cache.restore(key, os.path.dirname(outfile)):
+            result["restored"].append(outfile)
+        else:
+            pending.append(entry)
+
+    def run(batch: List[str]) -> None:
+        subprocess.run([rscript, renderer, *batch], check=True)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(run, _batches(pending, jobs)))
+    for entry in pending:
+        key, outfile = keys[entry]
+        if cache is not None:
+            cache.store(key, [outfile], os.path.dirname(outfile))
+        result["rendered"].append(outfile)
+
+    for entry in entries:
+        key, outfile = keys[entry]
+        state[outfile] = key
+        if not keep:
+            shutil.rmtree(entry)
+    _save_state(queue, state)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    render = sub.add_parser("render", help="Render the queued figures")
+    render.add_argument("--queue", required=True)
+    render.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    render.add_argument("--cache-dir", help="Shared build cache (build_cache.py)")
+    render.add_argument("--renderer", default=RENDERER)
+    render.add_argument("--rscript", default="Rscript")
+    render.add_argument("--keep", action="store_true", help="Keep queue entries")
+    args = parser.parse_args(argv)
+
+    result = render_queue(
+        args.queue,
+        jobs=args.jobs,
+        cache_dir=args.cache_dir,
+        renderer=args.renderer,
+        rscript=args.rscript,
+        keep=args.keep,
+    )
+    print(
+        ", ".join(f"{len(files)} {outcome}" for outcome, files in result.items()),
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
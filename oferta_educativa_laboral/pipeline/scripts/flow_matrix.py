@@ -0,0 +1,310 @@
+"""
+flow_matrix
+===========
+
+Matrices dispersas de flujos origen -> destino entre dos quincenas del SIAP
+(p.ej. residentes en 2024 -> adscritos en 2025), para las graficas sankey y
+alluvial de ``specific_Qs/trayectoria`` sin volver a unir las tablas por
+persona en cada corrida.
+
+Para cada par de quincenas se calcula una sola vez un cubo de conteos por
+combinacion observada de niveles en ambas quincenas (unidad, OOAD, estado y
+especialidad, columnas ``<nivel>_ant`` / ``<nivel>_act`` como en
+``snapshot_cdc.py``). Las matrices de cada nivel, o entre niveles distintos
+(p.ej. OOAD -> estado), son agregaciones del cubo (:func:`rollup`): unidad ->
+OOAD -> estado. Las personas que solo estan en una de las quincenas aparecen
+como ``(alta)`` o ``(baja)``.
+
+Con ``--cohort`` solo cuentan las personas de una cohorte (p.ej. la de
+egresados del CES de ``CES_UP_trayectoria.R``), para que los flujos sumen lo
+mismo que los demas conteos de esa cohorte; la cohorte usada (numero de
+personas y huella SHA-256 de sus llaves) se guarda en
+``flows_cohort_<ant>__<act>.json``, con la que los scripts sankey verifican
+que los flujos son de sus mismas personas.
+
+Solo se leen la llave y las columnas de los niveles, y las tablas escritas
+(``flows_<nivel>_<ant>__<act>.tsv``, columnas ``origen``, ``destino``, ``n``)
+son del tamano del numero de pares con flujo, no del numero de personas.
+
+Uso:
+
+    python flow_matrix.py --old Qna_17_Plantilla_2024.csv \\
+        --new Qna_07_Plantilla_2025.csv --outdir results/flows \\
+        --filter-ant DESCRIP_CLASCATEG=9.RESIDENTES --cohort cohorte_CES.csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+from scipy import sparse
+
+# Level name -> snapshot column. ``estado`` is derived from the OOAD.
+LEVELS: Dict[str, Optional[str]] = {
+    "unidad": "DEPENDENCIA",
+    "ooad": "DELEGACION",
+    "estado": None,
+    "especialidad": "DESCRIPCION_SERVICIO",
+}
+
+# Geographic levels, finest first; each rolls up into the next.
+HIERARCHY: List[str] = ["unidad", "ooad", "estado"]
+
+DEFAULT_KEY = "CURP"
+ALTA = "(alta)"
+BAJA = "(baja)"
+
+# OOADs splitting a state (Veracruz Norte/Sur, México Oriente/Poniente, ...).
+_OOAD_REGION_RE = re.compile(r"\s+(Norte|Sur|Oriente|Poniente)$", re.IGNORECASE)
+
+
+def ooad_to_state(ooad: pd.Series) -> pd.Series:
+    """Map OOAD names to their state by dropping the region suffix."""
+    return ooad.str.replace(_OOAD_REGION_RE, "", regex=True)
+
+
+def read_levels(
+    path: str,
+    key: str = DEFAULT_KEY,
+    levels: Dict[str, Optional[str]] = LEVELS,
+    filters: Optional[Dict[str, str]] = None,
+    encoding: str = "utf-8",
+    cohort: Optional[set] = None,
+) -> pd.DataFrame:
+    """Read only the key, level and filter columns of a snapshot.
+
+    Returns one row per key with a column per level name. Rows with an empty
+    key, or not in ``cohort`` if given, are dropped and duplicated keys keep
+    their first row.
+    """
+    filters = filters or {}
+    columns = {key, *filters}
+    columns.update(c for c in levels.values() if c)
+    if "estado" in levels and levels["estado"] is None:
+        columns.add(levels["ooad"])
+    df = pd.read_csv(
+        path,
+        dtype=str,
+        keep_default_na=False,
+        usecols=lambda c: c in columns,
+        encoding=encoding,
+    )
+    missing = columns - set(df.columns)
+    if missing:
+        raise KeyError(f"Columns {sorted(missing)} not found in '{path}'")
+    for col, value in filters.items():
+        df = df[df[col] == value]
+    df = df[df[key] != ""].drop_duplicates(key)
+    if cohort is not None:
+        df = df[df[key].isin(cohort)]
+    out = pd.DataFrame({key: df[key]})
+    for name, col in levels.items():
+        if col is None and name == "estado":
+            out[name] = ooad_to_state(df[levels["ooad"]])
+        else:
+            out[name] = df[col]
+    return out.reset_index(drop=True)
+
+
+def flow_cube(
+    old: pd.DataFrame,
+    new: pd.DataFrame,
+    key: str = DEFAULT_KEY,
+    include_unmatched: bool = True,
+) -> pd.DataFrame:
+    """Count people per observed combination of levels in both snapshots.
+
+    ``old`` and ``new`` are frames as returned by :func:`read_levels`. The
+    result has ``<level>_ant`` and ``<level>_act`` columns for every level and
+    a count column ``n``.
+    """
+    levels = [c for c in old.columns if c != key]
+    how = "outer" if include_unmatched else "inner"
+    merged = old.merge(new, on=key, how=how, suffixes=("_ant", "_act"), indicator=True)
+    ant = [f"{c}_ant" for c in levels]
+    act = [f"{c}_act" for c in levels]
+    merged.loc[merged["_merge"] == "right_only", ant] = ALTA
+    merged.loc[merged["_merge"] == "left_only", act] = BAJA
+    cube = merged.groupby(ant + act, sort=False).size().rename("n").reset_index()
+    return cube.sort_values(ant + act, ignore_index=True)
+
+
+def rollup(
+    cube: pd.DataFrame, origin: str, destination: Optional[str] = None
+) -> pd.DataFrame:
+    """Flows from ``origin`` level (old snapshot) to ``destination`` level
+    (new snapshot, defaults to ``origin``) as ``origen``, ``destino``, ``n``.
+
+    Flows of a coarser level are sums of those of any finer one, so e.g. the
+    OOAD matrix equals the unit matrix rolled up by each unit's OOAD.
+    """
+    destination = destination or origin
+    flows = (
+        cube.groupby([f"{origin}_ant", f"{destination}_act"], sort=False)["n"]
+        .sum()
+        .reset_index()
+    )
+    flows.columns = ["origen", "destino", "n"]
+    return flows.sort_values(["n", "origen", "destino"], ascending=[False, True, True])
+
+
+def to_matrix(flows: pd.DataFrame) -> pd.DataFrame:
+    """Origin x destination matrix (sparse columns, zeros not stored), built
+    from the label codes without a dense intermediate."""
+    origin, origins = pd.factorize(flows["origen"], sort=True)
+    destination, destinations = pd.factorize(flows["destino"], sort=True)
+    # Repeated (origin, destination) cells are summed by the conversion:
+    matrix = sparse.coo_matrix(
+        (flows["n"].to_numpy(dtype="int64"), (origin, destination)),
+        shape=(len(origins), len(destinations)),
+    ).tocsc()
+    return pd.DataFrame.sparse.from_spmatrix(
+        matrix,
+        index=pd.Index(origins, name="origen"),
+        columns=pd.Index(destinations, name="destino"),
+    )
+
+
+def flow_tables(levels: Sequence[str]) -> List[tuple]:
+    """(origin, destination) levels of the tables written for ``levels``:
+    each level with itself, and every geographic level against the next
+    coarser one (e.g. ``unidad`` -> ``ooad``)."""
+    tables = [(level, level) for level in levels]
+    geo = [level for level in HIERARCHY if level in levels]
+    return tables + list(zip(geo[:-1], geo[1:]))
+
+
+def output_paths(
+    outdir: str, pair: str, levels: Sequence[str], cohort: bool = False
+) -> List[str]:
+    """Files written for one snapshot pair: the cube, the flow tables and,
+    with a cohort, its manifest."""
+    paths = [os.path.join(outdir, f"flow_cube_{pair}.tsv.gz")]
+    for origin, destination in flow_tables(levels):
+        name = origin if origin == destination else f"{origin}_{destination}"
+        paths.append(os.path.join(outdir, f"flows_{name}_{pair}.tsv"))
+    if cohort:
+        paths.append(os.path.join(outdir, f"flows_cohort_{pair}.json"))
+    return paths
+
+
+def write_flows(
+    cube: pd.DataFrame, outdir: str, pair: str, levels: Sequence[str]
+) -> List[str]:
+    """Write the cube and the per level flow tables (:func:`flow_tables`)
+    for one snapshot pair."""
+    os.makedirs(outdir, exist_ok=True)
+    written = output_paths(outdir, pair, levels)
+    cube.to_csv(written[0], sep="\t", index=False)
+    for (origin, destination), path in zip(flow_tables(levels), written[1:]):
+        rollup(cube, origin, destination).to_csv(path, sep="\t", index=False)
+    return written
+
+
+def read_cohort(path: str, key: str = DEFAULT_KEY, encoding: str = "utf-8") -> set:
+    """Keys in the ``key`` column of a CSV/TSV file."""
+    sep = "\t" if path.endswith((".tsv", ".txt")) else ","
+    cohort = pd.read_csv(
+        path,
+        sep=sep,
+        dtype=str,
+        usecols=[key],
+        keep_default_na=False,
+        encoding=encoding,
+    )
+    return set(cohort[key]) - {""}
+
+
+def cohort_fingerprint(keys: Iterable[str]) -> str:
+    """SHA-256 of the sorted unique keys, one per line (the sankey scripts
+    compute the same over the people they plot)."""
+    return hashlib.sha256("\n".join(sorted(set(keys))).encode("utf-8")).hexdigest()
+
+
+def write_cohort_manifest(path: str, cohort_path: str, cohort: set) -> None:
+    """Record which cohort the flow tables of a pair were computed for."""
+    with open(path, "w") as fh:
+        json.dump(
+            {
+                "cohort": os.path.abspath(cohort_path),
+                "n": len(cohort),
+                "sha256": cohort_fingerprint(cohort),
+            },
+            fh,
+            indent=1,
+        )
+
+
+def _parse_filters(specs: Sequence[str]) -> Dict[str, str]:
+    filters = {}
+    for spec in specs:
+        col, sep, value = spec.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid filter '{spec}', use COL=VALUE")
+        filters[col] = value
+    return filters
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--old", required=True, help="Earlier snapshot CSV")
+    parser.add_argument("--new", required=True, help="Later snapshot CSV")
+    parser.add_argument("--outdir", required=True)
+    parser.add_argument("--key", default=DEFAULT_KEY)
+    parser.add_argument(
+        "--levels",
+        default=",".join(LEVELS),
+        help=f"Comma separated subset of {', '.join(LEVELS)}",
+    )
+    parser.add_argument("--filter-ant", action="append", default=[])
+    parser.add_argument("--filter-act", action="append", default=[])
+    parser.add_argument(
+        "--cohort", help="CSV/TSV whose key column lists the people to count"
+    )
+    parser.add_argument("--no-unmatched", action="store_true")
+    parser.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args(argv)
+
+    names = args.levels.split(",")
+    unknown = set(names) - set(LEVELS)
+    if unknown:
+        parser.error(f"Unknown levels: {sorted(unknown)}")
+    levels = {name: LEVELS[name] for name in names}
+    if "estado" in levels and "ooad" not in levels:
+        levels = {"ooad": LEVELS["ooad"], **levels}
+
+    cohort = read_cohort(args.cohort, args.key) if args.cohort else None
+    old = read_levels(
+        args.old,
+        args.key,
+        levels,
+        _parse_filters(args.filter_ant),
+        args.encoding,
+        cohort,
+    )
+    new = read_levels(
+        args.new,
+        args.key,
+        levels,
+        _parse_filters(args.filter_act),
+        args.encoding,
+        cohort,
+    )
+    cube = flow_cube(old, new, args.key, include_unmatched=not args.no_unmatched)
+    pair = "__".join(os.path.basename(p).split(".")[0] for p in (args.old, args.new))
+    written = write_flows(cube, args.outdir, pair, names)
+    if cohort is not None:
+        manifest = output_paths(args.outdir, pair, names, cohort=True)[-1]
+        write_cohort_manifest(manifest, args.cohort, cohort)
+        written.append(manifest)
+    print(f"{len(cube)} flow cells written to {', '.join(written)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
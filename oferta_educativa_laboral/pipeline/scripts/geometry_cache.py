@@ -0,0 +1,234 @@
+"""
+geometry_cache
+==============
+
+Cache de limites geograficos (OOAD, estados) simplificados a varias
+resoluciones para los mapas.
+
+Cada shapefile (``mexico_OOADs.shp`` y sus archivos ``.dbf``/``.shx``/``.prj``)
+se lee una sola vez y se guarda en GeoParquet (geometrias en WKB) a cada
+tolerancia de ``resolutions``. La simplificacion conserva la topologia: con
+shapely >= 2.1 se simplifica la cobertura completa (``coverage_simplify``),
+asi que los limites compartidos entre OOAD vecinas siguen coincidiendo; con
+versiones anteriores cada poligono se simplifica con ``preserve_topology``.
+Los archivos se guardan bajo un hash del contenido del shapefile y de las
+tolerancias, asi que un shapefile nuevo o tolerancias distintas generan otra
+entrada y una entrada existente no se recalcula.
+
+Los mapas eligen la resolucion segun su tamaño (``full`` para un solo mapa
+grande, ``low`` para paneles pequeños) y leen el GeoParquet con
+``arrow::read_parquet`` + ``sf::st_as_sfc`` en lugar de ``st_read``.
+
+Requiere geopandas y shapely (opcionales, solo para esta etapa).
+
+Estructura:
+
+    <cache_dir>/<nombre>/current.json              entrada vigente
+    <cache_dir>/<nombre>/<hash>/manifest.json
+    <cache_dir>/<nombre>/<hash>/<resolucion>.parquet
+
+Uso:
+
+    python geometry_cache.py build --in mexico_OOADs.shp \\
+        --cache-dir ../../results/geo_cache --resolutions full=0,medium=0.01,low=0.05
+    python geometry_cache.py path --cache-dir ../../results/geo_cache \\
+        --name mexico_OOADs --resolution medium
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+try:  # optional, only needed to build or load the cache
+    import geopandas as gpd
+    import shapely
+except ModuleNotFoundError:  # pragma: no cover - depends on the environment
+    gpd = None
+    shapely = None
+
+try:
+    import build_cache
+except ModuleNotFoundError:  # imported as part of the package (tests)
+    from . import build_cache
+
+# Tolerances in the units of the source CRS (degrees for EPSG:4326).
+DEFAULT_RESOLUTIONS: Dict[str, float] = {
+    "full": 0.0,
+    "high": 0.001,
+    "medium": 0.01,
+    "low": 0.05,
+}
+CURRENT = "current.json"
+MANIFEST = "manifest.json"
+SIDECARS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def _require() -> None:
+    if gpd is None or shapely is None:
+        raise ModuleNotFoundError(
+            "geometry_cache needs geopandas and shapely, install them with "
+            "'pip install geopandas shapely'"
+        )
+
+
+def parse_resolutions(spec: Optional[str]) -> Dict[str, float]:
+    """Parse ``"full=0,medium=0.01"``; empty gives the defaults."""
+    if not spec:
+        return dict(DEFAULT_RESOLUTIONS)
+    resolutions = {}
+    for item in spec.split(","):
+        name, _, tolerance = item.partition("=")
+        if not name.strip() or not tolerance:
+            raise ValueError(f"Resolution '{item}' must be name=tolerance")
+        resolutions[name.strip()] = float(tolerance)
+    return resolutions
+
+
+def source_files(path: str) -> List[str]:
+    """The shapefile and the sidecar files next to it (other formats, e.g.
+    GeoPackage, are a single file)."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    stem, ext = os.path.splitext(path)
+    if ext.lower() != ".shp":
+        return [path]
+    return [f"{stem}{s}" for s in SIDECARS if os.path.exists(f"{stem}{s}")]
+
+
+def source_key(path: str, resolutions: Dict[str, float]) -> str:
+    """Hash of the source contents and the tolerances."""
+    return build_cache.task_key(source_files(path), params=resolutions)
+
+
+def simplify(geometries, tolerance: float):
+    """Simplify a GeoSeries keeping shared boundaries when possible."""
+    if tolerance <= 0:
+        return geometries
+    if hasattr(shapely, "coverage_simplify"):
+        simplified = shapely.coverage_simplify(
+            geometries.to_numpy(), tolerance, simplify_boundary=True
+        )
+        return gpd.GeoSeries(simplified, index=geometries.index, crs=geometries.crs)
+    return geometries.simplify(tolerance, preserve_topology=True)
+
+
+def build(
+    path: str,
+    cache_dir: str,
+    resolutions: Optional[Dict[str, float]] = None,
+    name: Optional[str] = None,
+) -> dict:
+    """Write the simplified versions of ``path`` and return the manifest.
+
+    An entry with the same source hash is reused as is.
+    """
+    resolutions = resolutions or dict(DEFAULT_RESOLUTIONS)
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    key = source_key(path, resolutions)
+    base = os.path.join(cache_dir, name)
+    entry = os.path.join(base, key[:16])
+    manifest_path = os.path.join(entry, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as fh:
+            manifest = json.load(fh)
+    else:
+        _require()
+        tmp = f"{entry}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        gdf = gpd.read_file(path)
+        gdf = gdf[gdf.geometry.notna()].reset_index(drop=True)
+        files, vertices = {}, {}
+        for resolution, tolerance in resolutions.items():
+            out = gdf.set_geometry(simplify(gdf.geometry, tolerance))
+            files[resolution] = f"{key[:16]}/{resolution}.parquet"
+            out.to_parquet(os.path.join(tmp, f"{resolution}.parquet"), index=False)
+            vertices[resolution] = int(shapely.get_num_coordinates(out.geometry).sum())
+        manifest = {
+            "name": name,
+            "source": os.path.basename(path),
+            "key": key,
+            "crs": gdf.crs.to_wkt() if gdf.crs is not None else None,
+            "features": len(gdf),
+            "resolutions": resolutions,
+            "files": files,
+            "vertices": vertices,
+        }
+        with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=1)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    with open(os.path.join(base, CURRENT), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1)
+    return manifest
+
+
+def current(cache_dir: str, name: str) -> dict:
+    """Manifest of the latest cached version of ``name``."""
+    with open(os.path.join(cache_dir, name, CURRENT), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def cached_path(cache_dir: str, name: str, resolution: str = "medium") -> str:
+    """GeoParquet file of ``name`` at ``resolution``."""
+    manifest = current(cache_dir, name)
+    if resolution not in manifest["files"]:
+        raise KeyError(
+            f"Resolution '{resolution}' not cached for {name}, "
+            f"available: {sorted(manifest['files'])}"
+        )
+    return os.path.join(cache_dir, name, manifest["files"][resolution])
+
+
+def load(cache_dir: str, name: str, resolution: str = "medium"):
+    """Read the cached boundaries as a GeoDataFrame."""
+    _require()
+    return gpd.read_parquet(cached_path(cache_dir, name, resolution))
+
+
+def prune(cache_dir: str, name: str) -> List[str]:
+    """Remove entries of ``name`` other than the current one."""
+    keep = current(cache_dir, name)["key"][:16]
+    removed = []
+    for entry in glob.glob(os.path.join(cache_dir, name, "*", MANIFEST)):
+        directory = os.path.dirname(entry)
+        if os.path.basename(directory) != keep:
+            shutil.rmtree(directory)
+            removed.append(directory)
+    return removed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_ = sub.add_parser("build", help="Cache simplified boundaries")
+    build_.add_argument("--in", dest="infile", required=True)
+    build_.add_argument("--name", help="Cache name (default: file name)")
+    build_.add_argument("--resolutions", help="name=tolerance,...")
+    build_.add_argument("--prune", action="store_true", help="Drop older entries")
+    path_ = sub.add_parser("path", help="Print the file of a resolution")
+    path_.add_argument("--name", required=True)
+    path_.add_argument("--resolution", default="medium")
+    for command in (build_, path_):
+        command.add_argument("--cache-dir", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        manifest = build(
+            args.infile, args.cache_dir, parse_resolutions(args.resolutions), args.name
+        )
+        if args.prune:
+            prune(args.cache_dir, manifest["name"])
+        for resolution, vertices in manifest["vertices"].items():
+            print(f"{resolution}: {vertices} vertices", file=sys.stderr)
+    else:
+        print(cached_path(args.cache_dir, args.name, args.resolution))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
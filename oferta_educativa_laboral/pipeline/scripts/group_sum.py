@@ -0,0 +1,230 @@
+"""
+group_sum
+=========
+
+Agregacion por grupos en una sola pasada sobre uno o varios archivos
+delimitados (p.ej. los archivos DIR/PDA de derechohabientes), en paralelo por
+archivo y por bloques de filas. Sustituye a los auxiliares de awk
+``sum_by_first_column.sh``, ``sum_col.sh`` y ``sum_last_column_filtered.sh``.
+
+- ``--by``: columnas de agrupacion (nombres, o indices desde 1 con
+  ``--no-header``; ``last`` es la ultima columna). Sin ``--by`` se obtiene un
+  total general.
+- ``--agg``: agregados ``[nombre=]sum:COL[:COND]`` o ``[nombre=]count[::COND]``,
+  donde ``COND`` es ``COL==valor`` o ``COL!=valor``. Se pueden repetir.
+- ``--filter``: filtros ``COL==valor`` / ``COL!=valor`` aplicados a todas las
+  filas. Se pueden repetir.
+- ``--encoding``: codificacion de los archivos; con ``auto`` se intenta UTF-8
+  y, si falla, cp1252 (como ``accdb_to_csv_encodings_copy.sh``).
+
+Uso (equivalente a ``sum_by_first_column.sh`` y al resumen por OOAD de
+``DIR_PDA_num_derechohabientes.R``):
+
+    python group_sum.py --no-header --by 1 --agg sum_col1=sum:last pda.csv
+    python group_sum.py --by ID_DELEG_RP \\
+        --agg total_derechohabientes=sum:TOT_CASOS \\
+        --agg adscritos_consultorio=sum:TOT_CASOS:ST_CONSULTORIO==1 \\
+        --out pda_sum_OOAD.tsv pda-2025-03-31.csv
+"""
+
+import argparse
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+
+_COND_RE = re.compile(r"^(?P<col>.+?)(?P<op>==|!=)(?P<value>.*)$")
+
+
+class Condition(NamedTuple):
+    column: str
+    op: str
+    value: str
+
+
+class Aggregate(NamedTuple):
+    name: str
+    func: str
+    column: Optional[str]
+    condition: Optional[Condition]
+
+
+def parse_condition(spec: str) -> Condition:
+    """Parse ``COL==value`` or ``COL!=value``."""
+    match = _COND_RE.match(spec)
+    if not match:
+        raise ValueError(f"Invalid condition '{spec}', use COL==value or COL!=value")
+    return Condition(match["col"], match["op"], match["value"])
+
+
+def parse_aggregate(spec: str) -> Aggregate:
+    """Parse ``[name=]sum:COL[:COND]`` or ``[name=]count[::COND]``."""
+    head, _, rest = spec.partition(":")
+    name, _, func = head.rpartition("=")
+    column, _, cond = rest.partition(":")
+    if func not in ("sum", "count"):
+        raise ValueError(f"Unknown aggregate '{func}' in '{spec}'")
+    if func == "sum" and not column:
+        raise ValueError(f"sum needs a column: '{spec}'")
+    condition = parse_condition(cond) if cond else None
+    if not name:
+        name = f"{func}_{column}" if column else func
+    return Aggregate(name, func, column or None, condition)
+
+
+def _resolve(column: str, columns: Sequence) -> object:
+    """Map a column reference (name, 1-based index or ``last``) to a label."""
+    if column == "last":
+        return columns[-1]
+    if column in columns:
+        return column
+    if column.isdigit() and int(column) - 1 < len(columns):
+        return columns[int(column) - 1]
+    raise KeyError(f"Column '{column}' not found")
+
+
+def _mask(chunk: pd.DataFrame, condition: Condition) -> pd.Series:
+    values = chunk[_resolve(condition.column, chunk.columns)]
+    if condition.op == "==":
+        return values == condition.value
+    return values != condition.value
+
+
+def aggregate_chunk(
+    chunk: pd.DataFrame,
+    by: Sequence[str],
+    aggregates: Sequence[Aggregate],
+    filters: Sequence[Condition] = (),
+) -> pd.DataFrame:
+    """Return partial sums/counts of ``chunk`` indexed by the group columns."""
+    for condition in filters:
+        chunk = chunk[_mask(chunk, condition)]
+    by_labels = [_resolve(c, chunk.columns) for c in by]
+    data = {label: chunk[label] for label in by_labels}
+    for agg in aggregates:
+        if agg.func == "sum":
+            values = pd.to_numeric(
+                chunk[_resolve(agg.column, chunk.columns)], errors="coerce"
+            ).fillna(0)
+        else:
+            values = pd.Series(1, index=chunk.index)
+        if agg.condition is not None:
+            values = values.where(_mask(chunk, agg.condition), 0)
+        data[agg.name] = values
+    frame = pd.DataFrame(data)
+    if not by_labels:
+        return frame[[a.name for a in aggregates]].sum().to_frame().T
+    partial = frame.groupby(by_labels, dropna=False, sort=False).sum()
+    partial.index.names = [str(c) for c in by]
+    return partial
+
+
+def aggregate_file(
+    path: str,
+    by: Sequence[str],
+    aggregates: Sequence[Aggregate],
+    filters: Sequence[Condition] = (),
+    delimiter: str = "|",
+    header: bool = True,
+    encoding: str = "auto",
+    chunksize: int = 500_000,
+) -> pd.DataFrame:
+    """Stream ``path`` in chunks and return its aggregated partial result."""
+    encodings: Tuple[str, ...] = (
+        ("utf-8", "cp1252") if encoding == "auto" else (encoding,)
+    )
+    for i, enc in enumerate(encodings):
+        try:
+            reader = pd.read_csv(
+                path,
+                sep=delimiter,
+                header=0 if header else None,
+                dtype=str,
+                keep_default_na=False,
+                chunksize=chunksize,
+                encoding=enc,
+                engine="c",
+            )
+            partials = []
+            for chunk in reader:
+                if not header:
+                    chunk.columns = [str(c + 1) for c in chunk.columns]
+                partials.append(aggregate_chunk(chunk, by, aggregates, filters))
+            return combine(partials, by)
+        except UnicodeDecodeError:
+            if i == len(encodings) - 1:
+                raise
+    raise AssertionError("unreachable")
+
+
+def combine(partials: List[pd.DataFrame], by: Sequence[str]) -> pd.DataFrame:
+    """Merge partial aggregates (sums and counts add up)."""
+    partials = [p for p in partials if len(p)]
+    if not partials:
+        return pd.DataFrame()
+    merged = pd.concat(partials)
+    if not by:
+        return merged.sum().to_frame().T
+    return merged.groupby(level=list(range(len(by))), dropna=False, sort=True).sum()
+
+
+def aggregate_files(
+    paths: Sequence[str],
+    by: Sequence[str],
+    aggregates: Sequence[Aggregate],
+    filters: Sequence[Condition] = (),
+    jobs: int = 1,
+    **kwargs,
+) -> pd.DataFrame:
+    """Aggregate several files, one worker process per file when ``jobs > 1``.
+
+    Returns a frame with one row per group (sorted by the group columns) and
+    one column per aggregate.
+    """
+    args = [(p, by, aggregates, filters) for p in paths]
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(aggregate_file, *a, **kwargs) for a in args]
+            partials = [f.result() for f in futures]
+    else:
+        partials = [aggregate_file(*a, **kwargs) for a in args]
+    result = combine(partials, by)
+    if by:
+        result = result.reset_index()
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("files", nargs="+", help="Delimited input files")
+    parser.add_argument("--by", default="", help="Comma separated group columns")
+    parser.add_argument("--agg", action="append", default=[], help="Aggregate spec")
+    parser.add_argument("--filter", action="append", default=[], help="Row filter")
+    parser.add_argument("-d", "--delim", default="|", help="Field delimiter")
+    parser.add_argument("--no-header", action="store_true")
+    parser.add_argument("--encoding", default="auto")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    parser.add_argument("--out", help="Output file (tab separated), default stdout")
+    args = parser.parse_args(argv)
+
+    aggregates = [parse_aggregate(a) for a in args.agg] or [parse_aggregate("n=count")]
+    result = aggregate_files(
+        args.files,
+        by=[c for c in args.by.split(",") if c],
+        aggregates=aggregates,
+        filters=[parse_condition(f) for f in args.filter],
+        jobs=args.jobs,
+        delimiter=args.delim,
+        header=not args.no_header,
+        encoding=args.encoding,
+        chunksize=args.chunksize,
+    )
+    result.to_csv(args.out or sys.stdout, sep="\t", index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+history_lookup
+==============
+
+Busqueda puntual de personas en el historico de quincenas del SIAP ("¿donde
+estaba la MATRICULA X en cada quincena?") sin cargar las tablas completas.
+
+Cada quincena se indexa una vez (``build``) en una particion ordenada por la
+llave (``CURP``) y dividida en grupos de filas. El ``manifest.json`` de cada
+particion guarda, por grupo, el minimo y maximo de ``CURP``, ``MATRICULA`` y
+``NSS``, y ``bloom_<columna>.npy`` un filtro de Bloom por grupo y columna. Una
+busqueda descarta grupos con los min/max (busqueda binaria sobre la llave
+ordenada) y con los filtros de Bloom, y solo lee los pocos grupos que pueden
+contener el identificador, asi que tarda milisegundos por quincena.
+
+Estructura del indice:
+
+    <index_dir>/<quincena>/manifest.json
+    <index_dir>/<quincena>/rg_00000.csv.gz ...   grupos de filas
+    <index_dir>/<quincena>/bloom_CURP.npy ...    filtros de Bloom
+
+Uso:
+
+    python history_lookup.py build --in Qna_07_Plantilla_2025.csv \\
+        --index-dir ../../results/history_index
+    python history_lookup.py get --index-dir ../../results/history_index \\
+        --column MATRICULA 99123456
+    python history_lookup.py batch --index-dir ../../results/history_index \\
+        --column CURP --ids curps.txt --out trayectorias.tsv
+"""
+
+import argparse
+import bisect
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import math
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    import snapshot_cdc
+except ModuleNotFoundError:  # imported as part of the package (tests)
+    from . import snapshot_cdc
+
+LOOKUP_COLUMNS: List[str] = ["CURP", "MATRICULA", "NSS"]
+DEFAULT_KEY = "CURP"
+SNAPSHOT_COL = "QUINCENA"
+MANIFEST = "manifest.json"
+
+
+def bloom_parameters(n: int, fpp: float) -> tuple:
+    """Bits per filter and number of hash functions for ``n`` items."""
+    n = max(n, 1)
+    bits = max(64, int(math.ceil(-n * math.log(fpp) / math.log(2) ** 2)))
+    bits = (bits + 7) // 8 * 8
+    hashes = max(1, int(round(bits / n * math.log(2))))
+    return bits, hashes
+
+
+def bloom_positions(value: str, bits: int, hashes: int) -> np.ndarray:
+    """Bit positions of ``value`` (double hashing on a BLAKE2b digest)."""
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return np.array([(h1 + i * h2) % bits for i in range(hashes)], dtype=np.int64)
+
+
+def bloom_build(values: Iterable[str], bits: int, hashes: int) -> np.ndarray:
+    """Return a packed bit array (``uint8``) with ``values`` inserted."""
+    filt = np.zeros(bits, dtype=bool)
+    for value in values:
+        if value:
+            filt[bloom_positions(value, bits, hashes)] = True
+    return np.packbits(filt)
+
+
+def bloom_contains(packed: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Test ``positions`` against filters ``packed`` (one per row).
+
+    Returns a boolean array with one entry per filter.
+    """
+    bytes_ = packed[:, positions >> 3]
+    masks = (np.uint8(0x80) >> (positions & 7).astype(np.uint8)).astype(np.uint8)
+    return np.all(bytes_ & masks, axis=1)
+
+
+def build_partition(
+    path: str,
+    index_dir: str,
+    key: str = DEFAULT_KEY,
+    columns: Sequence[str] = LOOKUP_COLUMNS,
+    row_group_size: int = 5000,
+    fpp: float = 0.01,
+    encoding: str = "utf-8",
+) -> str:
+    """Index one snapshot CSV and return the path of its manifest.
+
+    Rows are sorted by ``key`` and split into groups of ``row_group_size``
+    rows; every column of the snapshot is kept.
+    """
+    snapshot = os.path.basename(path).split(".")[0]
+    outdir = os.path.join(index_dir, snapshot)
+    os.makedirs(outdir, exist_ok=True)
+    for stale in glob.glob(os.path.join(outdir, "rg_*.csv.gz")):
+        os.remove(stale)
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, encoding=encoding)
+    missing = [c for c in {key, *columns} if c not in df.columns]
+    if missing:
+        raise KeyError(f"Columns {missing} not found in '{path}'")
+    df = df.sort_values(key, kind="stable", ignore_index=True)
+
+    bits, hashes = bloom_parameters(row_group_size, fpp)
+    groups = []
+    blooms: Dict[str, List[np.ndarray]] = {c: [] for c in columns}
+    for i, start in enumerate(range(0, len(df), row_group_size)):
+        group = df.iloc[start : start + row_group_size]
+        name = f"rg_{i:05d}.csv.gz"
+        group.to_csv(os.path.join(outdir, name), index=False)
+        stats = {"file": name, "rows": len(group), "min": {}, "max": {}}
+        for col in columns:
+            present = group[col][group[col] != ""]
+            stats["min"][col] = present.min() if len(present) else None
+            stats["max"][col] = present.max() if len(present) else None
+            blooms[col].append(bloom_build(present, bits, hashes))
+        groups.append(stats)
+    for col in columns:
+        packed = np.array(blooms[col], dtype=np.uint8).reshape(len(groups), bits // 8)
+        np.save(os.path.join(outdir, f"bloom_{col}.npy"), packed)
+
+    manifest = {
+        "snapshot": snapshot,
+        "source": os.path.basename(path),
+        "key": key,
+        "columns": list(columns),
+        "rows": len(df),
+        "bloom": {"bits": bits, "hashes": hashes, "fpp": fpp},
+        "row_groups": groups,
+    }
+    manifest_path = os.path.join(outdir, MANIFEST)
+    with open(manifest_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1)
+    return manifest_path
+
+
+class Partition:
+    """One indexed quincena, see :func:`build_partition`."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as fh:
+            self.manifest = json.load(fh)
+        self.snapshot: str = self.manifest["snapshot"]
+        self.key: str = self.manifest["key"]
+        groups = self.manifest["row_groups"]
+        self._mins = {
+            c: [g["min"][c] for g in groups] for c in self.manifest["columns"]
+        }
+        self._maxs = {
+            c: [g["max"][c] for g in groups] for c in self.manifest["columns"]
+        }
+        self._blooms: Dict[str, np.ndarray] = {}
+
+    def _bloom(self, column: str) -> np.ndarray:
+        if column not in self._blooms:
+            path = os.path.join(self.directory, f"bloom_{column}.npy")
+            self._blooms[column] = np.load(path)
+        return self._blooms[column]
+
+    def candidate_groups(self, column: str, value: str) -> List[int]:
+        """Row groups that may hold ``value`` in ``column``."""
+        if column not in self._mins:
+            raise KeyError(f"Column '{column}' is not indexed in {self.snapshot}")
+        mins, maxs = self._mins[column], self._maxs[column]
+        if column == self.key:
+            # Sorted layout: groups overlapping value are contiguous.
+            lo = bisect.bisect_left([m or "" for m in maxs], value)
+            hi = bisect.bisect_right([m or "" for m in mins], value)
+            candidates = range(lo, hi)
+        else:
+            candidates = (
+                i
+                for i, (lo, hi) in enumerate(zip(mins, maxs))
+                if lo is not None and lo <= value <= hi
+            )
+        candidates = list(candidates)
+        if not candidates:
+            return []
+        bloom = self.manifest["bloom"]
+        positions = bloom_positions(value, bloom["bits"], bloom["hashes"])
+        hits = bloom_contains(self._bloom(column)[candidates], positions)
+        return [g for g, hit in zip(candidates, hits) if hit]
+
+    def read_group(self, index: int) -> List[Dict[str, str]]:
+        name = self.manifest["row_groups"][index]["file"]
+        with gzip.open(os.path.join(self.directory, name), "rt", newline="") as fh:
+            return list(csv.DictReader(fh))
+
+    def lookup_many(self, column: str, values: Iterable[str]) -> List[Dict[str, str]]:
+        """Records whose ``column`` is in ``values``; each group is read once."""
+        wanted = set(values)
+        groups = sorted({g for v in wanted for g in self.candidate_groups(column, v)})
+        found = []
+        for g in groups:
+            for row in self.read_group(g):
+                if row[column] in wanted:
+                    found.append({SNAPSHOT_COL: self.snapshot, **row})
+        return found
+
+
+class HistoryIndex:
+    """All indexed quincenas below ``index_dir``, in chronological order.
+
+    Examples
+    --------
+    >>> index = HistoryIndex("../../results/history_index")  # doctest: +SKIP
+    >>> index.lookup("99123456", column="MATRICULA")  # doctest: +SKIP
+    """
+
+    def __init__(self, index_dir: str) -> None:
+        manifests = glob.glob(os.path.join(index_dir, "*", MANIFEST))
+        directories = [os.path.dirname(m) for m in manifests]
+        try:
+            directories.sort(key=snapshot_cdc.snapshot_order)
+        except ValueError:
+            directories.sort()
+        self.partitions = [Partition(d) for d in directories]
+
+    def lookup_many(
+        self, values: Iterable[str], column: str = DEFAULT_KEY
+    ) -> pd.DataFrame:
+        """Records of every value in ``values`` across all quincenas.
+
+        Returns a frame with a ``QUINCENA`` column followed by the snapshot
+        columns, ordered by quincena.
+        """
+        values = [v for v in dict.fromkeys(values) if v]
+        rows = []
+        for partition in self.partitions:
+            rows.extend(partition.lookup_many(column, values))
+        return pd.DataFrame(rows)
+
+    def lookup(self, value: str, column: str = DEFAULT_KEY) -> pd.DataFrame:
+        """Records of a single identifier across all quincenas."""
+        return self.lookup_many([value], column)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Index a snapshot CSV")
+    build.add_argument("--in", dest="infile", required=True)
+    build.add_argument("--index-dir", required=True)
+    build.add_argument("--key", default=DEFAULT_KEY)
+    build.add_argument("--columns", default=",".join(LOOKUP_COLUMNS))
+    build.add_argument("--row-group-size", type=int, default=5000)
+    build.add_argument("--fpp", type=float, default=0.01)
+    build.add_argument("--encoding", default="utf-8")
+
+    get = sub.add_parser("get", help="Look up identifiers")
+    get.add_argument("values", nargs="+")
+    batch = sub.add_parser("batch", help="Look up identifiers listed in a file")
+    batch.add_argument("--ids", required=True, help="One identifier per line")
+    for command in (get, batch):
+        command.add_argument("--index-dir", required=True)
+        command.add_argument("--column", default=DEFAULT_KEY)
+        command.add_argument("--out", help="Output file (tab separated)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        manifest = build_partition(
+            args.infile,
+            args.index_dir,
+            key=args.key,
+            columns=args.columns.split(","),
+            row_group_size=args.row_group_size,
+            fpp=args.fpp,
+            encoding=args.encoding,
+        )
+        print(f"Index written to {manifest}", file=sys.stderr)
+        return 0
+
+    if args.command == "batch":
+        with open(args.ids, encoding="utf-8") as fh:
+            values = [line.strip() for line in fh]
+    else:
+        values = args.values
+    found = HistoryIndex(args.index_dir).lookup_many(values, args.column)
+    found.to_csv(args.out or sys.stdout, sep="\t", index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+ingest_watch
+============
+
+Modo vigilancia para la ingesta de bases ``.accdb`` nuevas o modificadas.
+
+Observa el directorio de datos con inotify (Linux), espera a que cada archivo
+termine de escribirse (tamaño y fecha estables) y lo pone en una cola. Cada
+archivo en cola se procesa ejecutando el pipeline restringido a ese archivo
+(variable ``OFERTA_ACCDB_FILES``), de modo que solo corren las tareas de
+conversion y analisis afectadas. El estado de la cola se guarda en un JSON
+que se puede consultar con ``status``.
+
+Si inotify no esta disponible (p.ej. macOS) se usa un sondeo periodico del
+directorio.
+
+Uso:
+
+    python ingest_watch.py watch --data-dir ../../data \\
+        --status ../../results/ingest_queue.json
+    python ingest_watch.py status --status ../../results/ingest_queue.json
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import os
+import select
+import shlex
+import struct
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# inotify constants, see inotify(7):
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+DEFAULT_PATTERN = "*.accdb"
+# The pipeline lives one directory above this script, wherever it is run from:
+DEFAULT_COMMAND = "python {} make full -v5".format(
+    shlex.quote(
+        os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "pipeline_oferta_laboral.py",
+        )
+    )
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Inotify:
+    """Minimal ctypes wrapper around the Linux inotify API."""
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, str] = {}
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {path}")
+        self._watches[wd] = path
+        return wd
+
+    def read_paths(self, timeout: float) -> List[str]:
+        """Return the paths with events, waiting at most ``timeout`` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        return parse_events(buf, self._watches)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def parse_events(buf: bytes, watches: Dict[int, str]) -> List[str]:
+    """Decode a raw inotify read buffer into full file paths."""
+    paths = []
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(buf):
+        wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+        offset += _EVENT_HEADER.size
+        name = buf[offset : offset + length].rstrip(b"\0")
+        offset += length
+        if name and wd in watches:
+            paths.append(os.path.join(watches[wd], os.fsdecode(name)))
+    return paths
+
+
+def file_signature(path: str) -> Optional[tuple]:
+    """Return ``(size, mtime_ns)`` for ``path`` or ``None`` if it vanished."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class StabilityTracker:
+    """Track candidate files until their size and mtime stop changing.
+
+    A file is considered fully written once its signature has been identical
+    for ``settle`` seconds. The time of its first event is kept so that the
+    queue latency includes the wait.
+    """
+
+    def __init__(self, settle: float = 30.0) -> None:
+        self.settle = settle
+        self._pending: Dict[str, tuple] = {}
+
+    def touch(self, path: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        first = self._pending[path][2] if path in self._pending else now
+        self._pending[path] = (file_signature(path), now, first)
+
+    def stable_since(self, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Return and forget the candidates that are now stable, with the time
+        of their first event."""
+        now = time.time() if now is None else now
+        ready = []
+        for path, (signature, since, first) in list(self._pending.items()):
+            current = file_signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current != signature:
+                self._pending[path] = (current, now, first)
+            elif now - since >= self.settle:
+                ready.append((path, first))
+                del self._pending[path]
+        return ready
+
+    def stable(self, now: Optional[float] = None) -> List[str]:
+        """Return and forget the candidates that are now stable."""
+        return [path for path, _ in self.stable_since(now)]
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class IngestQueue:
+    """First in, first out job queue persisted as JSON in ``status_file``."""
+
+    def __init__(self, status_file: str) -> None:
+        self.status_file = status_file
+        self.jobs: List[dict] = []
+        if os.path.exists(status_file):
+            with open(status_file) as fh:
+                self.jobs = json.load(fh).get("jobs", [])
+
+    def save(self) -> None:
+        tmp = f"{self.status_file}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump({"updated_at": time.time(), "jobs": self.jobs}, fh, indent=2)
+        os.replace(tmp, self.status_file)
+
+    def enqueue(self, path: str, detected_at: Optional[float] = None) -> bool:
+        """Queue ``path`` unless it is already waiting. Returns ``True`` if added."""
+        if any(j["file"] == path and j["state"] == QUEUED for j in self.jobs):
+            return False
+        self.jobs.append(
+            {
+                "file": path,
+                "state": QUEUED,
+                "detected_at": time.time() if detected_at is None else detected_at,
+                "started_at": None,
+                "finished_at": None,
+                "latency_s": None,
+                "returncode": None,
+            }
+        )
+        self.save()
+        return True
+
+    def next_job(self) -> Optional[dict]:
+        return next((j for j in self.jobs if j["state"] == QUEUED), None)
+
+    def mark(self, job: dict, state: str, returncode: Optional[int] = None) -> None:
+        now = time.time()
+        job["state"] = state
+        if state == RUNNING:
+            job["started_at"] = now
+        else:
+            job["finished_at"] = now
+            job["latency_s"] = round(now - job["detected_at"], 1)
+            job["returncode"] = returncode
+        self.save()
+
+    def summary(self) -> Dict[str, int]:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in self.jobs:
+            counts[job["state"]] += 1
+        return counts
+
+
+def start_job(job: dict, command: str, cwd: Optional[str] = None) -> subprocess.Popen:
+    """Launch ``command`` restricted to the job's file via ``OFERTA_ACCDB_FILES``."""
+    env = dict(os.environ, OFERTA_ACCDB_FILES=job["file"])
+    return subprocess.Popen(shlex.split(command), cwd=cwd, env=env)
+
+
+def _scan(data_dir: str, pattern: str) -> Dict[str, tuple]:
+    return {
+        os.path.join(data_dir, f): file_signature(os.path.join(data_dir, f))
+        for f in os.listdir(data_dir)
+        if fnmatch.fnmatch(f, pattern)
+    }
+
+
+def watch(
+    data_dir: str,
+    status_file: str,
+    command: str = DEFAULT_COMMAND,
+    pattern: str = DEFAULT_PATTERN,
+    settle: float = 30.0,
+    poll: float = 5.0,
+    cwd: Optional[str] = None,
+    max_iterations: Optional[int] = None,
+) -> None:
+    """Watch ``data_dir`` and run ``command`` once per new or changed file.
+
+    Jobs run one at a time so that concurrent pipeline runs do not compete
+    for the same outputs; files delivered meanwhile wait in the queue.
+    """
+    data_dir = os.path.abspath(data_dir)
+    queue = IngestQueue(status_file)
+    tracker = StabilityTracker(settle)
+    try:
+        notifier: Optional[Inotify] = Inotify()
+        notifier.add_watch(data_dir)
+    except OSError as exc:
+        print(f"inotify unavailable ({exc}), polling every {poll}s", file=sys.stderr)
+        notifier = None
+    known = _scan(data_dir, pattern)
+    running: Optional[tuple] = None
+    iteration = 0
+    # Jobs left running by a previous daemon are retried:
+    for job in queue.jobs:
+        if job["state"] == RUNNING:
+            job["state"] = QUEUED
+    queue.save()
+
+    while max_iterations is None or iteration < max_iterations:
+        iteration += 1
+        if notifier is not None:
+            changed = notifier.read_paths(timeout=poll)
+        else:
+            time.sleep(poll)
+            current = _scan(data_dir, pattern)
+            changed = [p for p, sig in current.items() if known.get(p) != sig]
+            known = current
+        for path in changed:
+            if fnmatch.fnmatch(os.path.basename(path), pattern):
+                tracker.touch(path)
+        for path, first_event in tracker.stable_since():
+            if queue.enqueue(path, detected_at=first_event):
+                print(f"Queued {path}", file=sys.stderr)
+
+        if running is not None:
+            job, proc = running
+            if proc.poll() is not None:
+                state = DONE if proc.returncode == 0 else FAILED
+                queue.mark(job, state, proc.returncode)
+                print(f"{state}: {job['file']} ({job['latency_s']}s)", file=sys.stderr)
+                running = None
+        if running is None:
+            job = queue.next_job()
+            if job is not None:
+                queue.mark(job, RUNNING)
+                running = (job, start_job(job, command, cwd))
+
+    if running is not None:
+        job, proc = running
+        proc.wait()
+        queue.mark(job, DONE if proc.returncode == 0 else FAILED, proc.returncode)
+    if notifier is not None:
+        notifier.close()
+
+
+def print_status(status_file: str) -> None:
+    queue = IngestQueue(status_file)
+    print("\t".join(f"{k}={v}" for k, v in queue.summary().items()))
+    for job in queue.jobs:
+        print(f"{job['state']}\t{job['latency_s']}\t{job['file']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_watch = sub.add_parser("watch", help="Run the ingest daemon")
+    p_watch.add_argument("--data-dir", default="../../data")
+    p_watch.add_argument("--status", required=True, help="Queue status JSON")
+    p_watch.add_argument("--command", default=DEFAULT_COMMAND)
+    p_watch.add_argument("--pattern", default=DEFAULT_PATTERN)
+    p_watch.add_argument(
+        "--settle",
+        type=float,
+        default=30.0,
+        help="Seconds a file must stay unchanged before it is queued",
+    )
+    p_watch.add_argument("--poll", type=float, default=5.0)
+    p_status = sub.add_parser("status", help="Print the queue status")
+    p_status.add_argument("--status", required=True, help="Queue status JSON")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "status":
+        print_status(args.status)
+        return 0
+    watch(
+        args.data_dir,
+        args.status,
+        command=args.command,
+        pattern=args.pattern,
+        settle=args.settle,
+        poll=args.poll,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+quality_rules
+=============
+
+Motor de reglas de calidad de datos para las tablas del SIAP.
+
+Las reglas se declaran en un YAML (ver ``configuration/quality_rules.yml``):
+rangos numericos, formatos por expresion regular (``CURP``, ``RFC``, ``NSS``),
+rangos y orden de fechas, valores obligatorios y referencias contra el
+catalogo de unidades. Todas las reglas se evaluan como operaciones vectoriales
+por columna en una sola lectura del archivo (por bloques de filas), y se
+escribe un resumen por regla y la lista de filas que violan cada regla.
+
+Uso:
+
+    python quality_rules.py --in Qna_15_Plantilla_2025.csv \\
+        --rules ../configuration/quality_rules.yml \\
+        --summary quality_summary.tsv --violations quality_violations.tsv.gz
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import warnings
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import yaml
+
+NA_VALUES = ["", "NA"]
+
+RULE_TYPES = ("range", "regex", "date_range", "date_order", "reference", "not_null")
+
+# Date formats tried in order (SIAP writes dd/mm/yyyy, mdb-export ISO dates);
+# override with date_formats in the rules file or in a rule:
+DATE_FORMATS = ["%d/%m/%Y", "%Y-%m-%d"]
+
+
+def load_rules(path: str) -> dict:
+    """Read and validate a rules YAML file.
+
+    Relative ``catalog`` paths are resolved against the rules file's
+    directory.
+    """
+    with open(path, encoding="utf-8") as fh:
+        config = yaml.safe_load(fh) or {}
+    names = set()
+    for rule in config.get("rules", []):
+        if rule.get("type") not in RULE_TYPES:
+            raise ValueError(f"Rule {rule.get('name')!r} has unknown type")
+        if rule.get("name") in names or not rule.get("name"):
+            raise ValueError(f"Rule names must be unique and set: {rule.get('name')}")
+        names.add(rule["name"])
+        if rule.get("catalog"):
+            rule["catalog"] = os.path.join(
+                os.path.dirname(os.path.abspath(path)), rule["catalog"]
+            )
+    return config
+
+
+def rule_columns(rule: dict) -> List[str]:
+    """Columns a rule reads."""
+    if rule["type"] == "date_order":
+        return [rule["before"], rule["after"]]
+    if "columns" in rule:
+        return list(rule["columns"])
+    return [rule["column"]]
+
+
+def _years_from_today(years: float) -> pd.Timestamp:
+    return pd.Timestamp(datetime.date.today()) + pd.DateOffset(
+        days=int(round(years * 365.25))
+    )
+
+
+def _to_dates(values: pd.Series, formats: Sequence[str] = DATE_FORMATS) -> pd.Series:
+    """Parse ``values`` with each of ``formats`` in turn (vectorized); values
+    matching none are ``NaT``."""
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for fmt in formats:
+        missing = dates.isna() & values.notna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(
+            values[missing], errors="coerce", format=fmt, exact=False
+        )
+    return dates
+
+
+def _check_range(values: pd.Series, rule: dict) -> np.ndarray:
+    numbers = pd.to_numeric(values, errors="coerce")
+    bad = numbers.isna() & values.notna()
+    if rule.get("min") is not None:
+        bad |= numbers < rule["min"]
+    if rule.get("max") is not None:
+        bad |= numbers > rule["max"]
+    return bad.to_numpy()
+
+
+def _check_regex(values: pd.Series, rule: dict) -> np.ndarray:
+    matches = values.str.fullmatch(rule["pattern"])
+    return (values.notna() & ~matches.fillna(False).astype(bool)).to_numpy()
+
+
+def _check_date_range(
+    values: pd.Series, rule: dict, formats: Sequence[str] = DATE_FORMATS
+) -> np.ndarray:
+    dates = _to_dates(values, formats)
+    bad = dates.isna() & values.notna()
+    lower = pd.Timestamp(rule["min"]) if rule.get("min") else None
+    if rule.get("min_years_ago") is not None:
+        lower = _years_from_today(-rule["min_years_ago"])
+    upper = pd.Timestamp(rule["max"]) if rule.get("max") else None
+    if rule.get("max_years_ahead") is not None:
+        upper = _years_from_today(rule["max_years_ahead"])
+    if lower is not None:
+        bad |= dates < lower
+    if upper is not None:
+        bad |= dates > upper
+    return bad.to_numpy()
+
+
+class RuleEngine:
+    """Evaluate a set of rules over successive chunks of a table.
+
+    Parameters
+    ----------
+    config:
+        Parsed rules file, see :func:`load_rules`.
+    """
+
+    def __init__(self, config: dict) -> None:
+        self.rules: List[dict] = config.get("rules", [])
+        self.id_column: Optional[str] = config.get("id_column")
+        self.date_formats: List[str] = config.get("date_formats") or DATE_FORMATS
+        self._catalogs: Dict[str, Optional[set]] = {}
+        self.summary: Dict[str, dict] = {
+            r["name"]: {
+                "rule": r["name"],
+                "type": r["type"],
+                "columns": ",".join(rule_columns(r)),
+                "n_checked": 0,
+                "n_violations": 0,
+                "status": "ok",
+            }
+            for r in self.rules
+        }
+
+    def _catalog(self, rule: dict) -> Optional[set]:
+        path = rule["catalog"]
+        if path not in self._catalogs:
+            if os.path.exists(path):
+                catalog = pd.read_csv(path, dtype=str, usecols=[rule["catalog_column"]])
+                self._catalogs[path] = set(catalog[rule["catalog_column"]].dropna())
+            else:
+                warnings.warn(f"Catalog '{path}' of rule {rule['name']!r} not found")
+                self._catalogs[path] = None
+        return self._catalogs[path]
+
+    def _violations(self, chunk: pd.DataFrame, rule: dict) -> Optional[np.ndarray]:
+        """Boolean mask of violating rows, or ``None`` if the rule is skipped."""
+        columns = rule_columns(rule)
+        if any(c not in chunk.columns for c in columns):
+            self.summary[rule["name"]]["status"] = "skipped: column missing"
+            return None
+        kind = rule["type"]
+        formats = rule.get("date_formats") or self.date_formats
+        if kind == "date_order":
+            before = _to_dates(chunk[rule["before"]], formats)
+            after = _to_dates(chunk[rule["after"]], formats)
+            return (before > after).to_numpy()
+        if kind == "reference":
+            catalog = self._catalog(rule)
+            if catalog is None:
+                self.summary[rule["name"]]["status"] = "skipped: catalog missing"
+                return None
+            values = chunk[columns[0]]
+            return (values.notna() & ~values.isin(catalog)).to_numpy()
+        check = {
+            "range": _check_range,
+            "regex": _check_regex,
+            "date_range": lambda values, rule: _check_date_range(
+                values, rule, formats
+            ),
+            "not_null": lambda values, _rule: values.isna().to_numpy(),
+        }[kind]
+        bad = np.zeros(len(chunk), dtype=bool)
+        for col in columns:
+            bad |= check(chunk[col], rule)
+        return bad
+
+    def evaluate(self, chunk: pd.DataFrame, first_row: int = 1) -> pd.DataFrame:
+        """Evaluate all rules on ``chunk`` and return its violations.
+
+        ``first_row`` is the 1-based data row number of the chunk's first row.
+        The returned frame has ``rule``, ``row`` and (if configured) the id
+        column.
+        """
+        rows = np.arange(first_row, first_row + len(chunk))
+        found = []
+        for rule in self.rules:
+            bad = self._violations(chunk, rule)
+            if bad is None:
+                continue
+            entry = self.summary[rule["name"]]
+            entry["n_checked"] += len(chunk)
+            entry["n_violations"] += int(bad.sum())
+            if bad.any():
+                hits = {"rule": rule["name"], "row": rows[bad]}
+                if self.id_column and self.id_column in chunk.columns:
+                    hits[self.id_column] = chunk[self.id_column].to_numpy()[bad]
+                found.append(pd.DataFrame(hits))
+        if not found:
+            columns = ["rule", "row"]
+            if self.id_column and self.id_column in chunk.columns:
+                columns.append(self.id_column)
+            return pd.DataFrame(columns=columns)
+        return pd.concat(found, ignore_index=True)
+
+    def summary_frame(self) -> pd.DataFrame:
+        summary = pd.DataFrame(list(self.summary.values()))
+        checked = summary["n_checked"].where(summary["n_checked"] > 0)
+        summary["pct_violations"] = (100 * summary["n_violations"] / checked).round(3)
+        return summary
+
+
+def read_chunks(
+    path: str, chunksize: int = 200_000, encoding: str = "utf-8"
+) -> Iterable[pd.DataFrame]:
+    """Read a CSV as string columns in chunks, ``""`` and ``NA`` as missing."""
+    return pd.read_csv(
+        path,
+        dtype=str,
+        keep_default_na=False,
+        na_values=NA_VALUES,
+        chunksize=chunksize,
+        encoding=encoding,
+    )
+
+
+def check_file(
+    path: str,
+    config: dict,
+    violations_out: Optional[str] = None,
+    chunksize: int = 200_000,
+    encoding: str = "utf-8",
+) -> pd.DataFrame:
+    """Evaluate ``config`` rules over ``path`` in one pass and return the summary.
+
+    Violations are appended to ``violations_out`` (tab separated) if given.
+    """
+    engine = RuleEngine(config)
+    first_row = 1
+    header = True
+    for chunk in read_chunks(path, chunksize, encoding):
+        found = engine.evaluate(chunk, first_row)
+        first_row += len(chunk)
+        if violations_out is not None:
+            found.to_csv(
+                violations_out,
+                sep="\t",
+                index=False,
+                mode="w" if header else "a",
+                header=header,
+            )
+            header = False
+    return engine.summary_frame()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--in", dest="infile", required=True)
+    parser.add_argument("--rules", required=True, help="Rules YAML file")
+    parser.add_argument("--summary", required=True, help="Per rule summary (.tsv)")
+    parser.add_argument("--violations", help="Violating rows (.tsv[.gz])")
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args(argv)
+
+    summary = check_file(
+        args.infile,
+        load_rules(args.rules),
+        args.violations,
+        args.chunksize,
+        args.encoding,
+    )
+    summary.to_csv(args.summary, sep="\t", index=False)
+    print(summary.to_string(index=False), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,442 @@
+"""
+quincena_sketches
+=================
+
+Resumenes compactos y combinables de cada quincena del SIAP, para consultas
+sobre varios periodos (un año, 2024 vs 2025) sin volver a leer ni concatenar
+las tablas completas.
+
+Por cada quincena, columna y grupo (p.ej. total y por ``DELEGACION``) se
+guardan:
+
+- cuantiles: sketch KLL (:class:`KLLSketch`) de columnas numericas
+  (``EDAD``, ``ANT_DIAS``, ``IMP_SDO``);
+- distintos: HyperLogLog (:class:`HyperLogLog`) de ``CURP``/``MATRICULA``;
+- mas frecuentes: contadores Misra-Gries (:class:`MisraGries`) de
+  ``CATEGORIA``, ``DESCRIPCION_SERVICIO``, ...
+
+Los tres tipos se combinan sin perdida adicional, asi que
+:class:`SketchStore` responde cuantiles, personas distintas y categorias
+principales de cualquier conjunto de quincenas en milisegundos.
+
+Uso:
+
+    python quincena_sketches.py build --in Qna_07_Plantilla_2025.csv \\
+        --out ../../results/sketches/Qna_07_Plantilla_2025.json.gz
+    python quincena_sketches.py query --dir ../../results/sketches \\
+        --years 2024,2025 --quantiles EDAD --q 0.5,0.9 --group DELEGACION
+    python quincena_sketches.py query --dir ../../results/sketches \\
+        --distinct CURP --top CATEGORIA
+"""
+
+import argparse
+import base64
+import glob
+import gzip
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    import snapshot_cdc
+except ModuleNotFoundError:  # imported as part of the package (tests)
+    from . import snapshot_cdc
+
+QUANTILE_COLUMNS: List[str] = ["EDAD", "ANT_DIAS", "IMP_SDO"]
+DISTINCT_COLUMNS: List[str] = ["CURP", "MATRICULA"]
+HEAVY_COLUMNS: List[str] = ["CATEGORIA", "DESCRIPCION_SERVICIO", "DESCRIP_CLASCATEG"]
+GROUP_COLUMNS: List[str] = ["DELEGACION"]
+
+# Group label of the sketches over the whole table.
+TOTAL = "Total"
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang and Liberty, 2016).
+
+    Items are kept in compactors of decreasing capacity; an item at level
+    ``h`` stands for ``2**h`` original values. The rank error is about
+    ``1.7 / k`` of the number of values with high probability.
+    """
+
+    def __init__(self, k: int = 200) -> None:
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(k)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[: len(items) - len(keep)]
+                offset = int(self._rng.integers(2))
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], pairs[offset::2]]
+                )
+                self.levels[level] = keep
+            level += 1
+
+    def update(self, values: Iterable[float]) -> None:
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        if self.n == 0:
+            return [float("nan")] * len(qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(lv), 2.0**h) for h, lv in enumerate(self.levels)]
+        )
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        ranks = np.asarray(qs) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, ranks), len(items) - 1)
+        return items[order][positions].tolist()
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "levels": [lv.tolist() for lv in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.levels = [np.asarray(lv, dtype=float) for lv in data["levels"]]
+        return sketch
+
+
+def _leading_zeros(x: np.ndarray) -> np.ndarray:
+    """Number of leading zero bits of each ``uint64`` in ``x``."""
+    x = x.astype(np.uint64)
+    zeros = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        small = x < (np.uint64(1) << np.uint64(64 - shift))
+        zeros += small * shift
+        x = np.where(small, x << np.uint64(shift), x)
+    return zeros + (x == 0)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with ``2**p`` registers (error ~1.04/sqrt(2**p))."""
+
+    def __init__(self, p: int = 14) -> None:
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values: Iterable[str]) -> None:
+        values = pd.Series(values, dtype=object)
+        values = values[values.notna() & (values != "")].unique()
+        if not len(values):
+            return
+        hashed = pd.util.hash_array(np.asarray(values, dtype=object))
+        index = (hashed >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashed << np.uint64(self.p)
+        rho = np.minimum(_leading_zeros(rest) + 1, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rho)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        empty = int(np.sum(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            estimate = m * np.log(m / empty)
+        return float(estimate)
+
+    def to_dict(self) -> dict:
+        packed = base64.b64encode(self.registers.tobytes()).decode("ascii")
+        return {"p": self.p, "registers": packed}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        sketch = cls(data["p"])
+        raw = base64.b64decode(data["registers"])
+        sketch.registers = np.frombuffer(raw, dtype=np.uint8).copy()
+        return sketch
+
+
+class MisraGries:
+    """Mergeable Misra-Gries heavy hitters with at most ``k`` counters.
+
+    Counts are underestimated by at most ``n / (k + 1)``.
+    """
+
+    def __init__(self, k: int = 64) -> None:
+        self.k = k
+        self.n = 0
+        self.counters: Dict[str, int] = {}
+
+    def _add(self, counts: Dict[str, int]) -> None:
+        merged = dict(self.counters)
+        for value, count in counts.items():
+            merged[value] = merged.get(value, 0) + int(count)
+        if len(merged) > self.k:
+            cut = sorted(merged.values(), reverse=True)[self.k]
+            merged = {v: c - cut for v, c in merged.items() if c > cut}
+        self.counters = merged
+
+    def update(self, values: Iterable[str]) -> None:
+        counts = pd.Series(values, dtype=object).value_counts()
+        self.n += int(counts.sum())
+        self._add(counts.to_dict())
+
+    def merge(self, other: "MisraGries") -> "MisraGries":
+        self.n += other.n
+        self._add(other.counters)
+        return self
+
+    def top(self, n: int = 10) -> List[tuple]:
+        return sorted(self.counters.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MisraGries":
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.counters = dict(data["counters"])
+        return sketch
+
+
+SKETCH_TYPES = {"quantiles": KLLSketch, "distinct": HyperLogLog, "top": MisraGries}
+
+
+def _groups(df: pd.DataFrame, group_columns: Sequence[str]):
+    """Yield ``(group_column, group_value, rows)``, the whole table first."""
+    yield TOTAL, TOTAL, df
+    for col in group_columns:
+        if col in df.columns:
+            for value, rows in df.groupby(col, sort=True):
+                yield col, value, rows
+
+
+def sketch_snapshot(
+    path: str,
+    quantile_columns: Sequence[str] = QUANTILE_COLUMNS,
+    distinct_columns: Sequence[str] = DISTINCT_COLUMNS,
+    heavy_columns: Sequence[str] = HEAVY_COLUMNS,
+    group_columns: Sequence[str] = GROUP_COLUMNS,
+    chunksize: int = 200_000,
+    encoding: str = "utf-8",
+) -> dict:
+    """Build the sketches of one snapshot CSV in a single chunked pass.
+
+    Returns ``{"snapshot": ..., "sketches": {kind: {column: {group_column:
+    {group_value: sketch_dict}}}}}``; columns absent from the file are
+    skipped.
+    """
+    kinds = {
+        "quantiles": list(quantile_columns),
+        "distinct": list(distinct_columns),
+        "top": list(heavy_columns),
+    }
+    sketches: Dict[str, Dict[str, Dict[str, Dict[str, object]]]] = {
+        kind: {} for kind in kinds
+    }
+    for chunk in pd.read_csv(
+        path,
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        chunksize=chunksize,
+        encoding=encoding,
+    ):
+        for group_col, group_value, rows in _groups(chunk, group_columns):
+            for kind, columns in kinds.items():
+                for col in columns:
+                    if col not in rows.columns:
+                        continue
+                    per_group = (
+                        sketches[kind].setdefault(col, {}).setdefault(group_col, {})
+                    )
+                    if group_value not in per_group:
+                        per_group[group_value] = SKETCH_TYPES[kind]()
+                    values = rows[col]
+                    if kind == "quantiles":
+                        values = pd.to_numeric(values, errors="coerce")
+                    else:
+                        values = values.dropna()
+                    per_group[group_value].update(values)
+    return {
+        "snapshot": os.path.basename(path).split(".")[0],
+        "sketches": {
+            kind: {
+                col: {
+                    g: {v: s.to_dict() for v, s in values.items()}
+                    for g, values in groups.items()
+                }
+                for col, groups in columns.items()
+            }
+            for kind, columns in sketches.items()
+        },
+    }
+
+
+def write_sketches(sketches: dict, path: str) -> None:
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        json.dump(sketches, fh)
+
+
+class SketchStore:
+    """Query layer over the per quincena sketch files in ``directory``."""
+
+    def __init__(self, directory: str) -> None:
+        self.files = {}
+        for path in glob.glob(os.path.join(directory, "*.json.gz")):
+            self.files[os.path.basename(path)[: -len(".json.gz")]] = path
+        self._loaded: Dict[str, dict] = {}
+
+    def snapshots(self, years: Optional[Sequence[int]] = None) -> List[str]:
+        """Snapshot names in chronological order, optionally for ``years``."""
+        names = sorted(self.files, key=snapshot_cdc.snapshot_order)
+        if years:
+            names = [n for n in names if snapshot_cdc.snapshot_order(n)[0] in years]
+        return names
+
+    def _sketches(self, name: str) -> dict:
+        if name not in self._loaded:
+            with gzip.open(self.files[name], "rt", encoding="utf-8") as fh:
+                self._loaded[name] = json.load(fh)["sketches"]
+        return self._loaded[name]
+
+    def merged(
+        self,
+        kind: str,
+        column: str,
+        group: str = TOTAL,
+        snapshots: Optional[Sequence[str]] = None,
+    ) -> Dict[str, object]:
+        """Merge the ``kind`` sketches of ``column`` per value of ``group``."""
+        out: Dict[str, object] = {}
+        for name in snapshots or self.snapshots():
+            per_group = self._sketches(name)[kind].get(column, {}).get(group, {})
+            for value, data in per_group.items():
+                sketch = SKETCH_TYPES[kind].from_dict(data)
+                out[value] = out[value].merge(sketch) if value in out else sketch
+        return out
+
+    def quantiles(
+        self,
+        column: str,
+        qs: Sequence[float] = (0.25, 0.5, 0.75),
+        group: str = TOTAL,
+        snapshots: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Quantiles of ``column`` over all rows of ``snapshots``."""
+        merged = self.merged("quantiles", column, group, snapshots)
+        rows = {v: [s.n] + s.quantiles(qs) for v, s in merged.items()}
+        columns = ["n"] + [f"q{q:g}" for q in qs]
+        return pd.DataFrame.from_dict(rows, orient="index", columns=columns)
+
+    def distinct(
+        self,
+        column: str,
+        group: str = TOTAL,
+        snapshots: Optional[Sequence[str]] = None,
+    ) -> pd.Series:
+        """Estimated number of distinct ``column`` values (e.g. persons)."""
+        merged = self.merged("distinct", column, group, snapshots)
+        return pd.Series({v: round(s.count()) for v, s in merged.items()}, name="n")
+
+    def top(
+        self,
+        column: str,
+        n: int = 10,
+        group: str = TOTAL,
+        snapshots: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Most frequent ``column`` values with their (lower bound) counts."""
+        merged = self.merged("top", column, group, snapshots)
+        rows = [
+            (g, value, count) for g, s in merged.items() for value, count in s.top(n)
+        ]
+        return pd.DataFrame(rows, columns=[group, column, "n"])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Sketch a snapshot CSV")
+    build.add_argument("--in", dest="infile", required=True)
+    build.add_argument("--out", required=True, help="Output .json.gz")
+    build.add_argument("--quantile-columns", default=",".join(QUANTILE_COLUMNS))
+    build.add_argument("--distinct-columns", default=",".join(DISTINCT_COLUMNS))
+    build.add_argument("--heavy-columns", default=",".join(HEAVY_COLUMNS))
+    build.add_argument("--group-columns", default=",".join(GROUP_COLUMNS))
+    build.add_argument("--encoding", default="utf-8")
+
+    query = sub.add_parser("query", help="Merge sketches and answer a query")
+    query.add_argument("--dir", required=True)
+    query.add_argument("--years", help="Comma separated years, default all")
+    query.add_argument("--group", default=TOTAL)
+    query.add_argument("--quantiles", help="Numeric column")
+    query.add_argument("--q", default="0.25,0.5,0.75")
+    query.add_argument("--distinct", help="Column to count distinct values of")
+    query.add_argument("--top", help="Column to list the most frequent values of")
+    query.add_argument("--n", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+
+        def split(value):
+            return [c for c in value.split(",") if c]
+
+        sketches = sketch_snapshot(
+            args.infile,
+            split(args.quantile_columns),
+            split(args.distinct_columns),
+            split(args.heavy_columns),
+            split(args.group_columns),
+            encoding=args.encoding,
+        )
+        write_sketches(sketches, args.out)
+        return 0
+
+    store = SketchStore(args.dir)
+    years = [int(y) for y in args.years.split(",")] if args.years else None
+    snapshots = store.snapshots(years)
+    print(f"# {len(snapshots)} quincenas", file=sys.stderr)
+    if args.quantiles:
+        qs = [float(q) for q in args.q.split(",")]
+        print(store.quantiles(args.quantiles, qs, args.group, snapshots).to_string())
+    if args.distinct:
+        print(store.distinct(args.distinct, args.group, snapshots).to_string())
+    if args.top:
+        print(store.top(args.top, args.n, args.group, snapshots).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
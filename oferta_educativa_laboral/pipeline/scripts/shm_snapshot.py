@@ -0,0 +1,199 @@
+"""
+shm_snapshot
+============
+
+Quincenas limpias compartidas en memoria entre las etapas que corren al mismo
+tiempo.
+
+``2_clean_dups_col_types.R`` guarda ademas del ``.rdata.gzip`` la tabla
+``data_f`` en Arrow IPC sin comprimir (``.arrow``). Antes de correr una
+etapa, el pipeline copia ese archivo una sola vez a ``/dev/shm`` (o al
+directorio temporal si no existe) y registra como usuario al proceso que
+corre la etapa (el shell de ``Rscript``, mientras viva R); las demas etapas de la misma quincena usan la misma copia. Python la abre con
+``pyarrow.memory_map`` sin copiar los datos (:func:`attach`) y R con
+``arrow::read_feather(mmap = TRUE)`` (``scripts/snapshot_load.R``). Cada etapa
+libera la copia al terminar y la ultima en salir la borra; las usuarias cuyo
+proceso ya no existe no cuentan.
+
+Estructura:
+
+    <root>/<nombre>-<hash>.arrow       tabla compartida (solo lectura)
+    <root>/<nombre>-<hash>.refs.json   procesos que la usan
+
+Uso:
+
+    python shm_snapshot.py acquire --in 2_clean_dups_col_types_Qna_07_Plantilla_2025.arrow \\
+        --holder explore
+    python shm_snapshot.py release --in 2_clean_dups_col_types_Qna_07_Plantilla_2025.arrow \\
+        --holder explore
+    python shm_snapshot.py status
+"""
+
+import argparse
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+from typing import Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+try:
+    import build_cache
+except ModuleNotFoundError:  # imported as part of the package (tests)
+    from . import build_cache
+
+DEFAULT_ROOT = os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    "oferta_laboral",
+)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedSnapshots:
+    """Reference counted read-only copies of Arrow files below ``root``."""
+
+    def __init__(self, root: str = DEFAULT_ROOT) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def buffer_path(self, source: str) -> str:
+        """Path of the shared copy of ``source`` (named by its contents)."""
+        name = os.path.basename(source).rsplit(".", 1)[0]
+        digest = build_cache.hash_file(source)[:16]
+        return os.path.join(self.root, f"{name}-{digest}.arrow")
+
+    @contextlib.contextmanager
+    def _locked(self, buffer: str) -> Iterator[Dict[str, int]]:
+        """Lock the reference file of ``buffer`` and yield its holders, with
+        the holders of finished processes dropped; changes are saved."""
+        refs_path = f"{buffer[: -len('.arrow')]}.refs.json"
+        with open(f"{refs_path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            holders: Dict[str, int] = {}
+            if os.path.exists(refs_path):
+                with open(refs_path) as fh:
+                    holders = json.load(fh)
+            holders = {h: pid for h, pid in holders.items() if _alive(pid)}
+            yield holders
+            if holders:
+                with open(f"{refs_path}.tmp", "w") as fh:
+                    json.dump(holders, fh, indent=1)
+                os.replace(f"{refs_path}.tmp", refs_path)
+            else:
+                for path in (buffer, refs_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def acquire(self, source: str, holder: str, pid: Optional[int] = None) -> str:
+        """Register ``holder`` as a user of ``source`` and return the path of
+        the shared copy, creating it if needed.
+
+        ``pid`` (default: this process) must live as long as the copy is
+        mapped: pass the process reading it, or one that waits for it.
+        """
+        buffer = self.buffer_path(source)
+        with self._locked(buffer) as holders:
+            if not os.path.exists(buffer):
+                tmp = f"{buffer}.{os.getpid()}.tmp"
+                shutil.copyfile(source, tmp)
+                os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(tmp, buffer)
+            holders[holder] = pid or os.getpid()
+        return buffer
+
+    def release(self, source: str, holder: str) -> int:
+        """Unregister ``holder``; the copy is removed with its last holder.
+
+        Returns the number of remaining holders.
+        """
+        buffer = self.buffer_path(source)
+        with self._locked(buffer) as holders:
+            holders.pop(holder, None)
+            return len(holders)
+
+    def status(self) -> List[dict]:
+        """Shared copies with their size and live holders."""
+        rows = []
+        for buffer in sorted(glob.glob(os.path.join(self.root, "*.arrow"))):
+            with self._locked(buffer) as holders:
+                if os.path.exists(buffer):
+                    rows.append(
+                        {
+                            "buffer": buffer,
+                            "bytes": os.path.getsize(buffer),
+                            "holders": sorted(holders),
+                        }
+                    )
+        return rows
+
+    def cleanup(self) -> List[str]:
+        """Remove copies without live holders (e.g. after a crashed run)."""
+        before = set(glob.glob(os.path.join(self.root, "*.arrow")))
+        self.status()
+        return sorted(before - set(glob.glob(os.path.join(self.root, "*.arrow"))))
+
+    @contextlib.contextmanager
+    def shared(self, source: str, holder: str) -> Iterator[str]:
+        """``acquire`` for the duration of a ``with`` block."""
+        buffer = self.acquire(source, holder)
+        try:
+            yield buffer
+        finally:
+            self.release(source, holder)
+
+
+def attach(path: str, columns: Optional[List[str]] = None) -> pa.Table:
+    """Open a shared (uncompressed) Arrow file without copying its buffers."""
+    reader = ipc.open_file(pa.memory_map(path, "r"))
+    table = reader.read_all()
+    return table.select(columns) if columns else table
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    acquire = sub.add_parser("acquire", help="Share a snapshot, print its path")
+    release = sub.add_parser("release", help="Stop using a shared snapshot")
+    for command in (acquire, release):
+        command.add_argument("--in", dest="infile", required=True)
+        command.add_argument("--holder", required=True)
+    acquire.add_argument("--pid", type=int, help="Process using it (default: this)")
+    status = sub.add_parser("status", help="Shared snapshots and their holders")
+    cleanup = sub.add_parser("cleanup", help="Remove copies nobody uses")
+    for command in (acquire, release, status, cleanup):
+        command.add_argument("--root", default=DEFAULT_ROOT)
+    args = parser.parse_args(argv)
+
+    snapshots = SharedSnapshots(args.root)
+    if args.command == "acquire":
+        print(snapshots.acquire(args.infile, args.holder, args.pid))
+    elif args.command == "release":
+        left = snapshots.release(args.infile, args.holder)
+        print(f"{left} holders left", file=sys.stderr)
+    elif args.command == "status":
+        for row in snapshots.status():
+            print(f"{row['buffer']}\t{row['bytes']}\t{','.join(row['holders'])}")
+    else:
+        for path in snapshots.cleanup():
+            print(f"Removed {path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+snapshot_archive
+================
+
+Archivo historico de quincenas del SIAP deduplicado por fila.
+
+La mayoria de las filas de una quincena son identicas a las de la anterior.
+En lugar de guardar una copia completa de cada exportacion, cada fila se
+identifica por un hash de 128 bits de sus valores (y de los nombres de sus
+columnas) y solo las filas no vistas antes se guardan, por columnas y
+comprimidas con ZSTD (Arrow IPC), en ``chunks/``. Cada quincena es solo la
+lista ordenada de hashes de sus filas, asi que el archivo crece con los
+cambios reales y no con plantilla x numero de quincenas.
+
+Cualquier quincena se reconstruye por bloques de filas (:func:`iter_snapshot`,
+``restore``) sin cargar el archivo completo en memoria.
+
+Estructura:
+
+    <archive>/index.arrow                  hash -> (chunk, fila)
+    <archive>/chunks/chunk_000000.arrow    filas unicas (ZSTD)
+    <archive>/snapshots/<quincena>.arrow   hashes de las filas, en orden
+    <archive>/snapshots/<quincena>.json    columnas y numero de filas
+
+Uso:
+
+    python snapshot_archive.py add --archive ../../archive Qna_*_Plantilla_*.csv
+    python snapshot_archive.py restore --archive ../../archive \\
+        --snapshot Qna_07_Plantilla_2025 --out Qna_07_Plantilla_2025.csv
+    python snapshot_archive.py list --archive ../../archive
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Two independent 16 character keys give a 128 bit row hash.
+_HASH_KEYS = ("oferta_laboral_1", "oferta_laboral_2")
+_IPC_OPTIONS = ipc.IpcWriteOptions(compression="zstd")
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Return a ``(n, 2)`` ``uint64`` array identifying each row.
+
+    The column names are part of the hash, so equal values under a different
+    schema are stored separately.
+    """
+    schema = pd.util.hash_array(np.array(["\x1f".join(df.columns)], dtype=object))
+    out = np.empty((len(df), 2), dtype=np.uint64)
+    for i, hash_key in enumerate(_HASH_KEYS):
+        out[:, i] = pd.util.hash_pandas_object(df, index=False, hash_key=hash_key)
+        out[:, i] ^= schema[0] + np.uint64(i)
+    return out
+
+
+def _as_keys(hashes: np.ndarray) -> np.ndarray:
+    """View ``(n, 2)`` row hashes as sortable 16 byte keys."""
+    return np.ascontiguousarray(hashes, dtype=np.uint64).view("S16").ravel()
+
+
+def _write_table(table: pa.Table, path: str) -> None:
+    tmp = f"{path}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with ipc.new_file(sink, table.schema, options=_IPC_OPTIONS) as writer:
+            writer.write_table(table, max_chunksize=65536)
+    os.replace(tmp, path)
+
+
+def _read_table(path: str) -> pa.Table:
+    with pa.memory_map(path) as source:
+        return ipc.open_file(source).read_all()
+
+
+class SnapshotArchive:
+    """Row deduplicated store of quincena snapshots in ``directory``."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.chunks_dir = os.path.join(directory, "chunks")
+        self.snapshots_dir = os.path.join(directory, "snapshots")
+        self.index_path = os.path.join(directory, "index.arrow")
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self._index: Optional[pd.DataFrame] = None
+
+    @property
+    def index(self) -> pd.DataFrame:
+        """Row hash (``h1``, ``h2``) -> ``chunk``, ``row``."""
+        if self._index is None:
+            if os.path.exists(self.index_path):
+                self._index = _read_table(self.index_path).to_pandas()
+            else:
+                self._index = pd.DataFrame(
+                    {
+                        "h1": pd.Series(dtype="uint64"),
+                        "h2": pd.Series(dtype="uint64"),
+                        "chunk": pd.Series(dtype="int32"),
+                        "row": pd.Series(dtype="int32"),
+                    }
+                )
+        return self._index
+
+    def snapshots(self) -> List[str]:
+        paths = glob.glob(os.path.join(self.snapshots_dir, "*.json"))
+        return sorted(os.path.basename(p)[: -len(".json")] for p in paths)
+
+    def metadata(self, snapshot: str) -> dict:
+        with open(os.path.join(self.snapshots_dir, f"{snapshot}.json")) as fh:
+            return json.load(fh)
+
+    def _next_chunk(self) -> int:
+        return len(glob.glob(os.path.join(self.chunks_dir, "chunk_*.arrow")))
+
+    def add(
+        self,
+        path: str,
+        name: Optional[str] = None,
+        chunksize: int = 200_000,
+        encoding: str = "utf-8",
+    ) -> dict:
+        """Archive a snapshot CSV, storing only rows not already archived.
+
+        Returns the snapshot metadata, including ``new_rows``.
+        """
+        name = name or os.path.basename(path).split(".")[0]
+        hashes = []
+        new_rows = 0
+        columns: List[str] = []
+        index = self.index
+        known = np.sort(_as_keys(index[["h1", "h2"]].to_numpy(np.uint64)))
+        additions = []
+        for chunk in pd.read_csv(
+            path,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunksize,
+            encoding=encoding,
+        ):
+            columns = list(chunk.columns)
+            h = row_hashes(chunk)
+            hashes.append(h)
+            keys = _as_keys(h)
+            pos = np.minimum(np.searchsorted(known, keys), max(len(known) - 1, 0))
+            is_new = known[pos] != keys if len(known) else np.ones(len(keys), bool)
+            # Rows repeated within the snapshot are stored once.
+            _, first = np.unique(keys, return_index=True)
+            unique = np.zeros(len(chunk), dtype=bool)
+            unique[first] = True
+            is_new &= unique
+            if is_new.any():
+                chunk_id = self._next_chunk()
+                rows = chunk.loc[is_new].reset_index(drop=True)
+                _write_table(
+                    pa.Table.from_pandas(rows, preserve_index=False),
+                    os.path.join(self.chunks_dir, f"chunk_{chunk_id:06d}.arrow"),
+                )
+                additions.append(
+                    pd.DataFrame(
+                        {
+                            "h1": h[is_new, 0],
+                            "h2": h[is_new, 1],
+                            "chunk": np.int32(chunk_id),
+                            "row": np.arange(len(rows), dtype=np.int32),
+                        }
+                    )
+                )
+                known = np.union1d(known, keys[is_new])
+                new_rows += len(rows)
+
+        all_hashes = np.concatenate(hashes) if hashes else np.empty((0, 2), np.uint64)
+        _write_table(
+            pa.table({"h1": all_hashes[:, 0], "h2": all_hashes[:, 1]}),
+            os.path.join(self.snapshots_dir, f"{name}.arrow"),
+        )
+        if additions:
+            self._index = pd.concat([index] + additions, ignore_index=True)
+            _write_table(
+                pa.Table.from_pandas(self._index, preserve_index=False),
+                self.index_path,
+            )
+        meta = {
+            "snapshot": name,
+            "source": os.path.basename(path),
+            "columns": columns,
+            "rows": int(len(all_hashes)),
+            "new_rows": int(new_rows),
+        }
+        with open(os.path.join(self.snapshots_dir, f"{name}.json"), "w") as fh:
+            json.dump(meta, fh, indent=1)
+        return meta
+
+    def iter_snapshot(
+        self, snapshot: str, batch_rows: int = 100_000
+    ) -> Iterator[pd.DataFrame]:
+        """Yield the rows of ``snapshot`` in their original order, in batches.
+
+        Only the chunks referenced by each batch are decompressed; the most
+        recently used ones are kept between batches.
+        """
+        columns = self.metadata(snapshot)["columns"]
+        order = _read_table(os.path.join(self.snapshots_dir, f"{snapshot}.arrow"))
+        locations = self.index.set_index(["h1", "h2"])
+        loaded: Dict[int, pd.DataFrame] = {}
+        for start in range(0, order.num_rows, batch_rows):
+            part = order.slice(start, batch_rows).to_pandas()
+            where = locations.loc[pd.MultiIndex.from_frame(part[["h1", "h2"]])]
+            pieces = []
+            chunk_ids = where["chunk"].to_numpy()
+            rows = where["row"].to_numpy()
+            for chunk_id in np.unique(chunk_ids):
+                if chunk_id not in loaded:
+                    if len(loaded) >= 8:
+                        loaded.pop(next(iter(loaded)))
+                    path = os.path.join(self.chunks_dir, f"chunk_{chunk_id:06d}.arrow")
+                    loaded[chunk_id] = _read_table(path).to_pandas()
+                positions = np.flatnonzero(chunk_ids == chunk_id)
+                piece = loaded[chunk_id].iloc[rows[positions]][columns]
+                pieces.append(piece.set_axis(positions))
+            yield pd.concat(pieces).sort_index().reset_index(drop=True)
+
+    def restore(self, snapshot: str, out: str, batch_rows: int = 100_000) -> int:
+        """Write ``snapshot`` back to a CSV and return the number of rows."""
+        n = 0
+        for i, batch in enumerate(self.iter_snapshot(snapshot, batch_rows)):
+            batch.to_csv(out, index=False, mode="w" if i == 0 else "a", header=i == 0)
+            n += len(batch)
+        return n
+
+    def stats(self) -> pd.DataFrame:
+        """Rows, newly stored rows and compressed bytes per snapshot."""
+        records = [self.metadata(s) for s in self.snapshots()]
+        summary = pd.DataFrame(records, columns=["snapshot", "rows", "new_rows"])
+        stored = sum(
+            os.path.getsize(p) for p in glob.glob(os.path.join(self.chunks_dir, "*"))
+        )
+        summary.attrs["chunk_bytes"] = stored
+        return summary
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Archive snapshot CSVs")
+    add.add_argument("files", nargs="+")
+    add.add_argument("--encoding", default="utf-8")
+    restore = sub.add_parser("restore", help="Rebuild a snapshot CSV")
+    restore.add_argument("--snapshot", required=True)
+    restore.add_argument("--out", required=True)
+    list_ = sub.add_parser("list", help="Archived snapshots and sizes")
+    for command in (add, restore, list_):
+        command.add_argument("--archive", required=True)
+    args = parser.parse_args(argv)
+
+    archive = SnapshotArchive(args.archive)
+    if args.command == "add":
+        present = set(archive.snapshots())
+        for path in args.files:
+            name = os.path.basename(path).split(".")[0]
+            if name in present:
+                print(f"{name} already archived, skipped", file=sys.stderr)
+                continue
+            meta = archive.add(path, name, encoding=args.encoding)
+            print(
+                f"{name}: {meta['rows']} rows, {meta['new_rows']} new",
+                file=sys.stderr,
+            )
+    elif args.command == "restore":
+        n = archive.restore(args.snapshot, args.out)
+        print(f"{n} rows written to {args.out}", file=sys.stderr)
+    else:
+        summary = archive.stats()
+        print(summary.to_string(index=False))
+        print(f"Stored chunk bytes: {summary.attrs['chunk_bytes']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
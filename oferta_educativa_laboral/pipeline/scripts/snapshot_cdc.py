@@ -0,0 +1,302 @@
+"""
+snapshot_cdc
+============
+
+Compara dos quincenas consecutivas del SIAP (p.ej. ``Qna_07_Plantilla_2025``
+y ``Qna_15_Plantilla_2025``) y genera una bitacora compacta de cambios: altas,
+bajas, cambios de categoria/adscripcion y cambios en ``PLZOCU``/``PLZSOB``.
+
+La comparacion es un merge ordenado por la llave persona/plaza (``CURP`` por
+defecto), leyendo ambas tablas como flujos. Si los archivos ya vienen
+ordenados por la llave (``--presorted``) no se cargan en memoria.
+
+La bitacora contiene una fila por persona con cambios. Para cada columna
+rastreada o acompanante se guardan los valores anterior (``<col>_ant``) y
+actual (``<col>_act``), de modo que las tablas agregadas y las trayectorias se
+pueden actualizar a partir del delta con :func:`update_counts` y
+:func:`transitions` sin recalcular desde la tabla completa.
+
+Uso:
+
+    python snapshot_cdc.py --old Qna_07_Plantilla_2025.csv \\
+        --new Qna_15_Plantilla_2025.csv --out cdc_Qna_07_Qna_15.tsv
+"""
+
+import argparse
+import csv
+import gzip
+import re
+import sys
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Columns whose change is recorded, and the change label used for each.
+TRACKED_COLUMNS: Dict[str, str] = {
+    "CATEGORIA": "cambio_categoria",
+    "ADSCRIPCION": "cambio_adscripcion",
+    "PLZOCU": "cambio_plzocu",
+    "PLZSOB": "cambio_plzsob",
+}
+
+# Columns carried in the log (old and new values) so that counts grouped by
+# them can be updated from the delta alone.
+CARRY_COLUMNS: List[str] = ["DELEGACION", "DESCRIP_CLASCATEG", "NOMBREAR"]
+
+DEFAULT_KEY: List[str] = ["CURP"]
+
+ALTA = "alta"
+BAJA = "baja"
+CAMBIO = "cambio"
+
+_QNA_RE = re.compile(r"Qna_(\d+)_.*?_?(\d{4})")
+
+Row = Dict[str, str]
+Change = Dict[str, str]
+
+
+def _open_text(path: str, mode: str = "rt", encoding: str = "utf-8"):
+    """Open ``path`` as text, transparently handling ``.gz`` files."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding=encoding, newline="")
+    return open(path, mode, encoding=encoding, newline="")
+
+
+def snapshot_order(path: str) -> Tuple[int, int]:
+    """Return ``(year, quincena)`` parsed from a SIAP snapshot file name.
+
+    Raises
+    ------
+    ValueError
+        If the name does not follow the ``Qna_<NN>_<tabla>_<YYYY>`` pattern.
+    """
+    match = _QNA_RE.search(path.split("/")[-1])
+    if not match:
+        raise ValueError(f"Cannot parse quincena and year from '{path}'")
+    return int(match.group(2)), int(match.group(1))
+
+
+def consecutive_pairs(paths: Iterable[str]) -> List[Tuple[str, str]]:
+    """Sort snapshot files chronologically and pair each with the next one."""
+    ordered = sorted(paths, key=snapshot_order)
+    return list(zip(ordered[:-1], ordered[1:]))
+
+
+def read_snapshot(
+    path: str,
+    key: Sequence[str] = DEFAULT_KEY,
+    presorted: bool = False,
+    delimiter: str = ",",
+    encoding: str = "utf-8",
+) -> Iterator[Tuple[Tuple[str, ...], Row]]:
+    """Yield ``(key, row)`` tuples from a snapshot in key order.
+
+    Parameters
+    ----------
+    path:
+        CSV (optionally gzipped) file with a header row.
+    key:
+        Column names forming the person/plaza key.
+    presorted:
+        If ``True`` the file is streamed as is and must already be sorted by
+        ``key``; otherwise it is read and sorted in memory.
+    """
+    with _open_text(path, encoding=encoding) as fh:
+        reader = csv.DictReader(fh, delimiter=delimiter)
+        missing = [k for k in key if k not in (reader.fieldnames or [])]
+        if missing:
+            raise KeyError(f"Key columns {missing} not found in '{path}'")
+        records = ((tuple(row[k] for k in key), row) for row in reader)
+        if presorted:
+            yield from records
+        else:
+            yield from sorted(records, key=lambda rec: rec[0])
+
+
+def _checked(
+    records: Iterator[Tuple[Tuple[str, ...], Row]], label: str
+) -> Iterator[Tuple[Tuple[str, ...], Row]]:
+    """Pass records through, failing on unsorted or duplicated keys."""
+    previous: Optional[Tuple[str, ...]] = None
+    for rec_key, row in records:
+        if previous is not None and rec_key <= previous:
+            raise ValueError(
+                f"{label} snapshot is not sorted or has duplicated key {rec_key}"
+            )
+        previous = rec_key
+        yield rec_key, row
+
+
+def _make_change(
+    change_type: str,
+    fields: List[str],
+    key: Sequence[str],
+    rec_key: Tuple[str, ...],
+    old: Optional[Row],
+    new: Optional[Row],
+    columns: Sequence[str],
+) -> Change:
+    change: Change = {"tipo": change_type, "campos": ";".join(fields)}
+    change.update(zip(key, rec_key))
+    for col in columns:
+        change[f"{col}_ant"] = old.get(col, "") if old else ""
+        change[f"{col}_act"] = new.get(col, "") if new else ""
+    return change
+
+
+def diff_records(
+    old: Iterable[Tuple[Tuple[str, ...], Row]],
+    new: Iterable[Tuple[Tuple[str, ...], Row]],
+    key: Sequence[str] = DEFAULT_KEY,
+    tracked: Optional[Dict[str, str]] = None,
+    carry: Optional[Sequence[str]] = None,
+) -> Iterator[Change]:
+    """Merge two key-sorted record streams and yield the changes.
+
+    Each change is a flat dictionary with ``tipo`` (``alta``, ``baja`` or
+    ``cambio``), ``campos`` (``;``-separated change labels), the key columns
+    and ``<col>_ant``/``<col>_act`` values for tracked and carried columns.
+    Records that are unchanged in every tracked column are not emitted.
+    """
+    tracked = TRACKED_COLUMNS if tracked is None else tracked
+    carry = CARRY_COLUMNS if carry is None else carry
+    columns = list(tracked) + [c for c in carry if c not in tracked]
+    old_it = _checked(iter(old), "old")
+    new_it = _checked(iter(new), "new")
+    old_rec = next(old_it, None)
+    new_rec = next(new_it, None)
+    while old_rec is not None or new_rec is not None:
+        if new_rec is None or (old_rec is not None and old_rec[0] < new_rec[0]):
+            yield _make_change(BAJA, [BAJA], key, old_rec[0], old_rec[1], None, columns)
+            old_rec = next(old_it, None)
+        elif old_rec is None or new_rec[0] < old_rec[0]:
+            yield _make_change(ALTA, [ALTA], key, new_rec[0], None, new_rec[1], columns)
+            new_rec = next(new_it, None)
+        else:
+            old_row, new_row = old_rec[1], new_rec[1]
+            fields = [
+                label
+                for col, label in tracked.items()
+                if old_row.get(col, "") != new_row.get(col, "")
+            ]
+            if fields:
+                yield _make_change(
+                    CAMBIO, fields, key, old_rec[0], old_row, new_row, columns
+                )
+            old_rec = next(old_it, None)
+            new_rec = next(new_it, None)
+
+
+def diff_snapshots(
+    old_path: str,
+    new_path: str,
+    key: Sequence[str] = DEFAULT_KEY,
+    presorted: bool = False,
+    tracked: Optional[Dict[str, str]] = None,
+    carry: Optional[Sequence[str]] = None,
+    delimiter: str = ",",
+    encoding: str = "utf-8",
+) -> Iterator[Change]:
+    """Diff two snapshot files, see :func:`diff_records`."""
+    old = read_snapshot(old_path, key, presorted, delimiter, encoding)
+    new = read_snapshot(new_path, key, presorted, delimiter, encoding)
+    return diff_records(old, new, key, tracked, carry)
+
+
+def write_change_log(changes: Iterable[Change], outfile: str) -> Counter:
+    """Write ``changes`` as a tab separated log and return counts per label."""
+    summary: Counter = Counter()
+    writer = None
+    with _open_text(outfile, "wt") as fh:
+        for change in changes:
+            if writer is None:
+                writer = csv.DictWriter(
+                    fh, fieldnames=list(change), delimiter="\t", lineterminator="\n"
+                )
+                writer.writeheader()
+            writer.writerow(change)
+            summary.update(change["campos"].split(";"))
+        if writer is None:
+            fh.write("tipo\tcampos\n")
+    return summary
+
+
+def read_change_log(path: str) -> Iterator[Change]:
+    """Stream the records of a change log written by :func:`write_change_log`."""
+    with _open_text(path) as fh:
+        yield from csv.DictReader(fh, delimiter="\t")
+
+
+def update_counts(
+    counts: Counter, changes: Iterable[Change], by: Sequence[str]
+) -> Counter:
+    """Update group ``counts`` of the previous snapshot in place from a delta.
+
+    ``counts`` maps tuples of the ``by`` column values to head counts, as
+    produced by e.g. ``Counter(zip(df[c1], df[c2]))``. The ``by`` columns must
+    be tracked or carried in the change log. Groups that drop to zero are
+    removed.
+    """
+    for change in changes:
+        old_group = tuple(change[f"{c}_ant"] for c in by)
+        new_group = tuple(change[f"{c}_act"] for c in by)
+        if change["tipo"] == CAMBIO and old_group == new_group:
+            continue
+        if change["tipo"] != ALTA:
+            counts[old_group] -= 1
+            if counts[old_group] <= 0:
+                del counts[old_group]
+        if change["tipo"] != BAJA:
+            counts[new_group] += 1
+    return counts
+
+
+def transitions(
+    changes: Iterable[Change], column: str, key: Sequence[str] = DEFAULT_KEY
+) -> Iterator[Tuple[Tuple[str, ...], str, str]]:
+    """Yield ``(key, old_value, new_value)`` for records whose ``column`` moved.
+
+    Altas and bajas are included with an empty old or new value, which lets
+    trajectory analyses extend each person's history from the delta.
+    """
+    for change in changes:
+        old_value, new_value = change[f"{column}_ant"], change[f"{column}_act"]
+        if change["tipo"] != CAMBIO or old_value != new_value:
+            yield tuple(change[k] for k in key), old_value, new_value
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--old", required=True, help="Previous quincena CSV")
+    parser.add_argument("--new", required=True, help="Current quincena CSV")
+    parser.add_argument("--out", required=True, help="Output change log (.tsv[.gz])")
+    parser.add_argument(
+        "--key",
+        default=",".join(DEFAULT_KEY),
+        help="Comma separated key columns (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--presorted",
+        action="store_true",
+        help="Inputs are already sorted by the key, stream without sorting",
+    )
+    parser.add_argument("--delim", default=",", help="Input field delimiter")
+    parser.add_argument("--encoding", default="utf-8", help="Input encoding")
+    args = parser.parse_args(argv)
+
+    key = args.key.split(",")
+    changes = diff_snapshots(
+        args.old,
+        args.new,
+        key=key,
+        presorted=args.presorted,
+        delimiter=args.delim,
+        encoding=args.encoding,
+    )
+    summary = write_change_log(changes, args.out)
+    for label, n in sorted(summary.items()):
+        print(f"{label}\t{n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
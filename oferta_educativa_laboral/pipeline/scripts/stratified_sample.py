@@ -0,0 +1,136 @@
+"""
+stratified_sample
+=================
+
+Muestra estratificada y reproducible de una quincena del SIAP para iterar
+rapido sobre los scripts de analisis y el reporte (modo ``--sample`` del
+pipeline).
+
+Cada estrato (por defecto ``DELEGACION`` x ``DESCRIP_CLASCATEG`` x ``PLZOCU``)
+aporta ``round(N_h * fraccion)`` registros (al menos ``--min-per-stratum``).
+La seleccion depende solo de un hash de la llave (``CURP``) y de la semilla,
+asi que es la misma en cada corrida y en quincenas distintas sigue a las
+mismas personas. La columna ``PESO_MUESTRA`` (``N_h / n_h``) permite escalar
+conteos a la plantilla completa, ver :func:`weighted_counts`.
+
+Uso:
+
+    python stratified_sample.py --in Qna_15_Plantilla_2025.csv \\
+        --out Qna_15_Plantilla_2025_muestra.csv --fraction 0.02
+"""
+
+import argparse
+import sys
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STRATA: List[str] = ["DELEGACION", "DESCRIP_CLASCATEG", "PLZOCU"]
+DEFAULT_KEY = "CURP"
+WEIGHT_COL = "PESO_MUESTRA"
+
+
+def stratified_sample(
+    df: pd.DataFrame,
+    fraction: float,
+    strata: Sequence[str] = DEFAULT_STRATA,
+    key: Optional[str] = DEFAULT_KEY,
+    seed: int = 42,
+    min_per_stratum: int = 1,
+) -> pd.DataFrame:
+    """Return a reproducible stratified sample of ``df`` with sampling weights.
+
+    Parameters
+    ----------
+    df:
+        Full snapshot.
+    fraction:
+        Fraction of each stratum to keep, in ``(0, 1]``.
+    strata:
+        Columns defining the strata. Missing values form their own stratum.
+    key:
+        Column whose hash orders the rows within each stratum. If ``None`` the
+        row position is used instead.
+    seed:
+        Changes the (deterministic) selection.
+    min_per_stratum:
+        Lower bound of rows kept per stratum, so that small strata are
+        represented.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Sampled rows in their original order, with a ``PESO_MUESTRA`` column.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError("fraction must be in (0, 1]")
+    missing = [c for c in strata if c not in df.columns]
+    if missing:
+        raise KeyError(f"Strata columns not found: {missing}")
+
+    source = df[key] if key is not None else pd.Series(np.arange(len(df)))
+    hashed = pd.util.hash_pandas_object(source, index=False, hash_key=_hash_key(seed))
+
+    groups = df.groupby(list(strata), dropna=False, sort=False)
+    sizes = groups[strata[0]].transform("size").to_numpy()
+    stratum = groups.ngroup().to_numpy()
+    n_keep = np.clip(np.rint(sizes * fraction), min_per_stratum, None)
+    n_keep = np.minimum(n_keep, sizes).astype(np.int64)
+
+    # Rank rows within each stratum by their hash, keep the lowest n_keep.
+    order = np.lexsort((hashed.to_numpy(), stratum))
+    rank = np.empty(len(df), dtype=np.int64)
+    sorted_strata = stratum[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_strata)) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(df)]))
+    rank[order] = np.arange(len(df)) - group_start
+
+    keep = rank < n_keep
+    sample = df.loc[keep].copy()
+    sample[WEIGHT_COL] = sizes[keep] / n_keep[keep]
+    return sample
+
+
+def _hash_key(seed: int) -> str:
+    """pandas expects a 16 character hash key."""
+    return f"{seed:016d}"[-16:]
+
+
+def weighted_counts(
+    sample: pd.DataFrame, by: Sequence[str], weight: str = WEIGHT_COL
+) -> pd.Series:
+    """Estimate full-table counts per group from a weighted sample."""
+    return sample.groupby(list(by), dropna=False)[weight].sum()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--in", dest="infile", required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--fraction", type=float, required=True)
+    parser.add_argument("--strata", default=",".join(DEFAULT_STRATA))
+    parser.add_argument("--key", default=DEFAULT_KEY)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-per-stratum", type=int, default=1)
+    parser.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(
+        args.infile, dtype=str, keep_default_na=False, encoding=args.encoding
+    )
+    sample = stratified_sample(
+        df,
+        args.fraction,
+        strata=args.strata.split(","),
+        key=args.key or None,
+        seed=args.seed,
+        min_per_stratum=args.min_per_stratum,
+    )
+    sample.to_csv(args.out, index=False)
+    print(f"{len(sample)} of {len(df)} rows sampled into {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
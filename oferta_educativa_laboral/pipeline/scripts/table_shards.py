@@ -0,0 +1,231 @@
+"""
+table_shards
+============
+
+Tablas interactivas paginadas y cargadas bajo demanda, en lugar de los
+``DT::datatable`` guardados con ``saveWidget(..., selfcontained = TRUE)`` que
+incrustan la tabla completa como JSON en un solo HTML.
+
+La tabla se ordena y se divide en bloques de filas (``shard_00000.json.gz``,
+JSON comprimido con gzip) con un indice pequeño (``index.json``): columnas,
+filas por bloque, ordenes disponibles y, por bloque, los valores presentes de
+las columnas con pocas categorias. Cada columna ordenable tiene su propia
+copia ordenada de los bloques, asi que ordenar (ascendente o descendente) es
+leer otra lista de bloques; por defecto solo lo son las columnas del orden
+(``--sort``), ya que cada copia es otra escritura de la tabla completa. ``index.html`` lee el indice y solo descarga los
+bloques de la pagina visible; los filtros por categoria descartan bloques con
+el indice y la busqueda de texto recorre los bloques hasta llenar la pagina.
+
+Estructura:
+
+    <outdir>/index.html                      visor
+    <outdir>/index.json                      indice
+    <outdir>/order_0/shard_00000.json.gz     orden por defecto
+    <outdir>/order_1/shard_00000.json.gz     orden por la 1a columna ordenable
+
+El visor usa ``fetch``, asi que el directorio se sirve como sitio estatico,
+p.ej. ``python -m http.server -d <outdir>``.
+
+Uso:
+
+    python table_shards.py --in tabla_loc_vacs_nombreAR_interactiva.txt \\
+        --outdir tablas/tabla_loc_vacs_nombreAR --sort=-vacantes,DELEGACION \\
+        --title "Plazas por localidad"
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+VIEWER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "table_viewer.html")
+INDEX = "index.json"
+
+
+def parse_sort(spec: Optional[str]) -> List[Tuple[str, bool]]:
+    """Parse ``"-vacantes,DELEGACION"`` into ``[(column, ascending), ...]``."""
+    keys = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if item:
+            keys.append((item.lstrip("-+"), not item.startswith("-")))
+    return keys
+
+
+def sort_table(df: pd.DataFrame, keys: Sequence[Tuple[str, bool]]) -> pd.DataFrame:
+    """Stable sort on ``keys``, missing values last."""
+    missing = [c for c, _ in keys if c not in df.columns]
+    if missing:
+        raise KeyError(f"Sort columns {missing} not found in table")
+    if not keys:
+        return df.reset_index(drop=True)
+    return df.sort_values(
+        [c for c, _ in keys],
+        ascending=[a for _, a in keys],
+        kind="stable",
+        na_position="last",
+        ignore_index=True,
+    )
+
+
+def column_types(df: pd.DataFrame) -> List[str]:
+    return [
+        "number" if pd.api.types.is_numeric_dtype(df[c]) else "string"
+        for c in df.columns
+    ]
+
+
+def facet_values(df: pd.DataFrame, max_values: int = 64) -> Dict[str, List[str]]:
+    """Sorted distinct values of the text columns with at most
+    ``max_values`` categories; they get a value filter in the viewer."""
+    facets = {}
+    for column, kind in zip(df.columns, column_types(df)):
+        if kind != "string":
+            continue
+        values = df[column].dropna().astype(str).unique()
+        if 0 < len(values) <= max_values:
+            facets[column] = sorted(values)
+    return facets
+
+
+def _records(df: pd.DataFrame) -> list:
+    return df.astype(object).where(df.notna(), None).to_numpy().tolist()
+
+
+def write_shards(
+    df: pd.DataFrame,
+    directory: str,
+    shard_rows: int,
+    facets: Dict[str, List[str]],
+) -> List[dict]:
+    """Write ``df`` in blocks of ``shard_rows`` rows and describe each one.
+
+    Shards are gzip files with a fixed timestamp so equal tables give equal
+    bytes.
+    """
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    codes = {c: {v: i for i, v in enumerate(values)} for c, values in facets.items()}
+    shards = []
+    for i, start in enumerate(range(0, max(len(df), 1), shard_rows)):
+        part = df.iloc[start : start + shard_rows]
+        name = f"shard_{i:05d}.json.gz"
+        payload = json.dumps(
+            _records(part), ensure_ascii=False, separators=(",", ":"), default=str
+        )
+        with open(os.path.join(directory, name), "wb") as fh:
+            with gzip.GzipFile(fileobj=fh, mode="wb", mtime=0) as gz:
+                gz.write(payload.encode("utf-8"))
+        present = {
+            c: sorted(codes[c][v] for v in part[c].dropna().astype(str).unique())
+            for c in facets
+        }
+        shards.append(
+            {"file": name, "start": start, "rows": len(part), "facets": present}
+        )
+    return shards
+
+
+def build_table(
+    df: pd.DataFrame,
+    outdir: str,
+    sort: Sequence[Tuple[str, bool]] = (),
+    sortable: Optional[Sequence[str]] = None,
+    shard_rows: int = 1000,
+    page_size: int = 25,
+    max_facet_values: int = 64,
+    title: str = "",
+) -> dict:
+    """Write the sharded table, its index and the viewer to ``outdir``.
+
+    ``sortable`` lists the columns that get their own sorted copy (by
+    default those of ``sort``, as each copy writes the whole table again);
+    ties keep the ``sort`` order. Returns the index.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    base = sort_table(df, sort)
+    facets = facet_values(base, max_facet_values)
+    sortable = [c for c, _ in sort] if sortable is None else list(sortable)
+    orders = [{"column": None, "dir": "order_0"}]
+    orders += [{"column": c, "dir": f"order_{i}"} for i, c in enumerate(sortable, 1)]
+    for order in orders:
+        keys = [] if order["column"] is None else [(order["column"], True)]
+        table = sort_table(base, keys)
+        order["shards"] = write_shards(
+            table, os.path.join(outdir, order["dir"]), shard_rows, facets
+        )
+    index = {
+        "title": title,
+        "columns": list(base.columns),
+        "types": column_types(base),
+        "rows": len(base),
+        "sort": [[c, a] for c, a in sort],
+        "page_size": page_size,
+        "shard_rows": shard_rows,
+        "facets": facets,
+        "orders": orders,
+    }
+    with open(os.path.join(outdir, INDEX), "w", encoding="utf-8") as fh:
+        json.dump(index, fh, ensure_ascii=False, separators=(",", ":"))
+    shutil.copyfile(VIEWER, os.path.join(outdir, "index.html"))
+    return index
+
+
+def read_shard(outdir: str, order: int, shard: int) -> pd.DataFrame:
+    """Read one shard back as a frame (for checks and scripts)."""
+    with open(os.path.join(outdir, INDEX), encoding="utf-8") as fh:
+        index = json.load(fh)
+    entry = index["orders"][order]
+    path = os.path.join(outdir, entry["dir"], entry["shards"][shard]["file"])
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        return pd.DataFrame(json.load(fh), columns=index["columns"])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--in", dest="infile", required=True)
+    parser.add_argument("--outdir", required=True)
+    parser.add_argument("-d", "--delim", default="\t")
+    parser.add_argument("--encoding", default="utf-8")
+    parser.add_argument("--sort", help="Default order, e.g. -vacantes,DELEGACION")
+    parser.add_argument(
+        "--sortable",
+        help="Comma separated sortable columns (default: those of --sort, "
+        "empty for none)",
+    )
+    parser.add_argument("--shard-rows", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=25)
+    parser.add_argument("--max-facet-values", type=int, default=64)
+    parser.add_argument("--title", default="")
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.infile, sep=args.delim, encoding=args.encoding)
+    sortable = None
+    if args.sortable is not None:
+        sortable = [c for c in args.sortable.split(",") if c]
+    index = build_table(
+        df,
+        args.outdir,
+        sort=parse_sort(args.sort),
+        sortable=sortable,
+        shard_rows=args.shard_rows,
+        page_size=args.page_size,
+        max_facet_values=args.max_facet_values,
+        title=args.title or os.path.basename(args.infile).split(".")[0],
+    )
+    print(
+        f"{index['rows']} rows, {len(index['orders'])} orders written to "
+        f"{args.outdir}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
 #!/usr/bin/env bash
 # sum_by_first_column.sh: Group by the 1st column and sum the last column.
 #
+# Superseded by pipeline/scripts/group_sum.py (streaming, multi-file, any
+# group columns), e.g.: group_sum.py --no-header --by 1 --agg sum_col1=sum:last FILE
+#
 # Usage:
 #   sum_by_first_column.sh --file FILE [--delim DELIM]
 #   sum_by_first_column.sh -h|--help
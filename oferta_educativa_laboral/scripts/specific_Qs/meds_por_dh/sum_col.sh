@@ -1,6 +1,8 @@
 #!/usr/bin/env bash
 
 # sum_last_column.sh: Sum the last column of a delimited file.
+# Superseded by pipeline/scripts/group_sum.py, e.g.:
+#   group_sum.py --no-header --agg sum=sum:last FILE
 # Usage: sum_last_column.sh [-f FILE] [-d DELIM]
 #   -f | --file      Path to input file (required)
 #   -d | --delim     Field delimiter (default: '|')
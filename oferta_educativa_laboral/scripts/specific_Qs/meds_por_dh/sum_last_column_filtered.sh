@@ -2,6 +2,9 @@
 # sum_last_column_filtered.sh: Sum the last column of a delimited file,
 #                             filtering only rows where a specified column equals a given value.
 #
+# Superseded by pipeline/scripts/group_sum.py, e.g.:
+#   group_sum.py --no-header --agg sum=sum:last:COL==VALUE FILE
+#
 # Usage:
 #   sum_last_column_filtered.sh \
 #     --file FILE             Path to input file (required) \
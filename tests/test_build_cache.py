@@ -0,0 +1,93 @@
+from pathlib import Path
+import os
+import sys
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import build_cache
+
+    return build_cache
+
+
+def test_task_key_ignores_location_and_mtime(tmp_path):
+    build_cache = _load_module()
+    a = tmp_path / "a" / "Qna_07.csv"
+    b = tmp_path / "b" / "Qna_07.csv"
+    for path in (a, b):
+        path.parent.mkdir()
+        path.write_text("CURP\nX1\n")
+    os.utime(b, (0, 0))
+    assert build_cache.task_key([str(a)]) == build_cache.task_key([str(b)])
+
+
+def test_task_key_changes_with_content_params_and_script(tmp_path):
+    build_cache = _load_module()
+    data = tmp_path / "Qna_07.csv"
+    script = tmp_path / "stage.R"
+    data.write_text("CURP\nX1\n")
+    script.write_text("print(1)\n")
+    base = build_cache.task_key([str(data)], {"key": "CURP"}, [str(script)])
+    assert base != build_cache.task_key([str(data)], {"key": "NSS"}, [str(script)])
+    script.write_text("print(2)\n")
+    assert base != build_cache.task_key([str(data)], {"key": "CURP"}, [str(script)])
+    data.write_text("CURP\nX2\n")
+    assert base != build_cache.task_key([str(data)], {"key": "CURP"}, [])
+
+
+def test_store_and_restore_roundtrip(tmp_path):
+    build_cache = _load_module()
+    cache = build_cache.BuildCache(str(tmp_path / "cache"))
+    out = tmp_path / "node1" / "sub" / "table.tsv"
+    out.parent.mkdir(parents=True)
+    out.write_text("n\t1\n")
+    assert not cache.restore("k1", str(tmp_path / "node2"))
+    cache.store("k1", [str(out)], str(tmp_path / "node1"))
+
+    assert cache.restore("k1", str(tmp_path / "node2"))
+    assert (tmp_path / "node2" / "sub" / "table.tsv").read_text() == "n\t1\n"
+
+
+def test_restore_touches_unchanged_outputs(tmp_path):
+    build_cache = _load_module()
+    cache = build_cache.BuildCache(str(tmp_path / "cache"))
+    out = tmp_path / "table.tsv"
+    out.write_text("n\t1\n")
+    cache.store("k1", [str(out)], str(tmp_path))
+    os.utime(out, (0, 0))
+
+    assert cache.restore("k1", str(tmp_path))
+    assert out.stat().st_mtime > 0
+
+
+def test_run_cli_skips_command_on_cache_hit(tmp_path):
+    build_cache = _load_module()
+    infile = tmp_path / "in.txt"
+    infile.write_text("x")
+    out = tmp_path / "out.txt"
+    counter = tmp_path / "count.txt"
+    command = [
+        sys.executable,
+        "-c",
+        f"p='{counter}'; import os; "
+        f"n = int(open(p).read()) + 1 if os.path.exists(p) else 1; "
+        f"open(p, 'w').write(str(n)); open('{out}', 'w').write('done')",
+    ]
+    args = [
+        "run",
+        "--cache-dir",
+        str(tmp_path / "cache"),
+        "--inputs",
+        str(infile),
+        "--outputs",
+        str(out),
+        "--root",
+        str(tmp_path),
+        "--",
+    ] + command
+    assert build_cache.main(args) == 0
+    out.unlink()
+    assert build_cache.main(args) == 0
+    assert out.read_text() == "done"
+    assert counter.read_text() == "1"
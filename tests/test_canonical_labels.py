@@ -0,0 +1,93 @@
+from pathlib import Path
+import sys
+
+import pandas as pd
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import canonical_labels
+
+    return canonical_labels
+
+
+ALIASES = """
+'*':
+    patterns:
+        - pattern: '^OTRO_\\d+$'
+          label: Otro
+DEPENDENCIA:
+    aliases:
+        HGZ NUM 1: HGZ 1
+"""
+
+
+def test_variants_share_one_label_across_runs(tmp_path):
+    canonical_labels = _load_module()
+    path = str(tmp_path / "label_map.tsv")
+    values = pd.Series(
+        ["MEDICO NO FAMILIAR     80", "MEDICO NO FAMILIAR 80", "1.MÉDICOS"]
+        + ["1.Médicos", " 1.MEDICOS", None, "Otro_3"]
+    )
+    label_map = canonical_labels.LabelMap(path)
+    first = label_map.canonicalize(values, "CATEGORIA")
+    assert list(first[:5]) == ["MEDICO NO FAMILIAR 80"] * 2 + ["1.MÉDICOS"] * 3
+    assert pd.isna(first[5])
+    label_map.save()
+
+    # A later run where the unaccented spelling dominates keeps the label.
+    later = canonical_labels.LabelMap(path)
+    result = later.canonicalize(
+        pd.Series(["1.MEDICOS"] * 5 + ["1.MÉDICOS"]), "CATEGORIA"
+    )
+    assert set(result) == {"1.MÉDICOS"}
+    later.save()
+    table = pd.read_csv(path, sep="\t")
+    assert table["raw"].is_unique
+
+
+def test_aliases_and_cli(tmp_path):
+    canonical_labels = _load_module()
+    aliases = tmp_path / "aliases.yml"
+    aliases.write_text(ALIASES)
+    infile = tmp_path / "Qna_07_Plantilla_2025.csv"
+    infile.write_text(
+        "CURP,DEPENDENCIA,CATEGORIA\n"
+        "A,HGZ Num 1,Otro_1\n"
+        "B,HGZ 1,Otro_2\n"
+        "C,UMF  5,MEDICO\n"
+    )
+    out = tmp_path / "out.csv"
+    args = ["--in", str(infile), "--out", str(out)]
+    args += ["--map", str(tmp_path / "map.tsv"), "--aliases", str(aliases)]
+    assert canonical_labels.main(args) == 0
+    df = pd.read_csv(out, dtype=str)
+    assert list(df["DEPENDENCIA"]) == ["HGZ 1", "HGZ 1", "UMF 5"]
+    assert list(df["CATEGORIA"]) == ["Otro", "Otro", "MEDICO"]
+    assert list(df["CURP"]) == ["A", "B", "C"]
+
+
+def test_all_missing_column(tmp_path):
+    canonical_labels = _load_module()
+    infile = tmp_path / "Qna_07_Plantilla_2025.csv"
+    infile.write_text("CURP,ADSCRIPCION\nA,\nB,\n")
+    out = tmp_path / "out.csv"
+    args = ["--in", str(infile), "--out", str(out), "--map", str(tmp_path / "m.tsv")]
+    assert canonical_labels.main(args) == 0
+    assert pd.read_csv(out)["ADSCRIPCION"].isna().all()
+
+
+def test_learn_only_fixes_spellings_before_rewriting(tmp_path):
+    canonical_labels = _load_module()
+    old = tmp_path / "Qna_17_Plantilla_2024.csv"
+    new = tmp_path / "Qna_07_Plantilla_2025.csv"
+    old.write_text("CATEGORIA\n1.MÉDICOS\n")
+    new.write_text("CATEGORIA\n1.MEDICOS\n1.MEDICOS\n")
+    path = str(tmp_path / "map.tsv")
+    assert canonical_labels.main(["--map", path, "--in", str(old), str(new)]) == 0
+
+    out = tmp_path / "out.csv"
+    args = ["--map", path, "--in", str(new), "--out", str(out)]
+    assert canonical_labels.main(args) == 0
+    assert set(pd.read_csv(out)["CATEGORIA"]) == {"1.MÉDICOS"}
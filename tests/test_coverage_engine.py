@@ -0,0 +1,151 @@
+from pathlib import Path
+import sys
+
+import pandas as pd
+import pytest
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import coverage_engine
+
+    return coverage_engine
+
+
+ALIASES = (
+    Path(__file__).resolve().parents[1]
+    / "oferta_educativa_laboral/pipeline/configuration/label_aliases.yml"
+)
+
+
+def _snapshot(path, rows):
+    pd.DataFrame(
+        rows, columns=["DELEGACION", "NOMBREAR", "DESCRIP_CLASCATEG", "PLZOCU"]
+    ).to_csv(path, index=False)
+    return str(path)
+
+
+def _engine(coverage_engine, store):
+    from oferta_educativa_laboral.pipeline.scripts import canonical_labels
+
+    labels = canonical_labels.LabelMap(
+        None, canonical_labels.load_aliases(str(ALIASES))
+    )
+    return coverage_engine.CoverageEngine(str(store), labels)
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    snapshot = _snapshot(
+        tmp_path / "Qna_07_Plantilla_2025.csv",
+        [
+            ("35 - DF Norte", "PEDIATRIA", "1.MÉDICOS", "1"),
+            ("36 - DF Norte", "PEDIATRIA", "1.MÉDICOS", "1"),
+            ("Veracruz Norte", "PEDIATRIA", "1.MÉDICOS", "1"),
+            ("Veracruz Sur", "ANESTESIOLOGIA", "1.MÉDICOS", "1"),
+            ("Veracruz Sur", "PEDIATRIA", "1.MÉDICOS", "0"),
+            ("Nivel Central", "PEDIATRIA", "1.MÉDICOS", "1"),
+        ],
+    )
+    denominators = tmp_path / "pda_OOAD-2025-03-31.tsv"
+    pd.DataFrame(
+        {
+            "descripcion delegación": [
+                "CIUDAD DE MEXICO NORTE",
+                "Veracruz Norte",
+                "Veracruz Sur",
+            ],
+            "total_derechohabientes": [2000, 1000, 3000],
+        }
+    ).to_csv(denominators, sep="\t", index=False)
+    return snapshot, str(denominators)
+
+
+def test_rates_join_canonical_geography(tmp_path, inputs):
+    coverage_engine = _load_module()
+    snapshot, denominators = inputs
+    engine = _engine(coverage_engine, tmp_path / "store")
+    engine.add_denominators(denominators)
+    engine.add_snapshot(snapshot, filters={"PLZOCU": "1"})
+
+    rates = engine.rates().set_index(["nivel", "geografia", "especialidad"])
+    cdmx = rates.loc[("ooad", "Ciudad de México Norte", "PEDIATRIA")]
+    assert (cdmx["n"], cdmx["denominador"], cdmx["por_mil"]) == (2, 2000, 1.0)
+    veracruz = rates.loc[("estado", "Veracruz", "Total")]
+    assert (veracruz["n"], veracruz["denominador"]) == (2, 4000)
+    assert veracruz["fecha_dir"] == "2025-03-31"
+    # Nivel Central has no DIR data but counts in the national total:
+    assert pd.isna(rates.loc[("ooad", "Nivel Central", "Total"), "por_mil"])
+    national = rates.loc[("nacional", "Nacional", "Total")]
+    assert national["por_10mil"] == pytest.approx(5 / 6000 * 10000)
+
+
+def test_nearest_denominator_date(tmp_path, inputs):
+    coverage_engine = _load_module()
+    snapshot, denominators = inputs
+    later = tmp_path / "dir_later.tsv"
+    pd.read_csv(denominators, sep="\t").assign(
+        total_derechohabientes=lambda df: df["total_derechohabientes"] * 2
+    ).to_csv(later, sep="\t", index=False)
+    engine = _engine(coverage_engine, tmp_path / "store")
+    engine.add_denominators(denominators)
+    engine.add_denominators(str(later), date="2025-10-31")
+    engine.add_snapshot(snapshot)
+
+    rates = engine.rates()
+    assert set(rates["fecha_dir"].dropna()) == {"2025-03-31"}
+
+
+def test_updates_are_incremental(tmp_path, inputs):
+    coverage_engine = _load_module()
+    snapshot, denominators = inputs
+    store = tmp_path / "store"
+    out = tmp_path / "rates.tsv"
+    engine = _engine(coverage_engine, store)
+    assert engine.add_denominators(denominators)
+    assert engine.add_snapshot(snapshot)
+    engine.update_rates(str(out))
+
+    engine = _engine(coverage_engine, store)
+    assert not engine.add_denominators(denominators)
+    assert not engine.add_snapshot(snapshot)
+    new = _snapshot(
+        tmp_path / "Qna_15_Plantilla_2025.csv",
+        [("Veracruz Sur", "PEDIATRIA", "1.MÉDICOS", "1")],
+    )
+    assert engine.add_snapshot(new)
+    assert engine.sources["stale"] == ["Qna_15_Plantilla_2025"]
+    table = engine.update_rates(str(out))
+
+    assert set(table["quincena"]) == {"Qna_07_Plantilla_2025", "Qna_15_Plantilla_2025"}
+    pd.testing.assert_frame_equal(
+        table, _engine(coverage_engine, store).rates(), check_dtype=False
+    )
+
+
+def test_sample_weights_scale_counts(tmp_path, inputs):
+    coverage_engine = _load_module()
+    snapshot, denominators = inputs
+    sample = pd.read_csv(snapshot, dtype=str).assign(PESO_MUESTRA="2.5")
+    sample.to_csv(tmp_path / "Qna_07_Plantilla_2025_muestra.csv", index=False)
+    engine = _engine(coverage_engine, tmp_path / "store")
+    engine.add_snapshot(str(tmp_path / "Qna_07_Plantilla_2025_muestra.csv"))
+
+    counts = engine.counts.set_index(["ooad", "especialidad"])["n"]
+    assert counts[("Ciudad de México Norte", "PEDIATRIA")] == 5.0
+
+
+def test_has_rates_needs_denominators(tmp_path, inputs):
+    coverage_engine = _load_module()
+    snapshot, denominators = inputs
+    out = str(tmp_path / "rates.tsv")
+    engine = _engine(coverage_engine, tmp_path / "store")
+    engine.add_snapshot(snapshot)
+    engine.update_rates(out)
+    assert not coverage_engine.has_rates(out, "Qna_07_Plantilla_2025")
+
+    engine.add_denominators(denominators)
+    engine.update_rates(out)
+    assert coverage_engine.has_rates(out, "Qna_07_Plantilla_2025")
+    assert not coverage_engine.has_rates(out, "Qna_15_Plantilla_2025")
@@ -0,0 +1,75 @@
+from pathlib import Path
+import json
+import sys
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import figure_cache
+
+    return figure_cache
+
+
+# Stands in for render_figure.R: writes each spec's outfile and logs it.
+RENDERER = """
+import json, os, sys
+for entry in sys.argv[1:]:
+    spec = json.load(open(os.path.join(entry, "spec.json")))
+    with open(spec["outfile"], "w") as fh:
+        fh.write(open(os.path.join(entry, "data.rds")).read())
+    with open(os.environ["RENDER_LOG"], "a") as fh:
+        fh.write(spec["name"] + "\\n")
+"""
+
+
+def _queue(queue, outdir, data):
+    for name, value in data.items():
+        entry = queue / name
+        entry.mkdir(parents=True)
+        (entry / "data.rds").write_text(value)
+        spec = {"name": name, "outfile": str(outdir / f"{name}.pdf"), "params": {}}
+        (entry / "spec.json").write_text(json.dumps(spec))
+
+
+def test_only_changed_figures_are_rendered(tmp_path, monkeypatch):
+    figure_cache = _load_module()
+    renderer = tmp_path / "render.py"
+    renderer.write_text(RENDERER)
+    log = tmp_path / "render.log"
+    monkeypatch.setenv("RENDER_LOG", str(log))
+    queue, outdir = tmp_path / "queue", tmp_path / "out"
+    outdir.mkdir()
+    options = dict(jobs=2, renderer=str(renderer), rscript=sys.executable)
+
+    _queue(queue, outdir, {"FECHAING": "a", "FECHAPROBJUB": "b", "FECHAALTA": "c"})
+    result = figure_cache.render_queue(str(queue), **options)
+    assert len(result["rendered"]) == 3
+    assert figure_cache.queued_entries(str(queue)) == []
+
+    _queue(queue, outdir, {"FECHAING": "a", "FECHAPROBJUB": "B", "FECHAALTA": "c"})
+    result = figure_cache.render_queue(str(queue), **options)
+    assert [Path(f).name for f in result["rendered"]] == ["FECHAPROBJUB.pdf"]
+    assert len(result["skipped"]) == 2
+    assert (outdir / "FECHAPROBJUB.pdf").read_text() == "B"
+    assert sorted(log.read_text().split()) == sorted(
+        ["FECHAING", "FECHAPROBJUB", "FECHAALTA", "FECHAPROBJUB"]
+    )
+
+
+def test_figures_restored_from_build_cache(tmp_path, monkeypatch):
+    figure_cache = _load_module()
+    renderer = tmp_path / "render.py"
+    renderer.write_text(RENDERER)
+    monkeypatch.setenv("RENDER_LOG", str(tmp_path / "render.log"))
+    cache = str(tmp_path / "cache")
+    options = dict(renderer=str(renderer), rscript=sys.executable, cache_dir=cache)
+
+    # Same figures written to another (e.g. dated) results directory.
+    for day in ("day1", "day2"):
+        outdir = tmp_path / day
+        outdir.mkdir()
+        _queue(tmp_path / f"queue_{day}", outdir, {"plot": "x"})
+        result = figure_cache.render_queue(str(tmp_path / f"queue_{day}"), **options)
+    assert [Path(f).name for f in result["restored"]] == ["plot.pdf"]
+    assert (tmp_path / "day2" / "plot.pdf").read_text() == "x"
@@ -0,0 +1,121 @@
+from pathlib import Path
+import hashlib
+import json
+import sys
+
+import pandas as pd
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import flow_matrix
+
+    return flow_matrix
+
+
+HEADER = "CURP,DEPENDENCIA,DELEGACION,DESCRIPCION_SERVICIO,DESCRIP_CLASCATEG\n"
+OLD = HEADER + (
+    "A,HGZ 1,Veracruz Norte,URGENCIAS,9.RESIDENTES\n"
+    "B,HGZ 2,Veracruz Sur,URGENCIAS,9.RESIDENTES\n"
+    "C,HGR 1,Jalisco,PEDIATRIA,9.RESIDENTES\n"
+    "D,HGR 1,Jalisco,PEDIATRIA,1.MÉDICOS\n"
+)
+NEW = HEADER + (
+    "A,HGR 1,Jalisco,URGENCIAS,1.MÉDICOS\n"
+    "B,HGZ 1,Veracruz Norte,URGENCIAS,1.MÉDICOS\n"
+    "C,HGR 1,Jalisco,PEDIATRIA,1.MÉDICOS\n"
+    "E,HGZ 2,Veracruz Sur,PEDIATRIA,1.MÉDICOS\n"
+)
+
+
+def _snapshots(tmp_path):
+    old = tmp_path / "Qna_17_Plantilla_2024.csv"
+    new = tmp_path / "Qna_07_Plantilla_2025.csv"
+    old.write_text(OLD)
+    new.write_text(NEW)
+    return old, new
+
+
+def test_rollups_match_direct_counts(tmp_path):
+    flow_matrix = _load_module()
+    old, new = _snapshots(tmp_path)
+    cube = flow_matrix.flow_cube(
+        flow_matrix.read_levels(str(old)), flow_matrix.read_levels(str(new))
+    )
+    ooad = flow_matrix.rollup(cube, "ooad").set_index(["origen", "destino"])["n"]
+    assert ooad[("Veracruz Norte", "Jalisco")] == 1
+    assert ooad[("Jalisco", "(baja)")] == 1
+    assert ooad[("(alta)", "Veracruz Sur")] == 1
+
+    estado = flow_matrix.rollup(cube, "estado").set_index(["origen", "destino"])["n"]
+    assert estado[("Veracruz", "Veracruz")] == 1
+    assert estado[("Jalisco", "Jalisco")] == 1
+    assert cube["n"].sum() == 5
+
+    unit_to_ooad = flow_matrix.rollup(cube, "unidad", "ooad")
+    assert unit_to_ooad["n"].sum() == cube["n"].sum()
+    matrix = flow_matrix.to_matrix(flow_matrix.rollup(cube, "especialidad"))
+    assert matrix.loc["URGENCIAS", "URGENCIAS"] == 2
+
+
+def test_cli_filters_and_writes_tables(tmp_path):
+    flow_matrix = _load_module()
+    old, new = _snapshots(tmp_path)
+    outdir = tmp_path / "flows"
+    args = [
+        "--old",
+        str(old),
+        "--new",
+        str(new),
+        "--outdir",
+        str(outdir),
+        "--levels",
+        "ooad,estado",
+        "--filter-ant",
+        "DESCRIP_CLASCATEG=9.RESIDENTES",
+        "--no-unmatched",
+    ]
+    assert flow_matrix.main(args) == 0
+    pair = "Qna_17_Plantilla_2024__Qna_07_Plantilla_2025"
+    lines = (outdir / f"flows_ooad_{pair}.tsv").read_text().splitlines()
+    assert lines[0] == "origen\tdestino\tn"
+    assert sorted(lines[1:]) == [
+        "Jalisco\tJalisco\t1",
+        "Veracruz Norte\tJalisco\t1",
+        "Veracruz Sur\tVeracruz Norte\t1",
+    ]
+    assert (outdir / f"flows_ooad_estado_{pair}.tsv").exists()
+    assert (outdir / f"flow_cube_{pair}.tsv.gz").exists()
+
+
+def test_cohort_restricts_people(tmp_path):
+    flow_matrix = _load_module()
+    old, new = _snapshots(tmp_path)
+    cohort = tmp_path / "cohorte.csv"
+    cohort.write_text("CURP,EDO_NACIMIENTO\nA,Jalisco\nB,Sonora\n")
+    outdir = tmp_path / "flows"
+    args = ["--old", str(old), "--new", str(new), "--outdir", str(outdir)]
+    assert flow_matrix.main(args + ["--levels", "ooad", "--cohort", str(cohort)]) == 0
+    pair = "Qna_17_Plantilla_2024__Qna_07_Plantilla_2025"
+    lines = (outdir / f"flows_ooad_{pair}.tsv").read_text().splitlines()
+    assert sorted(lines[1:]) == [
+        "Veracruz Norte\tJalisco\t1",
+        "Veracruz Sur\tVeracruz Norte\t1",
+    ]
+    manifest = json.loads((outdir / f"flows_cohort_{pair}.json").read_text())
+    assert manifest["n"] == 2
+    assert manifest["sha256"] == hashlib.sha256(b"A\nB").hexdigest()
+
+
+def test_to_matrix_sums_repeated_cells(tmp_path):
+    flow_matrix = _load_module()
+    flows = pd.DataFrame(
+        {"origen": ["b", "a", "b"], "destino": ["x", "y", "x"], "n": [1, 2, 3]}
+    )
+    matrix = flow_matrix.to_matrix(flows)
+    assert isinstance(matrix.dtypes.iloc[0], pd.SparseDtype)
+    assert matrix.sparse.to_dense().to_dict() == {
+        "x": {"a": 0, "b": 4},
+        "y": {"a": 2, "b": 0},
+    }
@@ -0,0 +1,56 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import geometry_cache
+
+    return geometry_cache
+
+
+def test_source_key_follows_sidecars_and_tolerances(tmp_path):
+    geometry_cache = _load_module()
+    for ext in (".shp", ".shx", ".dbf"):
+        (tmp_path / f"mexico_OOADs{ext}").write_bytes(b"x")
+    shp = str(tmp_path / "mexico_OOADs.shp")
+    resolutions = geometry_cache.parse_resolutions("full=0,low=0.05")
+    assert resolutions == {"full": 0.0, "low": 0.05}
+    key = geometry_cache.source_key(shp, resolutions)
+    assert len(geometry_cache.source_files(shp)) == 3
+
+    (tmp_path / "mexico_OOADs.dbf").write_bytes(b"y")
+    assert geometry_cache.source_key(shp, resolutions) != key
+    assert geometry_cache.source_key(shp, {"full": 0.0}) != key
+    with pytest.raises(ValueError):
+        geometry_cache.parse_resolutions("low")
+
+
+def test_build_and_load(tmp_path):
+    pytest.importorskip("geopandas")
+    pytest.importorskip("pyogrio")
+    geometry_cache = _load_module()
+    import geopandas as gpd
+    from shapely.geometry import Polygon
+
+    # Two neighbours sharing a jagged edge.
+    edge = [(1 + 0.001 * (i % 2), i / 50) for i in range(51)]
+    left = Polygon([(0, 0)] + edge + [(0, 1)])
+    right = Polygon(edge + [(2, 1), (2, 0)])
+    gdf = gpd.GeoDataFrame({"name_es": ["A", "B"]}, geometry=[left, right], crs=4326)
+    shp = tmp_path / "ooads.shp"
+    gdf.to_file(shp)
+
+    cache = tmp_path / "cache"
+    manifest = geometry_cache.build(str(shp), str(cache), {"full": 0, "low": 0.01})
+    assert manifest["vertices"]["low"] < manifest["vertices"]["full"]
+    low = geometry_cache.load(str(cache), "ooads", "low")
+    assert list(low["name_es"]) == ["A", "B"]
+    assert low.geometry.is_valid.all()
+    assert low.geometry.iloc[0].intersection(low.geometry.iloc[1]).area < 1e-9
+    assert (
+        geometry_cache.build(str(shp), str(cache), {"full": 0, "low": 0.01}) == manifest
+    )
@@ -0,0 +1,61 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import group_sum
+
+    return group_sum
+
+
+PDA_A = "ID_DELEG_RP|ST_CONSULTORIO|TOT_CASOS\n1|1|10\n1|0|5\n2|1|7\n"
+PDA_B = "ID_DELEG_RP|ST_CONSULTORIO|TOT_CASOS\n2|0|3\n1|1|1\n"
+
+
+def test_parse_aggregate():
+    group_sum = _load_module()
+    agg = group_sum.parse_aggregate("adscritos=sum:TOT_CASOS:ST_CONSULTORIO==1")
+    assert agg.name == "adscritos"
+    assert agg.column == "TOT_CASOS"
+    assert agg.condition == ("ST_CONSULTORIO", "==", "1")
+    assert group_sum.parse_aggregate("count").name == "count"
+    with pytest.raises(ValueError):
+        group_sum.parse_aggregate("mean:TOT_CASOS")
+
+
+def test_multi_file_conditional_sums_match_pandas(tmp_path):
+    group_sum = _load_module()
+    a = tmp_path / "a.csv"
+    b = tmp_path / "b.csv"
+    a.write_text(PDA_A)
+    b.write_text(PDA_B)
+    aggregates = [
+        group_sum.parse_aggregate("total=sum:TOT_CASOS"),
+        group_sum.parse_aggregate("adscritos=sum:TOT_CASOS:ST_CONSULTORIO==1"),
+        group_sum.parse_aggregate("n=count"),
+    ]
+    result = group_sum.aggregate_files(
+        [str(a), str(b)], ["ID_DELEG_RP"], aggregates, jobs=2, chunksize=2
+    )
+    assert result["ID_DELEG_RP"].tolist() == ["1", "2"]
+    assert result["total"].tolist() == [16, 10]
+    assert result["adscritos"].tolist() == [11, 7]
+    assert result["n"].tolist() == [3, 2]
+
+
+def test_cli_replaces_awk_helpers(tmp_path, capsys):
+    group_sum = _load_module()
+    data = tmp_path / "pda.txt"
+    data.write_bytes("Tlaxcala|1|4\nTlaxcala|0|2\nMéxico|1|3\n".encode("cp1252"))
+    out = tmp_path / "sum.tsv"
+    args = ["--no-header", "--by", "1", "--agg", "sum_col1=sum:last"]
+    assert group_sum.main(args + ["--out", str(out), str(data)]) == 0
+    assert out.read_text().splitlines() == ["1\tsum_col1", "México\t3", "Tlaxcala\t6"]
+
+    args = ["--no-header", "--agg", "s=sum:last", "--filter", "2==1", str(data)]
+    assert group_sum.main(args) == 0
+    assert capsys.readouterr().out.splitlines() == ["s", "7"]
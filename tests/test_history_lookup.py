@@ -0,0 +1,73 @@
+from pathlib import Path
+import sys
+
+import numpy as np
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import history_lookup
+
+    return history_lookup
+
+
+HEADER = "CURP,MATRICULA,NSS,DELEGACION\n"
+
+
+def _history(tmp_path, history_lookup):
+    snapshots = {
+        "Qna_07_Plantilla_2025.csv": [
+            ("C%03d" % i, str(1000 + i), str(5000 + i), "Jalisco") for i in range(50)
+        ],
+        "Qna_15_Plantilla_2024.csv": [
+            ("C%03d" % i, str(1000 + i), str(5000 + i), "Sonora")
+            for i in range(0, 50, 2)
+        ],
+    }
+    for name, rows in snapshots.items():
+        path = tmp_path / name
+        path.write_text(HEADER + "".join(",".join(r) + "\n" for r in reversed(rows)))
+        history_lookup.build_partition(
+            str(path), str(tmp_path / "idx"), row_group_size=8
+        )
+    return history_lookup.HistoryIndex(str(tmp_path / "idx"))
+
+
+def test_bloom_filter_has_no_false_negatives():
+    history_lookup = _load_module()
+    bits, hashes = history_lookup.bloom_parameters(100, 0.01)
+    values = [f"X{i}" for i in range(100)]
+    packed = history_lookup.bloom_build(values, bits, hashes)[np.newaxis, :]
+    for value in values:
+        positions = history_lookup.bloom_positions(value, bits, hashes)
+        assert history_lookup.bloom_contains(packed, positions)[0]
+
+
+def test_lookup_across_snapshots_in_order(tmp_path):
+    history_lookup = _load_module()
+    index = _history(tmp_path, history_lookup)
+    found = index.lookup("1010", column="MATRICULA")
+    assert found["QUINCENA"].tolist() == [
+        "Qna_15_Plantilla_2024",
+        "Qna_07_Plantilla_2025",
+    ]
+    assert found["DELEGACION"].tolist() == ["Sonora", "Jalisco"]
+    assert len(index.lookup("C011")) == 1
+    assert index.lookup("C999").empty
+    # The sorted key is pruned to a single row group
+    partition = index.partitions[1]
+    assert partition.candidate_groups("CURP", "C020") == [2]
+
+
+def test_batch_cli(tmp_path):
+    history_lookup = _load_module()
+    _history(tmp_path, history_lookup)
+    ids = tmp_path / "ids.txt"
+    ids.write_text("5001\n5002\n")
+    out = tmp_path / "out.tsv"
+    args = ["batch", "--index-dir", str(tmp_path / "idx"), "--column", "NSS"]
+    assert history_lookup.main(args + ["--ids", str(ids), "--out", str(out)]) == 0
+    lines = out.read_text().splitlines()
+    assert lines[0].split("\t")[:2] == ["QUINCENA", "CURP"]
+    assert len(lines) == 4
@@ -0,0 +1,92 @@
+from pathlib import Path
+import json
+import shlex
+import sys
+
+import pytest
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import ingest_watch
+
+    return ingest_watch
+
+
+def test_stability_tracker_waits_for_size_to_settle(tmp_path):
+    ingest_watch = _load_module()
+    db = tmp_path / "Qna_07_2025.accdb"
+    db.write_bytes(b"x" * 10)
+    tracker = ingest_watch.StabilityTracker(settle=5)
+    tracker.touch(str(db), now=0)
+    assert tracker.stable(now=3) == []
+    db.write_bytes(b"x" * 20)
+    # Size changed, the settle clock restarts.
+    assert tracker.stable(now=6) == []
+    assert tracker.stable(now=10) == []
+    assert tracker.stable(now=11) == [str(db)]
+    assert len(tracker) == 0
+
+
+def test_queue_persists_status_and_skips_duplicates(tmp_path):
+    ingest_watch = _load_module()
+    status = tmp_path / "queue.json"
+    queue = ingest_watch.IngestQueue(str(status))
+    assert queue.enqueue("a.accdb", detected_at=0)
+    assert not queue.enqueue("a.accdb")
+    job = queue.next_job()
+    queue.mark(job, ingest_watch.RUNNING)
+    queue.mark(job, ingest_watch.DONE, 0)
+
+    reloaded = ingest_watch.IngestQueue(str(status))
+    assert reloaded.summary()[ingest_watch.DONE] == 1
+    assert json.loads(status.read_text())["jobs"][0]["latency_s"] > 0
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is Linux only"
+)
+def test_inotify_reports_new_files(tmp_path):
+    ingest_watch = _load_module()
+    notifier = ingest_watch.Inotify()
+    notifier.add_watch(str(tmp_path))
+    (tmp_path / "new.accdb").write_bytes(b"data")
+    paths = notifier.read_paths(timeout=1)
+    notifier.close()
+    assert str(tmp_path / "new.accdb") in paths
+
+
+def test_watch_runs_command_for_stable_file(tmp_path):
+    ingest_watch = _load_module()
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    status = tmp_path / "queue.json"
+    marker = tmp_path / "ran.txt"
+    queue = ingest_watch.IngestQueue(str(status))
+    queue.enqueue(str(data_dir / "Qna_07_2025.accdb"))
+    command = f"{sys.executable} -c \"open('{marker}', 'w').write('ok')\""
+    ingest_watch.watch(
+        str(data_dir), str(status), command=command, poll=0.01, max_iterations=2
+    )
+    assert marker.read_text() == "ok"
+    assert ingest_watch.IngestQueue(str(status)).summary()[ingest_watch.DONE] == 1
+
+
+def test_queue_latency_counts_from_first_event(tmp_path):
+    ingest_watch = _load_module()
+    db = tmp_path / "Qna_07_2025.accdb"
+    db.write_bytes(b"x" * 10)
+    tracker = ingest_watch.StabilityTracker(settle=5)
+    tracker.touch(str(db), now=0)
+    tracker.touch(str(db), now=4)
+    assert tracker.stable_since(now=8) == []
+    assert tracker.stable_since(now=9) == [(str(db), 0)]
+
+
+def test_default_command_finds_pipeline_from_any_directory():
+    ingest_watch = _load_module()
+    script = shlex.split(ingest_watch.DEFAULT_COMMAND)[1]
+    assert Path(script).is_absolute()
+    assert Path(script).name == "pipeline_oferta_laboral.py"
+    assert Path(script).exists()
@@ -70,3 +70,36 @@ def test_make_report_conditions(tmp_path, monkeypatch):
         p.unlink()
     module.make_report()
     assert (report_dir / "file.txt").exists() is False
+
+
+def test_get_quincenas_from_argv_and_config(monkeypatch):
+    module = _load_pipeline_module()
+    argv = [
+        "pipeline.py",
+        "make",
+        "full",
+        "--quincenas=Qna_07_Plantilla_2025,Qna_15_Plantilla_2025.csv",
+    ]
+    assert module.get_quincenas(argv) == [
+        "Qna_07_Plantilla_2025",
+        "Qna_15_Plantilla_2025",
+    ]
+    assert argv == ["pipeline.py", "make", "full"]
+
+    batch = {"batch": {"quincenas": ["Qna_01_Plantilla_2025"]}}
+    monkeypatch.setattr(module, "PARAMS", batch)
+    assert module.get_quincenas(argv) == ["Qna_01_Plantilla_2025"]
+    monkeypatch.setattr(module, "PARAMS", {"batch": {"quincenas": None}})
+    assert module.get_quincenas(argv) == []
+
+
+def test_get_sample_fraction(monkeypatch):
+    module = _load_pipeline_module()
+    argv = ["pipeline.py", "make", "full", "--sample", "0.05"]
+    assert module.get_sample_fraction(argv) == 0.05
+    assert argv == ["pipeline.py", "make", "full"]
+
+    monkeypatch.setattr(module, "PARAMS", {"sample": {"fraction": None}})
+    assert module.get_sample_fraction(argv) is None
+    with pytest.raises(ValueError, match="--sample"):
+        module.get_sample_fraction(["--sample=2"])
@@ -0,0 +1,149 @@
+from pathlib import Path
+import sys
+
+import pandas as pd
+import pytest
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import quality_rules
+
+    return quality_rules
+
+
+TABLE = """CURP,EDAD,IMP_SDO,FECHAINI,FECHAFIN,FECHALIMOCU,DEPENDENCIA
+BEML920313HCMLNS09,34,100.5,2020-01-01,2021-01-01,2025-01-01,HGZ 01
+bad curp,-3,abc,2022-01-01,2021-01-01,2090-01-01,UMF 99
+,NA,,NA,2021-01-01,,HGZ 01
+"""
+
+
+@pytest.fixture
+def table(tmp_path):
+    path = tmp_path / "Qna_15_Plantilla_2025.csv"
+    path.write_text(TABLE)
+    catalog = tmp_path / "catalogo.csv"
+    catalog.write_text("NOMBRE_UNIDAD\nHGZ 01\n")
+    return path, catalog
+
+
+def _config(catalog):
+    return {
+        "id_column": "CURP",
+        "rules": [
+            {
+                "name": "curp",
+                "type": "regex",
+                "column": "CURP",
+                "pattern": r"^[A-Z]{4}\d{6}[HM][A-Z]{5}[0-9A-Z]\d$",
+            },
+            {"name": "edad", "type": "range", "column": "EDAD", "min": 15},
+            {"name": "imp", "type": "range", "columns": ["IMP_SDO"], "min": 0},
+            {
+                "name": "orden",
+                "type": "date_order",
+                "before": "FECHAINI",
+                "after": "FECHAFIN",
+            },
+            {
+                "name": "futuro",
+                "type": "date_range",
+                "column": "FECHALIMOCU",
+                "max_years_ahead": 5,
+            },
+            {"name": "curp_na", "type": "not_null", "column": "CURP"},
+            {
+                "name": "unidad",
+                "type": "reference",
+                "column": "DEPENDENCIA",
+                "catalog": str(catalog),
+                "catalog_column": "NOMBRE_UNIDAD",
+            },
+            {"name": "lat", "type": "regex", "column": "LATITUD", "pattern": ".*"},
+        ],
+    }
+
+
+def test_check_file_counts_violations_per_rule(table, tmp_path):
+    quality_rules = _load_module()
+    path, catalog = table
+    out = tmp_path / "violations.tsv"
+    summary = quality_rules.check_file(
+        str(path), _config(catalog), str(out), chunksize=2
+    )
+    counts = summary.set_index("rule")["n_violations"].to_dict()
+    assert counts == {
+        "curp": 1,
+        "edad": 1,
+        "imp": 1,
+        "orden": 1,
+        "futuro": 1,
+        "curp_na": 1,
+        "unidad": 1,
+        "lat": 0,
+    }
+    assert summary.set_index("rule").loc["lat", "status"].startswith("skipped")
+
+    violations = pd.read_csv(out, sep="\t", dtype=str)
+    assert set(violations.loc[violations["rule"] == "curp_na", "row"]) == {"3"}
+    assert set(violations.loc[violations["rule"] == "edad", "CURP"]) == {"bad curp"}
+
+
+def test_missing_catalog_is_skipped(table):
+    quality_rules = _load_module()
+    path, catalog = table
+    catalog.unlink()
+    with pytest.warns(UserWarning, match="not found"):
+        summary = quality_rules.check_file(str(path), _config(catalog))
+    assert (
+        summary.set_index("rule").loc["unidad", "status"] == "skipped: catalog missing"
+    )
+
+
+def test_dates_are_day_first(tmp_path):
+    quality_rules = _load_module()
+    path = tmp_path / "Qna_15_Plantilla_2025.csv"
+    path.write_text("FECHAINI,FECHAFIN\n03/04/2020,10/03/2020\n")
+    rule = {"name": "orden", "type": "date_order"}
+    rule.update(before="FECHAINI", after="FECHAFIN")
+    summary = quality_rules.check_file(str(path), {"rules": [rule]})
+    assert summary.loc[0, "n_violations"] == 1
+
+
+def test_catalog_is_relative_to_rules_file(tmp_path):
+    quality_rules = _load_module()
+    rules = tmp_path / "configuration" / "rules.yml"
+    rules.parent.mkdir()
+    rules.write_text(
+        "rules:\n  - name: x\n    type: reference\n    column: A\n"
+        "    catalog: ../catalogo.csv\n    catalog_column: A\n"
+    )
+    config = quality_rules.load_rules(str(rules))
+    assert config["rules"][0]["catalog"] == str(
+        tmp_path / "configuration" / ".." / "catalogo.csv"
+    )
+
+
+def test_shipped_rules_file_is_valid():
+    quality_rules = _load_module()
+    rules = (
+        Path(__file__).resolve().parents[1]
+        / "oferta_educativa_laboral"
+        / "pipeline"
+        / "configuration"
+        / "quality_rules.yml"
+    )
+    config = quality_rules.load_rules(str(rules))
+    assert {"curp_formato", "rfc_formato", "nss_formato"} <= {
+        r["name"] for r in config["rules"]
+    }
+
+
+def test_unknown_rule_type_raises(tmp_path):
+    quality_rules = _load_module()
+    rules = tmp_path / "rules.yml"
+    rules.write_text("rules:\n  - name: x\n    type: magic\n    column: A\n")
+    with pytest.raises(ValueError, match="unknown type"):
+        quality_rules.load_rules(str(rules))
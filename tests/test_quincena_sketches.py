@@ -0,0 +1,63 @@
+from pathlib import Path
+import sys
+
+import numpy as np
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import quincena_sketches
+
+    return quincena_sketches
+
+
+def test_merged_sketches_match_exact_values():
+    quincena_sketches = _load_module()
+    values = np.random.default_rng(1).normal(40, 10, 20_000)
+    kll = quincena_sketches.KLLSketch()
+    kll.update(values[:12_000])
+    other = quincena_sketches.KLLSketch()
+    other.update(values[12_000:])
+    kll.merge(other)
+    estimate = kll.quantiles([0.5, 0.9])
+    assert np.allclose(estimate, np.quantile(values, [0.5, 0.9]), atol=0.5)
+    assert kll.n == 20_000
+
+    ids = [f"CURP{i}" for i in range(5000)]
+    hll = quincena_sketches.HyperLogLog()
+    hll.update(ids[:3000])
+    other = quincena_sketches.HyperLogLog()
+    other.update(ids[2000:])
+    assert abs(hll.merge(other).count() - 5000) < 150
+
+    top = quincena_sketches.MisraGries(k=3)
+    top.update(["A"] * 50 + ["B"] * 30 + list("CDEFGH"))
+    assert [v for v, _ in top.top(2)] == ["A", "B"]
+
+
+def test_store_queries_across_quincenas(tmp_path):
+    quincena_sketches = _load_module()
+    header = "CURP,EDAD,CATEGORIA,DELEGACION\n"
+    for name, offset in (("Qna_15_Plantilla_2024", 0), ("Qna_07_Plantilla_2025", 50)):
+        path = tmp_path / f"{name}.csv"
+        rows = [
+            f"C{i},{20 + i % 40},{'MF' if i % 3 else 'MNF'},"
+            f"{'Jalisco' if i % 2 else 'Sonora'}\n"
+            for i in range(offset, offset + 100)
+        ]
+        path.write_text(header + "".join(rows))
+        sketches = quincena_sketches.sketch_snapshot(str(path))
+        quincena_sketches.write_sketches(sketches, str(tmp_path / f"{name}.json.gz"))
+
+    store = quincena_sketches.SketchStore(str(tmp_path))
+    assert store.snapshots() == ["Qna_15_Plantilla_2024", "Qna_07_Plantilla_2025"]
+    assert store.snapshots([2025]) == ["Qna_07_Plantilla_2025"]
+    # Distinct counts are estimates (~1% error)
+    assert abs(store.distinct("CURP")["Total"] - 150) <= 3
+    in_2024 = store.distinct("CURP", snapshots=store.snapshots([2024]))["Total"]
+    assert abs(in_2024 - 100) <= 2
+    by_ooad = store.quantiles("EDAD", [0.5], group="DELEGACION")
+    assert by_ooad.loc["Jalisco", "n"] == 100
+    top = store.top("CATEGORIA", 1)
+    assert top["CATEGORIA"].tolist() == ["MF"]
@@ -0,0 +1,69 @@
+from pathlib import Path
+import json
+import subprocess
+import sys
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import shm_snapshot
+
+    return shm_snapshot
+
+
+def _arrow_file(path):
+    table = pa.table({"DELEGACION": ["Sonora", "Yucatán"], "n": [3, 5]})
+    feather.write_feather(table, str(path), compression="uncompressed")
+    return path
+
+
+def test_copy_lives_until_last_holder_releases(tmp_path):
+    shm_snapshot = _load_module()
+    source = _arrow_file(tmp_path / "2_clean_dups_col_types_Qna_07.arrow")
+    snapshots = shm_snapshot.SharedSnapshots(str(tmp_path / "shm"))
+
+    first = snapshots.acquire(str(source), "explore")
+    second = snapshots.acquire(str(source), "bivar")
+    assert first == second
+    assert [row["holders"] for row in snapshots.status()] == [["bivar", "explore"]]
+
+    assert snapshots.release(str(source), "explore") == 1
+    assert Path(first).exists()
+    assert snapshots.release(str(source), "bivar") == 0
+    assert not Path(first).exists()
+
+
+def test_attach_reads_without_copying(tmp_path):
+    shm_snapshot = _load_module()
+    source = _arrow_file(tmp_path / "snapshot.arrow")
+    snapshots = shm_snapshot.SharedSnapshots(str(tmp_path / "shm"))
+
+    with snapshots.shared(str(source), "explore") as buffer:
+        before = pa.total_allocated_bytes()
+        table = shm_snapshot.attach(buffer, columns=["DELEGACION"])
+        assert pa.total_allocated_bytes() == before
+        assert table.column("DELEGACION").to_pylist() == ["Sonora", "Yucatán"]
+    assert snapshots.status() == []
+
+
+def test_holders_of_finished_processes_are_dropped(tmp_path):
+    shm_snapshot = _load_module()
+    source = _arrow_file(tmp_path / "snapshot.arrow")
+    snapshots = shm_snapshot.SharedSnapshots(str(tmp_path / "shm"))
+    dead = subprocess.run(
+        [sys.executable, "-c", "import os; print(os.getpid())"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    buffer = snapshots.acquire(str(source), "killed", pid=int(dead.stdout))
+    refs = json.loads(Path(buffer.replace(".arrow", ".refs.json")).read_text())
+    assert list(refs) == ["killed"]
+
+    assert snapshots.cleanup() == [buffer]
+    assert not Path(buffer).exists()
@@ -0,0 +1,56 @@
+from pathlib import Path
+import sys
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import snapshot_archive
+
+    return snapshot_archive
+
+
+HEADER = "CURP,DELEGACION,CATEGORIA,EDAD\n"
+ROWS = ["C%03d,Jalisco,MEDICO FAMILIAR,%d\n" % (i, 30 + i % 20) for i in range(40)]
+
+
+def test_add_stores_only_changed_rows_and_restores_exactly(tmp_path):
+    snapshot_archive = _load_module()
+    first = tmp_path / "Qna_07_Plantilla_2025.csv"
+    second = tmp_path / "Qna_08_Plantilla_2025.csv"
+    first.write_text(HEADER + "".join(ROWS))
+    changed = ROWS[:35] + ["C001,Sonora,MEDICO FAMILIAR,31\n", "C999,Sonora,MNF,40\n"]
+    second.write_text(HEADER + "".join(changed))
+
+    archive = snapshot_archive.SnapshotArchive(str(tmp_path / "archive"))
+    assert archive.add(str(first), chunksize=16)["new_rows"] == 40
+    assert archive.add(str(second), chunksize=16)["new_rows"] == 2
+
+    # Reopen to read the persisted index
+    archive = snapshot_archive.SnapshotArchive(str(tmp_path / "archive"))
+    out = tmp_path / "restored.csv"
+    assert archive.restore("Qna_08_Plantilla_2025", str(out), batch_rows=10) == 37
+    assert out.read_text() == second.read_text()
+    archive.restore("Qna_07_Plantilla_2025", str(out))
+    assert out.read_text() == first.read_text()
+
+
+def test_row_hashes_depend_on_values_and_columns():
+    snapshot_archive = _load_module()
+    import pandas as pd
+
+    df = pd.DataFrame({"A": ["x", "x", "y"], "B": ["1", "1", "1"]})
+    h = snapshot_archive.row_hashes(df)
+    assert (h[0] == h[1]).all() and not (h[0] == h[2]).all()
+    renamed = snapshot_archive.row_hashes(df.rename(columns={"B": "C"}))
+    assert not (h[0] == renamed[0]).all()
+
+
+def test_cli_skips_archived_snapshots(tmp_path, capsys):
+    snapshot_archive = _load_module()
+    snap = tmp_path / "Qna_07_Plantilla_2025.csv"
+    snap.write_text(HEADER + "".join(ROWS))
+    args = ["add", "--archive", str(tmp_path / "archive"), str(snap)]
+    assert snapshot_archive.main(args) == 0
+    assert snapshot_archive.main(args) == 0
+    assert "already archived" in capsys.readouterr().err
@@ -0,0 +1,94 @@
+from collections import Counter
+from pathlib import Path
+import sys
+
+import pytest
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import snapshot_cdc
+
+    return snapshot_cdc
+
+
+HEADER = "CURP,CATEGORIA,ADSCRIPCION,PLZOCU,PLZSOB,DELEGACION\n"
+
+
+def _write(path, rows):
+    path.write_text(HEADER + "".join(",".join(r) + "\n" for r in rows))
+    return str(path)
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    old = _write(
+        tmp_path / "Qna_07_Plantilla_2025.csv",
+        [
+            ("C3", "MEDICO", "HGZ 01", "1", "0", "Jalisco"),
+            ("C1", "MEDICO", "HGZ 01", "1", "0", "Jalisco"),
+            ("C2", "ENFERMERA", "UMF 02", "1", "0", "Colima"),
+        ],
+    )
+    new = _write(
+        tmp_path / "Qna_15_Plantilla_2025.csv",
+        [
+            ("C1", "MEDICO", "HGZ 01", "1", "0", "Jalisco"),
+            ("C3", "MEDICO", "UMF 09", "0", "1", "Sonora"),
+            ("C4", "MEDICO", "HGZ 01", "1", "0", "Jalisco"),
+        ],
+    )
+    return old, new
+
+
+def test_diff_snapshots_classifies_changes(snapshots):
+    snapshot_cdc = _load_module()
+    changes = list(snapshot_cdc.diff_snapshots(*snapshots))
+    by_key = {c["CURP"]: c for c in changes}
+    assert set(by_key) == {"C2", "C3", "C4"}
+    assert by_key["C2"]["tipo"] == "baja"
+    assert by_key["C4"]["tipo"] == "alta"
+    assert by_key["C3"]["campos"] == "cambio_adscripcion;cambio_plzocu;cambio_plzsob"
+    assert by_key["C3"]["DELEGACION_ant"] == "Jalisco"
+    assert by_key["C3"]["DELEGACION_act"] == "Sonora"
+
+
+def test_presorted_rejects_unsorted_input(snapshots):
+    snapshot_cdc = _load_module()
+    with pytest.raises(ValueError, match="not sorted"):
+        list(snapshot_cdc.diff_snapshots(*snapshots, presorted=True))
+
+
+def test_update_counts_matches_recount(snapshots, tmp_path):
+    snapshot_cdc = _load_module()
+    old, new = snapshots
+    out = str(tmp_path / "cdc.tsv")
+    snapshot_cdc.write_change_log(snapshot_cdc.diff_snapshots(old, new), out)
+
+    counts = Counter({("Jalisco",): 2, ("Colima",): 1})
+    snapshot_cdc.update_counts(
+        counts, snapshot_cdc.read_change_log(out), ["DELEGACION"]
+    )
+    assert counts == Counter({("Jalisco",): 2, ("Sonora",): 1})
+
+
+def test_transitions_reports_moves(snapshots):
+    snapshot_cdc = _load_module()
+    changes = snapshot_cdc.diff_snapshots(*snapshots)
+    moves = list(snapshot_cdc.transitions(changes, "ADSCRIPCION"))
+    assert (("C3",), "HGZ 01", "UMF 09") in moves
+    assert (("C2",), "UMF 02", "") in moves
+
+
+def test_consecutive_pairs_orders_by_year_and_quincena():
+    snapshot_cdc = _load_module()
+    files = [
+        "Qna_03_Plantilla_2025.csv",
+        "Qna_17_Plantilla_2024.csv",
+        "Qna_01_Plantilla_2025.csv",
+    ]
+    assert snapshot_cdc.consecutive_pairs(files) == [
+        ("Qna_17_Plantilla_2024.csv", "Qna_01_Plantilla_2025.csv"),
+        ("Qna_01_Plantilla_2025.csv", "Qna_03_Plantilla_2025.csv"),
+    ]
@@ -0,0 +1,56 @@
+from pathlib import Path
+import sys
+
+import pandas as pd
+import pytest
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import stratified_sample
+
+    return stratified_sample
+
+
+def _snapshot():
+    data = Path(__file__).resolve().parents[1] / "data" / "synthetic_dataset.csv"
+    return pd.read_csv(data, dtype=str, keep_default_na=False)
+
+
+def test_sample_is_reproducible_and_weighted():
+    stratified_sample = _load_module()
+    df = _snapshot()
+    first = stratified_sample.stratified_sample(df, 0.1, seed=7)
+    second = stratified_sample.stratified_sample(df, 0.1, seed=7)
+    pd.testing.assert_frame_equal(first, second)
+    assert len(first) < len(df) * 0.2
+    # Weights add up to the size of the full table.
+    assert first["PESO_MUESTRA"].sum() == pytest.approx(len(df))
+
+
+def test_every_stratum_is_represented():
+    stratified_sample = _load_module()
+    df = _snapshot()
+    strata = stratified_sample.DEFAULT_STRATA
+    sample = stratified_sample.stratified_sample(df, 0.01)
+    full_strata = set(map(tuple, df[strata].drop_duplicates().to_numpy()))
+    sample_strata = set(map(tuple, sample[strata].drop_duplicates().to_numpy()))
+    assert sample_strata == full_strata
+
+
+def test_weighted_counts_estimate_full_counts():
+    stratified_sample = _load_module()
+    df = _snapshot()
+    sample = stratified_sample.stratified_sample(df, 0.2)
+    estimate = stratified_sample.weighted_counts(sample, ["DELEGACION"])
+    actual = df.groupby("DELEGACION").size()
+    pd.testing.assert_series_equal(
+        estimate.sort_index(), actual.astype(float).sort_index(), check_names=False
+    )
+
+
+def test_invalid_fraction():
+    stratified_sample = _load_module()
+    with pytest.raises(ValueError):
+        stratified_sample.stratified_sample(_snapshot(), 0)
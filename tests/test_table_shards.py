@@ -0,0 +1,67 @@
+from pathlib import Path
+import json
+import sys
+
+import pandas as pd
+
+
+def _load_module():
+    base = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(base))
+    from oferta_educativa_laboral.pipeline.scripts import table_shards
+
+    return table_shards
+
+
+def test_shards_cover_table_in_each_order(tmp_path):
+    table_shards = _load_module()
+    df = pd.DataFrame(
+        {
+            "DELEGACION": ["Jalisco", "Sonora", "Jalisco", "Yucatán", "Sonora"] * 3,
+            "DEPENDENCIA": [f"UMF {i}" for i in range(15)],
+            "vacantes": [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 8, 9, 7, 9],
+        }
+    )
+    sort = table_shards.parse_sort("-vacantes,DEPENDENCIA")
+    sortable = list(df.columns)
+    index = table_shards.build_table(
+        df, str(tmp_path), sort=sort, sortable=sortable, shard_rows=4
+    )
+    assert index["rows"] == 15
+    assert [o["column"] for o in index["orders"]] == [None] + list(df.columns)
+    assert index["facets"]["DELEGACION"] == ["Jalisco", "Sonora", "Yucatán"]
+
+    default = pd.concat(table_shards.read_shard(str(tmp_path), 0, i) for i in range(4))
+    expected = df.sort_values(["vacantes", "DEPENDENCIA"], ascending=[False, True])
+    assert default.reset_index(drop=True).equals(expected.reset_index(drop=True))
+
+    # Facet presence per shard lets the viewer skip shards.
+    by_deleg = index["orders"][1]["shards"]
+    assert by_deleg[0]["facets"]["DELEGACION"] == [0]
+    assert by_deleg[-1]["facets"]["DELEGACION"] == [2]
+    assert (tmp_path / "index.html").exists()
+
+
+def test_cli(tmp_path):
+    table_shards = _load_module()
+    infile = tmp_path / "tabla.txt"
+    infile.write_text("DELEGACION\tvacantes\nJalisco\t2\nSonora\t\nJalisco\t7\n")
+    outdir = tmp_path / "tabla"
+    args = ["--in", str(infile), "--outdir", str(outdir), "--sort=-vacantes"]
+    assert table_shards.main(args + ["--sortable", "vacantes"]) == 0
+    index = json.loads((outdir / "index.json").read_text())
+    assert index["title"] == "tabla"
+    assert index["types"] == ["string", "number"]
+    rows = table_shards.read_shard(str(outdir), 0, 0)
+    assert list(rows["vacantes"][:2]) == [7, 2]
+    assert rows["vacantes"].isna().iloc[2]
+
+
+def test_only_sort_columns_are_sortable_by_default(tmp_path):
+    table_shards = _load_module()
+    df = pd.DataFrame({"DELEGACION": ["Jalisco", "Sonora"], "vacantes": [1, 2]})
+    sort = table_shards.parse_sort("-vacantes")
+    index = table_shards.build_table(df, str(tmp_path / "a"), sort=sort)
+    assert [o["column"] for o in index["orders"]] == [None, "vacantes"]
+    index = table_shards.build_table(df, str(tmp_path / "b"), sort=sort, sortable=[])
+    assert [o["column"] for o in index["orders"]] == [None]